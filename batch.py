@@ -0,0 +1,135 @@
+"""
+Running many scripts at once.
+
+    python3 pinky.py --batch scripts/ -j 8 > report.json
+
+Starting `python3 pinky.py` once per script spends most of its time starting
+Python and importing the toolchain. Batch mode starts a pool of worker
+processes once instead and hands them scripts, so every worker stays warm for
+all the scripts it gets. Each script runs on the tree-walking Interpreter (see
+program.py), with its own global environment and its output captured apart
+from the others', and the results come back as one JSON report:
+
+    {
+      "jobs": 8, "seconds": 1.9, "scripts_per_sec": 5263.2,
+      "total": 10000, "passed": 9998, "failed": 2,
+      "scripts": [
+        {"script": "scripts/a.pinky", "exit_code": 0, "seconds": 0.0012,
+         "output": "...", "error": null},
+        ...
+      ]
+    }
+
+A script's exit code is what `python3 pinky.py` would have exited with: 1 for
+a syntax error, a runtime error or a resource limit (see governor.py), 0
+otherwise. Scripts are independent, so throughput grows with the number of
+workers up to the number of cores.
+"""
+
+import contextlib
+import io
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from governor import Governor, LimitExceeded
+from output import FLUSH_FULL, Output
+import program
+import utils
+
+SUFFIX = ".pinky"
+
+
+def collect_scripts(target):
+    """
+    The scripts to run: every .pinky file under a directory, the script itself,
+    or the paths listed one per line in a text file
+    """
+    if os.path.isdir(target):
+        return sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(target)
+            for name in names
+            if name.endswith(SUFFIX)
+        )
+    if target.endswith(SUFFIX):
+        return [target]
+    base = os.path.dirname(target)
+    with open(target) as file:
+        return [
+            os.path.join(base, line.strip())
+            for line in file
+            if line.strip() and not line.startswith("#")
+        ]
+
+
+def run_script(filename, optimize=0, limits=None):
+    """
+    Run one script and return its entry of the report. Called in the workers.
+    """
+    captured = io.StringIO()
+    # Output and error messages (which are printed) go to the same place, in
+    # the order the script produced them
+    output = Output(captured, FLUSH_FULL)
+    exit_code = 0
+    error = None
+    utils.last_runtime_error = None
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(captured):
+            with open(filename) as file:
+                compiled = program.compile(file.read(), optimize)
+            governor = Governor(**limits) if limits else None
+            compiled.run(output=output, governor=governor)
+    except SystemExit as e:
+        # Syntax errors exit pinky.py after printing their message
+        exit_code = e.code if isinstance(e.code, int) else 1
+    except LimitExceeded as e:
+        exit_code, error = 1, str(e)
+    except Exception as e:
+        exit_code, error = 1, f"{type(e).__name__}: {e}"
+    finally:
+        output.flush()
+    if utils.last_runtime_error is not None:
+        # Reported by the script, which then often trips over the value the
+        # error left behind: the report keeps the first error it reported
+        exit_code, error = 1, utils.last_runtime_error
+    return {
+        "script": filename,
+        "exit_code": exit_code,
+        "seconds": time.perf_counter() - start,
+        "output": captured.getvalue(),
+        "error": error,
+    }
+
+
+def run_batch(scripts, jobs=None, optimize=0, limits=None):
+    """
+    Run the scripts on a pool of `jobs` workers (one per core by default) and
+    return the report
+    """
+    jobs = jobs or os.cpu_count() or 1
+    # Several scripts per task, so that short scripts are not dominated by
+    # handing them to the workers
+    chunksize = max(1, min(64, len(scripts) // (jobs * 4)))
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        results = list(
+            pool.map(
+                run_script,
+                scripts,
+                [optimize] * len(scripts),
+                [limits] * len(scripts),
+                chunksize=chunksize,
+            )
+        )
+    seconds = time.perf_counter() - start
+    failed = sum(1 for result in results if result["exit_code"] != 0)
+    return {
+        "jobs": jobs,
+        "seconds": seconds,
+        "scripts_per_sec": len(results) / seconds if seconds else 0.0,
+        "total": len(results),
+        "passed": len(results) - failed,
+        "failed": failed,
+        "scripts": results,
+    }
@@ -0,0 +1,1377 @@
+"""
+Benchmarks for the Pinky toolchain.
+
+Usage:
+    python3 bench.py frontend [--max-size 10M] [--lexer regex] [--json out.json]
+    python3 bench.py deep [--max-depth 1M] [--json out.json]
+    python3 bench.py nodes [--size 1M] [--json out.json]
+    python3 bench.py runtime [--scale 1] [--backends tree,closures] [--json out.json]
+    python3 bench.py calls [--fib 25] [--backends tree,resolved] [--json out.json]
+    python3 bench.py gc [--scale 1] [--backends tree,unboxed] [--json out.json]
+    python3 bench.py output [--lines 10M] [--json out.json]
+    python3 bench.py strings [--size 10M] [--chunk 1K] [--json out.json]
+    python3 bench.py for [--iterations 10M] [--json out.json]
+    python3 bench.py governor [--scale 1] [--json out.json]
+    python3 bench.py embed [--runs 10K] [--json out.json]
+    python3 bench.py batch [--scripts 1K] [--jobs 1,2,4] [--json out.json]
+    python3 bench.py async [--scripts 10K] [--json out.json]
+    python3 bench.py daemon [--runs 200] [--json out.json]
+
+The front-end suite generates synthetic programs from 1KB up to 100MB (use
+--max-size to stop earlier), and measures each size in a fresh child process so
+that the reported peak RSS belongs to that measurement alone.
+
+Every suite prints a human readable table and can also dump its results as JSON
+(--json), so numbers can be compared between releases.
+"""
+
+import argparse
+import asyncio
+import codecs
+import contextlib
+import gc
+import io
+import json
+import math
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from closures import ClosureCompiler
+from interpreter import TYPE_STRING, Interpreter
+from lexer import Lexer
+from machine import Machine
+import model
+from model import iter_child_nodes, verify_ast
+from parser import Parser
+from resolver import ResolvedInterpreter
+from unboxed import UnboxedInterpreter
+from memo import MemoizingInterpreter
+from governor import Governor, GovernedInterpreter
+from cache import compile_source
+import program
+from batch import run_batch
+from scheduler import Scheduler, run_async
+import daemon
+from output import FLUSH_ALWAYS, FLUSH_FULL, FLUSH_LINE, Output
+from tokens import TokenType
+from state import Environment
+from utils import stringify
+
+SIZES = ["1K", "10K", "100K", "1M", "10M", "100M"]
+
+
+def parse_size(text):
+    units = {"K": 1024, "M": 1024**2, "G": 1024**3}
+    text = text.strip().upper()
+    if text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(text)
+
+
+def peak_rss_bytes():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def count_nodes(ast):
+    count = 0
+    stack = [ast]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(iter_child_nodes(node))
+    return count
+
+
+def fit_exponent(points):
+    """
+    Least squares slope of log(time) over log(size).
+    ~1.0 means linear scaling, ~2.0 quadratic.
+    """
+    points = [(math.log(x), math.log(y)) for x, y in points if x > 0 and y > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    num = sum((x - mean_x) * (y - mean_y) for x, y in points)
+    den = sum((x - mean_x) ** 2 for x, _ in points)
+    return num / den if den else None
+
+
+def format_exponent(exponent):
+    return "n/a" if exponent is None else f"{exponent:.2f}"
+
+
+def write_report(suite, args, results, extra=None):
+    report = {
+        "suite": suite,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "args": {key: value for key, value in vars(args).items() if key != "func"},
+        "results": results,
+    }
+    if extra:
+        report.update(extra)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"Wrote {args.json}")
+    return report
+
+
+###############################################################################
+# Front-end: synthetic program generators
+###############################################################################
+def repeat_to_size(size, make_unit):
+    """
+    Concatenate numbered units of source until we reach size bytes
+    """
+    parts = []
+    total = 0
+    i = 0
+    while total < size:
+        unit = make_unit(i)
+        parts.append(unit)
+        total += len(unit)
+        i += 1
+    return "".join(parts)
+
+
+def gen_expressions(size):
+    # Long arithmetic/logical expressions with a few levels of parentheses
+    def unit(i):
+        return (
+            f"x{i % 97} := (a + {i} * (b - 3.5) / ((c % 7) ^ 2)) - -d * 2\n"
+            f"ok := (x{i % 97} >= 10 and y <= 20) or ~(z == {i} or w ~= 1)\n"
+        )
+
+    return repeat_to_size(size, unit)
+
+
+def gen_functions(size):
+    def unit(i):
+        return (
+            f"func f{i}(a, b, c)\n"
+            f"  local r := a * b + c\n"
+            f"  if r > {i} then\n"
+            f"    ret r\n"
+            f"  else\n"
+            f"    ret f{max(i - 1, 0)}(a, b, c - 1)\n"
+            f"  end\n"
+            f"end\n"
+        )
+
+    return repeat_to_size(size, unit)
+
+
+def gen_loops(size):
+    def unit(i):
+        return (
+            f"for i := 1, {i} do\n"
+            f"  j := 0\n"
+            f"  while j < i do\n"
+            f"    for k := 10, 1, -1 do\n"
+            f"      total := total + i * j - k\n"
+            f"    end\n"
+            f"    j := j + 1\n"
+            f"  end\n"
+            f"end\n"
+        )
+
+    return repeat_to_size(size, unit)
+
+
+def gen_strings(size):
+    text = "lorem ipsum dolor sit amet " * 40
+
+    def unit(i):
+        return f"println 'line {i}: {text}' + \"{text}\"\n"
+
+    return repeat_to_size(size, unit)
+
+
+WORKLOADS = {
+    "expressions": gen_expressions,
+    "functions": gen_functions,
+    "loops": gen_loops,
+    "strings": gen_strings,
+}
+
+
+def measure_frontend(workload, size, lexer_mode, parser_mode):
+    """
+    Lex and parse one generated program (runs in a fresh child process so that
+    the peak RSS belongs to this measurement only)
+    """
+    source = WORKLOADS[workload](size)
+
+    start = time.perf_counter()
+    if lexer_mode == "compact":
+        tokens = Lexer(source).tokenize_compact()
+    else:
+        tokens = Lexer(source, mode=lexer_mode).tokenize()
+    lex_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ast = Parser(tokens, mode=parser_mode).parse()
+    parse_time = time.perf_counter() - start
+
+    num_tokens = len(tokens)
+    num_nodes = count_nodes(ast)
+    return {
+        "workload": workload,
+        "size": len(source),
+        "lexer": lexer_mode,
+        "parser": parser_mode,
+        "tokens": num_tokens,
+        "nodes": num_nodes,
+        "lex_seconds": lex_time,
+        "parse_seconds": parse_time,
+        "bytes_per_sec": len(source) / (lex_time + parse_time),
+        "tokens_per_sec": num_tokens / lex_time if lex_time else None,
+        "nodes_per_sec": num_nodes / parse_time if parse_time else None,
+        "peak_rss": peak_rss_bytes(),
+    }
+
+
+def run_child(*args):
+    output = subprocess.run(
+        [sys.executable, __file__, "_child", *map(str, args)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def bench_frontend(args):
+    max_size = parse_size(args.max_size)
+    sizes = [size for size in map(parse_size, SIZES) if size <= max_size]
+    workloads = args.workloads.split(",") if args.workloads else list(WORKLOADS)
+    results = []
+    print(
+        f"{'workload':<12} {'size':>10} {'tokens':>10} {'nodes':>10} "
+        f"{'tokens/s':>12} {'nodes/s':>12} {'peak RSS':>10}"
+    )
+    for workload in workloads:
+        for size in sizes:
+            result = run_child("frontend", workload, size, args.lexer, args.parser)
+            results.append(result)
+            print(
+                f"{workload:<12} {result['size']:>10} {result['tokens']:>10} "
+                f"{result['nodes']:>10} {result['tokens_per_sec']:>12.0f} "
+                f"{result['nodes_per_sec']:>12.0f} "
+                f"{result['peak_rss'] // 1024**2:>8}MB"
+            )
+
+    # Scaling curves: how lex/parse time grows with the input size
+    scaling = {}
+    for workload in workloads:
+        rows = [result for result in results if result["workload"] == workload]
+        scaling[workload] = {
+            "lex_exponent": fit_exponent([(r["size"], r["lex_seconds"]) for r in rows]),
+            "parse_exponent": fit_exponent(
+                [(r["size"], r["parse_seconds"]) for r in rows]
+            ),
+            "curve": [
+                {
+                    "size": r["size"],
+                    "lex_seconds": r["lex_seconds"],
+                    "parse_seconds": r["parse_seconds"],
+                }
+                for r in rows
+            ],
+        }
+    print("")
+    print("Scaling exponents (1.0 = linear):")
+    for workload, curve in scaling.items():
+        print(
+            f"  {workload:<12} lex {format_exponent(curve['lex_exponent'])}"
+            f"  parse {format_exponent(curve['parse_exponent'])}"
+        )
+
+    write_report("frontend", args, results, {"scaling": scaling})
+
+
+###############################################################################
+# Deep nesting: explicit-stack parser and Machine
+###############################################################################
+DEPTHS = ["1K", "10K", "100K", "1M"]
+
+DEEP_SHAPES = {
+    # ((((...1...))))
+    "parens": lambda depth: "x := " + "(" * depth + "1" + ")" * depth,
+    # 1 + 1 + ... (a left-leaning BinOp chain)
+    "chain": lambda depth: "x := 1" + " + 1" * depth,
+    # - - - ... 1 (right-recursive unary operators)
+    "unary": lambda depth: "x := " + "- " * depth + "1",
+    # 1 ^ 1 ^ ... (right associative)
+    "power": lambda depth: "x := 1" + " ^ 1" * depth,
+    # if true then if true then ... end end
+    "blocks": lambda depth: "if true then " * depth + "x := 1" + " end" * depth,
+}
+
+
+def bench_deep(args):
+    max_depth = parse_size(args.max_depth)
+    depths = [depth for depth in map(parse_size, DEPTHS) if depth <= max_depth]
+    results = []
+    print(f"{'shape':<8} {'depth':>8} {'parse s':>9} {'eval s':>9} {'ns/level':>9}")
+    for shape, make_source in DEEP_SHAPES.items():
+        for depth in depths:
+            source = make_source(depth)
+            tokens = Lexer(source, mode="regex").tokenize()
+            gc.collect()
+
+            start = time.perf_counter()
+            ast = Parser(tokens, mode="stack").parse()
+            parse_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            Machine().interpret(ast, Environment())
+            eval_time = time.perf_counter() - start
+
+            result = {
+                "shape": shape,
+                "depth": depth,
+                "parse_seconds": parse_time,
+                "eval_seconds": eval_time,
+                "ns_per_level": (parse_time + eval_time) / depth * 1e9,
+            }
+            # Free this tree outside of the next measurement
+            del tokens, ast
+            results.append(result)
+            print(
+                f"{shape:<8} {depth:>8} {parse_time:>9.3f} {eval_time:>9.3f} "
+                f"{result['ns_per_level']:>9.0f}"
+            )
+
+    scaling = {}
+    for shape in DEEP_SHAPES:
+        rows = [result for result in results if result["shape"] == shape]
+        scaling[shape] = fit_exponent(
+            [(r["depth"], r["parse_seconds"] + r["eval_seconds"]) for r in rows]
+        )
+    print("")
+    print("Scaling exponents (1.0 = linear):")
+    for shape, exponent in scaling.items():
+        print(f"  {shape:<8} {format_exponent(exponent)}")
+
+    write_report("deep", args, results, {"scaling": scaling})
+
+
+###############################################################################
+# AST node memory and construction cost
+###############################################################################
+def node_classes():
+    return [
+        cls
+        for cls in vars(model).values()
+        if isinstance(cls, type) and issubclass(cls, model.Node) and cls.__slots__
+    ]
+
+
+def bytes_per_instance(cls, count=10_000):
+    # Every field is None, so only the instances themselves are counted
+    nargs = cls.__init__.__code__.co_argcount - 1
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    instances = [cls(*[None] * nargs) for _ in range(count)]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del instances
+    # Minus the list holding them
+    return (after - before) / count - 8
+
+
+def bench_nodes(args):
+    results = []
+    print(f"{'node':<16} {'__dict__':>9} {'__slots__':>10} {'saved':>7}")
+    for cls in node_classes():
+        # The same class as it was before __slots__: a plain instance dictionary
+        dict_cls = type(cls.__name__, (), {"__init__": cls.__init__})
+        dict_size = bytes_per_instance(dict_cls)
+        slots_size = bytes_per_instance(cls)
+        results.append(
+            {"node": cls.__name__, "dict_bytes": dict_size, "slots_bytes": slots_size}
+        )
+        print(
+            f"{cls.__name__:<16} {dict_size:>9.0f} {slots_size:>10.0f} "
+            f"{1 - slots_size / dict_size:>7.0%}"
+        )
+
+    # Parse throughput, and what the old constructor asserts cost as a separate pass
+    source = gen_functions(parse_size(args.size))
+    tokens = Lexer(source, mode="regex").tokenize_compact()
+    gc.collect()
+    start = time.perf_counter()
+    ast = Parser(tokens).parse()
+    parse_time = time.perf_counter() - start
+    start = time.perf_counter()
+    verify_ast(ast)
+    verify_time = time.perf_counter() - start
+    num_nodes = count_nodes(ast)
+    throughput = {
+        "size": len(source),
+        "nodes": num_nodes,
+        "parse_seconds": parse_time,
+        "verify_seconds": verify_time,
+        "nodes_per_sec": num_nodes / parse_time,
+    }
+    print("")
+    print(
+        f"parse {len(source)} bytes: {num_nodes} nodes in {parse_time:.3f}s "
+        f"({throughput['nodes_per_sec']:.0f} nodes/s), verify_ast {verify_time:.3f}s"
+    )
+
+    write_report("nodes", args, results, {"throughput": throughput})
+
+
+###############################################################################
+# Runtime: loop and call heavy programs
+###############################################################################
+RUNTIME_PROGRAMS = {
+    "while": lambda scale: f"""
+i := 0
+total := 0
+while i < {200_000 * scale} do
+  total := total + i % 7
+  i := i + 1
+end
+println total
+""",
+    "for": lambda scale: f"""
+total := 0
+for i := 1, {200_000 * scale} do
+  local sq := i * i
+  if sq % 3 == 0 then
+    total := total + 1
+  end
+end
+println total
+""",
+    "calls": lambda scale: f"""
+func fib(n)
+  if n < 2 then
+    ret n
+  end
+  ret fib(n - 1) + fib(n - 2)
+end
+for i := 1, {scale} do
+  println fib(20)
+end
+""",
+    # A global read and written 20 scopes deep, each scope with its own local
+    "nested": lambda scale: "total := 0\n"
+    + "if true then local pad := 0\n" * 20
+    + f"for i := 1, {50_000 * scale} do\n  total := total + i\nend\n"
+    + "end\n" * 20
+    + "println total\n",
+}
+
+RUNTIME_BACKENDS = {
+    "tree": lambda ast: Interpreter().interpret_ast(ast),
+    "machine": lambda ast: Machine().interpret_ast(ast),
+    "closures": lambda ast: ClosureCompiler().interpret_ast(ast),
+    "resolved": lambda ast: ResolvedInterpreter().interpret_ast(ast),
+    "unboxed": lambda ast: UnboxedInterpreter().interpret_ast(ast),
+    "memo": lambda ast: MemoizingInterpreter().interpret_ast(ast),
+}
+
+
+def bench_runtime(args):
+    backends = args.backends.split(",")
+    results = []
+    print(f"{'program':<8} {'backend':<10} {'seconds':>9}")
+    for name, make_source in RUNTIME_PROGRAMS.items():
+        ast = Parser(Lexer(make_source(args.scale)).tokenize()).parse()
+        for backend in backends:
+            times = []
+            for _ in range(args.repeat):
+                output = io.StringIO()
+                gc.collect()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(output):
+                    RUNTIME_BACKENDS[backend](ast)
+                times.append(time.perf_counter() - start)
+            results.append(
+                {
+                    "program": name,
+                    "backend": backend,
+                    "seconds": min(times),
+                    "output": output.getvalue(),
+                }
+            )
+            print(f"{name:<8} {backend:<10} {min(times):>9.3f}")
+
+    write_report("runtime", args, results)
+
+
+def bench_calls(args):
+    """
+    Function call throughput: a recursive fib(n) makes 2 * fib(n + 1) - 1 calls,
+    every one of them ending in a ret
+    """
+    n = args.fib
+    a, b = 0, 1
+    for _ in range(n + 1):
+        a, b = b, a + b
+    calls = 2 * a - 1
+    source = f"""
+func fib(n)
+  if n < 2 then
+    ret n
+  end
+  ret fib(n - 1) + fib(n - 2)
+end
+println fib({n})
+"""
+    ast = Parser(Lexer(source).tokenize()).parse()
+    results = []
+    print(f"{'backend':<10} {'calls':>10} {'seconds':>9} {'calls/s':>12}")
+    for backend in args.backends.split(","):
+        times = []
+        for _ in range(args.repeat):
+            gc.collect()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                RUNTIME_BACKENDS[backend](ast)
+            times.append(time.perf_counter() - start)
+        seconds = min(times)
+        results.append(
+            {
+                "backend": backend,
+                "calls": calls,
+                "seconds": seconds,
+                "calls_per_sec": calls / seconds,
+            }
+        )
+        print(f"{backend:<10} {calls:>10} {seconds:>9.3f} {calls / seconds:>12.0f}")
+
+    write_report("calls", args, results)
+
+
+class GCMonitor:
+    """
+    Counts garbage collections per generation and the time spent in them
+    """
+
+    def __init__(self):
+        self.collections = [0, 0, 0]
+        self.seconds = 0.0
+        self.started = None
+
+    def __call__(self, phase, info):
+        if phase == "start":
+            self.started = time.perf_counter()
+        else:
+            self.collections[info["generation"]] += 1
+            self.seconds += time.perf_counter() - self.started
+
+    def __enter__(self):
+        gc.callbacks.append(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        gc.callbacks.remove(self)
+
+
+GC_PROGRAMS = {
+    # Short-lived values only: every intermediate result is freed right away
+    "arithmetic": lambda scale: f"""
+x := 0
+total := 0
+while x < {100_000 * scale} do
+  total := (total + x * 3 - x / 2) % 1000
+  x := x + 1
+end
+println total
+""",
+    # Values held live in the environments of a deep call stack
+    "recursion": lambda scale: f"""
+func sum(n, acc)
+  if n == 0 then
+    ret acc
+  end
+  ret sum(n - 1, acc + n * 0.5)
+end
+for i := 1, {40 * scale} do
+  println sum(1500, 0)
+end
+""",
+}
+
+
+def bench_gc(args):
+    """
+    Collector pressure and allocations, boxed vs unboxed
+    """
+    results = []
+    # Each Pinky call takes a handful of Python frames
+    recursion_limit = sys.getrecursionlimit()
+    sys.setrecursionlimit(max(recursion_limit, 20_000))
+    print(
+        f"{'program':<11} {'backend':<10} {'seconds':>9} {'gen0':>7} {'gen1':>6} "
+        f"{'gen2':>6} {'gc s':>7} {'peak KB':>8}"
+    )
+    for name, make_source in GC_PROGRAMS.items():
+        ast = Parser(Lexer(make_source(args.scale)).tokenize()).parse()
+        for backend in args.backends.split(","):
+            runs = []
+            for _ in range(args.repeat):
+                gc.collect()
+                output = io.StringIO()
+                with GCMonitor() as monitor, contextlib.redirect_stdout(output):
+                    start = time.perf_counter()
+                    RUNTIME_BACKENDS[backend](ast)
+                    seconds = time.perf_counter() - start
+                runs.append((seconds, monitor))
+            seconds, monitor = min(runs, key=lambda run: run[0])
+            # Peak memory is measured on a second run, tracemalloc slows it down
+            tracemalloc.start()
+            with contextlib.redirect_stdout(io.StringIO()):
+                RUNTIME_BACKENDS[backend](ast)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            result = {
+                "program": name,
+                "backend": backend,
+                "seconds": seconds,
+                "collections": monitor.collections,
+                "gc_seconds": monitor.seconds,
+                "peak_bytes": peak,
+                "output": output.getvalue(),
+            }
+            results.append(result)
+            gen0, gen1, gen2 = monitor.collections
+            print(
+                f"{name:<11} {backend:<10} {seconds:>9.3f} {gen0:>7} {gen1:>6} "
+                f"{gen2:>6} {monitor.seconds:>7.3f} {peak // 1024:>8}"
+            )
+
+    sys.setrecursionlimit(recursion_limit)
+    write_report("gc", args, results)
+
+
+class PrintInterpreter(Interpreter):
+    """
+    The print path before output.py: escape sequences decoded and print() called
+    on every print statement
+    """
+
+    def print_value(self, node, value):
+        print(
+            codecs.escape_decode(bytes(stringify(value[1]), "utf-8"))[0].decode("utf-8"),
+            end=node.end,
+        )
+
+
+# Sink name -> interpreter printing to /dev/null (or memory), to time the output
+# path rather than the terminal
+OUTPUT_SINKS = {
+    "print": lambda devnull: PrintInterpreter(),
+    "always": lambda devnull: Interpreter(Output(devnull, FLUSH_ALWAYS)),
+    "line": lambda devnull: Interpreter(Output(devnull, FLUSH_LINE)),
+    "full": lambda devnull: Interpreter(Output(devnull, FLUSH_FULL)),
+    "memory": lambda devnull: Interpreter(Output.in_memory()),
+}
+
+
+def bench_output(args):
+    """
+    A tight println loop through each output sink and flush policy
+    """
+    lines = parse_size(args.lines)
+    source = f"""
+for i := 1, {lines} do
+  println "line\\t" + i
+end
+"""
+    ast = Parser(Lexer(source).tokenize()).parse()
+    results = []
+    print(f"{'sink':<8} {'lines':>10} {'seconds':>9} {'lines/s':>12}")
+    with open(os.devnull, "w") as devnull:
+        for sink in args.sinks.split(","):
+            interpreter = OUTPUT_SINKS[sink](devnull)
+            gc.collect()
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(devnull):
+                interpreter.interpret_ast(ast)
+            seconds = time.perf_counter() - start
+            results.append(
+                {
+                    "sink": sink,
+                    "lines": lines,
+                    "seconds": seconds,
+                    "lines_per_sec": lines / seconds,
+                }
+            )
+            print(f"{sink:<8} {lines:>10} {seconds:>9.3f} {lines / seconds:>12.0f}")
+
+    write_report("output", args, results)
+
+
+class FlatStringInterpreter(Interpreter):
+    """
+    String + before rope.py: every concatenation copies both strings
+    """
+
+    def binop(self, node, left, right):
+        if node.op.token_type == TokenType.PLUS and TYPE_STRING in (left[0], right[0]):
+            return (TYPE_STRING, stringify(left[1]) + stringify(right[1]))
+        return super().binop(node, left, right)
+
+
+STRING_BUILDERS = {
+    "flat": FlatStringInterpreter,
+    "rope": Interpreter,
+}
+
+
+def bench_strings(args):
+    """
+    Build one long string with `s := s + chunk` in a loop, then print it
+    """
+    size = parse_size(args.size)
+    chunk = parse_size(args.chunk)
+    appends = size // chunk
+    source = f"""
+chunk := ""
+for i := 1, {chunk} do
+  chunk := chunk + "x"
+end
+s := ""
+for i := 1, {appends} do
+  s := s + chunk
+end
+println s
+"""
+    ast = Parser(Lexer(source).tokenize()).parse()
+    results = []
+    print(f"{'builder':<8} {'appends':>9} {'MB':>6} {'seconds':>9}")
+    for name in args.builders.split(","):
+        output = Output.in_memory()
+        gc.collect()
+        start = time.perf_counter()
+        STRING_BUILDERS[name](output).interpret_ast(ast)
+        seconds = time.perf_counter() - start
+        length = len(output.getvalue()) - 1
+        results.append(
+            {"builder": name, "appends": appends, "length": length, "seconds": seconds}
+        )
+        print(f"{name:<8} {appends:>9} {length / 1024**2:>6.1f} {seconds:>9.3f}")
+
+    write_report("strings", args, results)
+
+
+class GenericForInterpreter(Interpreter):
+    """
+    ForStmt before the numeric fast path: the loop variable is looked up again
+    through the scope chain on every iteration
+    """
+
+    numeric_for = Interpreter.generic_for
+
+
+FOR_LOOPS = {
+    "generic": GenericForInterpreter,
+    "numeric": Interpreter,
+}
+
+
+def bench_for(args):
+    """
+    An empty numeric for loop, nested a few scopes deep so that finding the
+    loop variable takes a walk up the environment chain
+    """
+    iterations = parse_size(args.iterations)
+    source = f"""
+i := 0
+if true then
+  if true then
+    if true then
+      for i := 1, {iterations} do
+      end
+    end
+  end
+end
+println i
+"""
+    ast = Parser(Lexer(source).tokenize()).parse()
+    results = []
+    print(f"{'loop':<8} {'iterations':>11} {'seconds':>9} {'iter/s':>12}")
+    for name in args.loops.split(","):
+        gc.collect()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            FOR_LOOPS[name]().interpret_ast(ast)
+        seconds = time.perf_counter() - start
+        results.append(
+            {
+                "loop": name,
+                "iterations": iterations,
+                "seconds": seconds,
+                "iterations_per_sec": iterations / seconds,
+            }
+        )
+        print(
+            f"{name:<8} {iterations:>11} {seconds:>9.3f} {iterations / seconds:>12.0f}"
+        )
+
+    write_report("for", args, results)
+
+
+###############################################################################
+# Governor: the cost of enforcing resource limits
+###############################################################################
+def governed_run(ast):
+    # Limits high enough never to be hit, so that every check still runs
+    governor = Governor(fuel=10**12, seconds=3600, memory=2**40)
+    GovernedInterpreter(governor).interpret_ast(ast)
+
+
+def bench_governor(args):
+    """
+    The runtime programs with and without a Governor enforcing fuel, a
+    deadline and a memory ceiling
+    """
+    results = []
+    print(f"{'program':<8} {'plain s':>9} {'governed s':>11} {'overhead':>9}")
+    for name, make_source in RUNTIME_PROGRAMS.items():
+        ast = Parser(Lexer(make_source(args.scale)).tokenize()).parse()
+        seconds = {}
+        for label, run in (("plain", RUNTIME_BACKENDS["tree"]), ("governed", governed_run)):
+            times = []
+            for _ in range(args.repeat):
+                gc.collect()
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    run(ast)
+                times.append(time.perf_counter() - start)
+            seconds[label] = min(times)
+        overhead = seconds["governed"] / seconds["plain"] - 1
+        results.append(
+            {
+                "program": name,
+                "plain_seconds": seconds["plain"],
+                "governed_seconds": seconds["governed"],
+                "overhead": overhead,
+            }
+        )
+        print(
+            f"{name:<8} {seconds['plain']:>9.3f} {seconds['governed']:>11.3f} "
+            f"{overhead:>9.1%}"
+        )
+
+    write_report("governor", args, results)
+
+
+###############################################################################
+# Embedding: running one rule script many times with different inputs
+###############################################################################
+EMBED_RULE = """
+func rate(country)
+  if country == "NL" then
+    ret 0.21
+  end
+  if country == "DE" then
+    ret 0.19
+  end
+  ret 0.2
+end
+discount := 0
+if total > 100 then
+  discount := total * 0.05
+end
+ret (total - discount) * (1 + rate(country))
+"""
+EMBED_INPUTS = [
+    {"total": 40.0, "country": "NL"},
+    {"total": 250.0, "country": "DE"},
+    {"total": 120.0, "country": "FR"},
+]
+
+
+def embed_pipeline(runs):
+    """
+    What pinky.py does for every script: lex, parse and compile, then interpret,
+    with the inputs written into the source as assignments
+    """
+    for index in range(runs):
+        inputs = EMBED_INPUTS[index % len(EMBED_INPUTS)]
+        prelude = f"total := {inputs['total']}\ncountry := '{inputs['country']}'\n"
+        ast, code = compile_source((prelude + EMBED_RULE).encode("utf-8"))
+        Interpreter(Output.in_memory()).interpret_ast(ast)
+
+
+def embed_program(runs):
+    rule = program.compile(EMBED_RULE)
+    output = Output.in_memory()
+    for index in range(runs):
+        rule.run(EMBED_INPUTS[index % len(EMBED_INPUTS)], output)
+
+
+EMBED_MODES = {
+    "pipeline": embed_pipeline,
+    "program": embed_program,
+}
+
+
+def bench_embed(args):
+    """
+    Per-run cost of a small rule script, through the whole pipeline every time
+    vs. compiled once into a Program
+    """
+    runs = parse_size(args.runs)
+    results = []
+    print(f"{'mode':<10} {'runs':>8} {'seconds':>9} {'us/run':>9}")
+    for name in args.modes.split(","):
+        gc.collect()
+        start = time.perf_counter()
+        EMBED_MODES[name](runs)
+        seconds = time.perf_counter() - start
+        results.append(
+            {
+                "mode": name,
+                "runs": runs,
+                "seconds": seconds,
+                "us_per_run": seconds / runs * 1e6,
+            }
+        )
+        print(f"{name:<10} {runs:>8} {seconds:>9.3f} {seconds / runs * 1e6:>9.1f}")
+
+    write_report("embed", args, results)
+
+
+###############################################################################
+# Batch: many short scripts, one process each vs. a pool of warm workers
+###############################################################################
+BATCH_SCRIPT = """
+func fib(n)
+  if n < 2 then
+    ret n
+  end
+  ret fib(n - 1) + fib(n - 2)
+end
+println "script {index}: " + fib({n})
+"""
+
+
+def bench_batch(args):
+    count = parse_size(args.scripts)
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        scripts = []
+        for index in range(count):
+            filename = os.path.join(directory, f"script{index}.pinky")
+            with open(filename, "w") as file:
+                file.write(BATCH_SCRIPT.format(index=index, n=10 + index % 5))
+            scripts.append(filename)
+
+        print(f"{'mode':<12} {'scripts':>8} {'seconds':>9} {'scripts/s':>10}")
+        # `python3 pinky.py script` per script, timed over a sample. Its exit
+        # status is not checked: after interpreting the script pinky.py also
+        # runs the bytecode, and the VM stops at the first function call.
+        sample = scripts[: args.processes]
+        start = time.perf_counter()
+        for filename in sample:
+            subprocess.run(
+                [sys.executable, "pinky.py", "--no-verbose", filename],
+                capture_output=True,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+            )
+        seconds = time.perf_counter() - start
+        rate = len(sample) / seconds
+        results.append(
+            {"mode": "process", "scripts": len(sample), "seconds": seconds, "rate": rate}
+        )
+        print(f"{'process':<12} {len(sample):>8} {seconds:>9.3f} {rate:>10.1f}")
+
+        for jobs in map(int, args.jobs.split(",")):
+            report = run_batch(scripts, jobs)
+            assert report["failed"] == 0
+            mode = f"batch -j {jobs}"
+            results.append(
+                {
+                    "mode": mode,
+                    "scripts": count,
+                    "seconds": report["seconds"],
+                    "rate": report["scripts_per_sec"],
+                }
+            )
+            print(
+                f"{mode:<12} {count:>8} {report['seconds']:>9.3f} "
+                f"{report['scripts_per_sec']:>10.1f}"
+            )
+
+    write_report("batch", args, results, {"cpu_count": os.cpu_count()})
+
+
+###############################################################################
+# Async: many short scripts at once on one event loop
+###############################################################################
+ASYNC_SCRIPT = """
+total := 0
+for i := 1, n do
+  total := total + i * i
+end
+println total
+ret total
+"""
+
+
+async def async_sequential(compiled, inputs):
+    # Program.run straight from the coroutine: blocks the loop for each script
+    return [compiled.run(globals, Output.in_memory()) for globals in inputs]
+
+
+async def async_tasks(compiled, inputs):
+    return await asyncio.gather(
+        *(run_async(compiled, globals, Output.in_memory()) for globals in inputs)
+    )
+
+
+async def async_scheduler(compiled, inputs):
+    scheduler = Scheduler()
+    return await asyncio.gather(
+        *(scheduler.submit(compiled, globals, Output.in_memory()) for globals in inputs)
+    )
+
+
+ASYNC_MODES = {
+    "sequential": async_sequential,
+    "tasks": async_tasks,
+    "scheduler": async_scheduler,
+}
+
+
+async def measure_async(mode, compiled, inputs):
+    """
+    Run the scripts, with a heartbeat coroutine measuring the longest another
+    coroutine had to wait for its turn on the event loop
+    """
+    lag = [0.0]
+    running = True
+
+    async def heartbeat():
+        while running:
+            start = time.perf_counter()
+            await asyncio.sleep(0)
+            lag[0] = max(lag[0], time.perf_counter() - start)
+
+    beat = asyncio.create_task(heartbeat())
+    await asyncio.sleep(0)
+    start = time.perf_counter()
+    results = await ASYNC_MODES[mode](compiled, inputs)
+    seconds = time.perf_counter() - start
+    running = False
+    await beat
+    return results, seconds, lag[0]
+
+
+def bench_async(args):
+    count = parse_size(args.scripts)
+    compiled = program.compile(ASYNC_SCRIPT)
+    inputs = [{"n": 10 + index % 50} for index in range(count)]
+    expected = [sum(i * i for i in range(1, g["n"] + 1)) for g in inputs]
+    results = []
+    print(
+        f"{'mode':<11} {'scripts':>8} {'seconds':>9} {'scripts/s':>10} "
+        f"{'max wait ms':>12}"
+    )
+    for mode in args.modes.split(","):
+        gc.collect()
+        values, seconds, lag = asyncio.run(measure_async(mode, compiled, inputs))
+        assert values == expected
+        results.append(
+            {
+                "mode": mode,
+                "scripts": count,
+                "seconds": seconds,
+                "scripts_per_sec": count / seconds,
+                "max_wait": lag,
+            }
+        )
+        print(
+            f"{mode:<11} {count:>8} {seconds:>9.3f} {count / seconds:>10.0f} "
+            f"{lag * 1000:>12.2f}"
+        )
+
+    write_report("async", args, results)
+
+
+###############################################################################
+# Daemon: latency of a small script, cold vs. on the warm server
+###############################################################################
+DAEMON_SCRIPT = """
+x := 6
+if x > 1 then
+  println "hello " + x * 7
+end
+"""
+
+
+def start_server(socket_path):
+    server = subprocess.Popen(
+        [sys.executable, "daemon.py", "--serve"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        env={**os.environ, daemon.SOCKET_ENV: socket_path},
+    )
+    while not os.path.exists(socket_path):
+        if server.poll() is not None:
+            raise RuntimeError("the Pinky server did not start")
+        time.sleep(0.01)
+    return server
+
+
+def latencies(run, count, pause):
+    times = []
+    for _ in range(count):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+        # Lets the server replace (and warm up) the worker that was used
+        time.sleep(pause)
+    times.sort()
+    return times
+
+
+def bench_daemon(args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        script = os.path.join(directory, "hello.pinky")
+        with open(script, "w") as file:
+            file.write(DAEMON_SCRIPT)
+        socket_path = os.path.join(directory, "pinky.sock")
+        command = [script, "--no-verbose"]
+        devnull = os.open(os.devnull, os.O_RDWR)
+
+        def cold():
+            subprocess.run(
+                [sys.executable, "pinky.py", *command],
+                cwd=here,
+                check=True,
+                stdout=devnull,
+            )
+
+        def client():
+            subprocess.run(
+                [sys.executable, "daemon.py", *command],
+                cwd=here,
+                check=True,
+                stdout=devnull,
+                env={**os.environ, daemon.SOCKET_ENV: socket_path},
+            )
+
+        def request():
+            fds = (devnull, devnull, devnull)
+            assert daemon.request(command, socket_path, fds) == 0
+
+        server = start_server(socket_path)
+        try:
+            modes = [
+                ("cold", cold, args.processes),
+                ("client", client, args.processes),
+                ("request", request, args.runs),
+            ]
+            print(f"{'mode':<8} {'runs':>6} {'median ms':>10} {'p90 ms':>8}")
+            for name, run, count in modes:
+                times = latencies(run, count, args.pause)
+                median, p90 = times[len(times) // 2], times[len(times) * 9 // 10]
+                results.append(
+                    {"mode": name, "runs": count, "median": median, "p90": p90}
+                )
+                print(
+                    f"{name:<8} {count:>6} {median * 1000:>10.2f} "
+                    f"{p90 * 1000:>8.2f}"
+                )
+        finally:
+            server.terminate()
+            server.wait()
+            os.close(devnull)
+
+    write_report("daemon", args, results)
+
+
+CHILD_MEASUREMENTS = {
+    "frontend": lambda workload, size, lexer_mode, parser_mode: measure_frontend(
+        workload, int(size), lexer_mode, parser_mode
+    ),
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pinky benchmarks")
+    subparsers = parser.add_subparsers(dest="suite", required=True)
+
+    frontend = subparsers.add_parser("frontend", help="lexer and parser throughput")
+    frontend.add_argument(
+        "--max-size", default=SIZES[-1], help="largest program size (e.g. 1M)"
+    )
+    frontend.add_argument(
+        "--workloads", help=f"comma separated subset of {','.join(WORKLOADS)}"
+    )
+    frontend.add_argument(
+        "--lexer", default="regex", choices=["scan", "regex", "compact"]
+    )
+    frontend.add_argument("--parser", default="pratt", choices=["pratt", "descent"])
+    frontend.add_argument("--json", help="write machine-readable results to this file")
+    frontend.set_defaults(func=bench_frontend)
+
+    deep = subparsers.add_parser("deep", help="1K to 1M deep nesting, no recursion")
+    deep.add_argument("--max-depth", default=DEPTHS[-1], help="deepest input (e.g. 100K)")
+    deep.add_argument("--json", help="write machine-readable results to this file")
+    deep.set_defaults(func=bench_deep)
+
+    nodes = subparsers.add_parser("nodes", help="AST node size and parse throughput")
+    nodes.add_argument("--size", default="1M", help="program size to parse (e.g. 10M)")
+    nodes.add_argument("--json", help="write machine-readable results to this file")
+    nodes.set_defaults(func=bench_nodes)
+
+    runtime = subparsers.add_parser("runtime", help="loop and call heavy programs")
+    runtime.add_argument("--scale", type=int, default=1, help="work multiplier")
+    runtime.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    runtime.add_argument(
+        "--backends",
+        default=",".join(RUNTIME_BACKENDS),
+        help=f"comma separated subset of {','.join(RUNTIME_BACKENDS)}",
+    )
+    runtime.add_argument("--json", help="write machine-readable results to this file")
+    runtime.set_defaults(func=bench_runtime)
+
+    calls = subparsers.add_parser("calls", help="recursive fib calls per second")
+    calls.add_argument("--fib", type=int, default=25, help="compute fib(N)")
+    calls.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    calls.add_argument(
+        "--backends",
+        default=",".join(RUNTIME_BACKENDS),
+        help=f"comma separated subset of {','.join(RUNTIME_BACKENDS)}",
+    )
+    calls.add_argument("--json", help="write machine-readable results to this file")
+    calls.set_defaults(func=bench_calls)
+
+    gc_suite = subparsers.add_parser("gc", help="collector pressure, boxed vs unboxed")
+    gc_suite.add_argument("--scale", type=int, default=1, help="work multiplier")
+    gc_suite.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    gc_suite.add_argument(
+        "--backends",
+        default="tree,unboxed",
+        help=f"comma separated subset of {','.join(RUNTIME_BACKENDS)}",
+    )
+    gc_suite.add_argument("--json", help="write machine-readable results to this file")
+    gc_suite.set_defaults(func=bench_gc)
+
+    output = subparsers.add_parser("output", help="print/println throughput")
+    output.add_argument("--lines", default="1M", help="lines to print (e.g. 10M)")
+    output.add_argument(
+        "--sinks",
+        default=",".join(OUTPUT_SINKS),
+        help=f"comma separated subset of {','.join(OUTPUT_SINKS)}",
+    )
+    output.add_argument("--json", help="write machine-readable results to this file")
+    output.set_defaults(func=bench_output)
+
+    strings = subparsers.add_parser("strings", help="building a long string")
+    strings.add_argument("--size", default="10M", help="final string length")
+    strings.add_argument("--chunk", default="1K", help="characters per append")
+    strings.add_argument(
+        "--builders",
+        default=",".join(STRING_BUILDERS),
+        help=f"comma separated subset of {','.join(STRING_BUILDERS)}",
+    )
+    strings.add_argument("--json", help="write machine-readable results to this file")
+    strings.set_defaults(func=bench_strings)
+
+    for_suite = subparsers.add_parser("for", help="numeric for loop iterations")
+    for_suite.add_argument("--iterations", default="1M", help="e.g. 10M")
+    for_suite.add_argument(
+        "--loops",
+        default=",".join(FOR_LOOPS),
+        help=f"comma separated subset of {','.join(FOR_LOOPS)}",
+    )
+    for_suite.add_argument("--json", help="write machine-readable results to this file")
+    for_suite.set_defaults(func=bench_for)
+
+    governor = subparsers.add_parser("governor", help="cost of resource limits")
+    governor.add_argument("--scale", type=int, default=1, help="work multiplier")
+    governor.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    governor.add_argument("--json", help="write machine-readable results to this file")
+    governor.set_defaults(func=bench_governor)
+
+    embed = subparsers.add_parser("embed", help="per-run cost of an embedded script")
+    embed.add_argument("--runs", default="10K", help="e.g. 100K")
+    embed.add_argument(
+        "--modes",
+        default=",".join(EMBED_MODES),
+        help=f"comma separated subset of {','.join(EMBED_MODES)}",
+    )
+    embed.add_argument("--json", help="write machine-readable results to this file")
+    embed.set_defaults(func=bench_embed)
+
+    batch = subparsers.add_parser("batch", help="many scripts on a worker pool")
+    batch.add_argument("--scripts", default="1K", help="number of scripts, e.g. 10K")
+    batch.add_argument(
+        "--jobs",
+        default=",".join(str(jobs) for jobs in (1, 2, 4, 8) if jobs <= os.cpu_count()),
+        help="comma separated worker counts to try",
+    )
+    batch.add_argument(
+        "--processes",
+        type=int,
+        default=20,
+        help="scripts to time with one process each",
+    )
+    batch.add_argument("--json", help="write machine-readable results to this file")
+    batch.set_defaults(func=bench_batch)
+
+    async_suite = subparsers.add_parser("async", help="concurrent scripts on asyncio")
+    async_suite.add_argument("--scripts", default="10K", help="e.g. 100K")
+    async_suite.add_argument(
+        "--modes",
+        default=",".join(ASYNC_MODES),
+        help=f"comma separated subset of {','.join(ASYNC_MODES)}",
+    )
+    async_suite.add_argument(
+        "--json", help="write machine-readable results to this file"
+    )
+    async_suite.set_defaults(func=bench_async)
+
+    daemon_suite = subparsers.add_parser("daemon", help="script latency, cold vs warm")
+    daemon_suite.add_argument(
+        "--runs", type=int, default=200, help="requests made from this process"
+    )
+    daemon_suite.add_argument(
+        "--processes",
+        type=int,
+        default=20,
+        help="runs of `python3 pinky.py` and of the client command",
+    )
+    daemon_suite.add_argument(
+        "--pause", type=float, default=0.01, help="seconds between runs"
+    )
+    daemon_suite.add_argument(
+        "--json", help="write machine-readable results to this file"
+    )
+    daemon_suite.set_defaults(func=bench_daemon)
+
+    child = subparsers.add_parser("_child")
+    child.add_argument("measurement", choices=list(CHILD_MEASUREMENTS))
+    child.add_argument("params", nargs="*")
+
+    args = parser.parse_args(argv)
+    if args.suite == "_child":
+        print(json.dumps(CHILD_MEASUREMENTS[args.measurement](*args.params)))
+    else:
+        args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+"""
+An on-disk cache of compiled programs, in the spirit of Python's __pycache__.
+
+The first run of a script lexes, parses and compiles it as usual and then saves
+the AST and the bytecode. Later runs of the same source load both from the cache
+and skip the front-end entirely.
+
+Each entry is one file named after the cache key:
+
+    magic (4 bytes) | format version (2) | compiler version (2) | sha256 (32) | pickle
+
+The key is the sha256 of the source together with the format and compiler
+versions and the optimization level (see optimizer.py), so editing a script,
+upgrading the compiler or changing -O simply misses the cache.
+On load the header is checked again, and a stale or corrupt entry is deleted
+and treated as a miss. Entries are written to a temporary file first and then
+renamed into place, so a concurrent reader never sees a half written file.
+Every hit refreshes the entry's mtime, and after each store the oldest entries
+are evicted until the directory is under its size bound (an LRU on mtime).
+"""
+
+import gc
+import hashlib
+import os
+import pickle
+import struct
+import tempfile
+from compiler import COMPILER_VERSION, Compiler
+from lexer import Lexer
+from optimizer import optimize
+from parser import Parser
+
+MAGIC = b"PNKC"
+FORMAT_VERSION = 1
+HEADER = struct.Struct(">4sHH32s")
+SUFFIX = ".pnkc"
+CACHE_DIR_NAME = "__pinkycache__"
+CACHE_DIR_ENV = "PINKY_CACHE_DIR"
+DEFAULT_MAX_BYTES = 64 * 1024**2
+
+
+def default_cache_dir(filename):
+    """
+    $PINKY_CACHE_DIR if it is set, otherwise __pinkycache__ next to the script
+    """
+    directory = os.environ.get(CACHE_DIR_ENV)
+    if directory:
+        return directory
+    return os.path.join(os.path.dirname(os.path.abspath(filename)), CACHE_DIR_NAME)
+
+
+class ProgramCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES, optimize_level=0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # Programs stored here were optimized at this level
+        self.optimize_level = optimize_level
+        self.hits = 0
+        self.misses = 0
+
+    def digest(self, source):
+        hasher = hashlib.sha256(source)
+        hasher.update(
+            struct.pack(">HHH", FORMAT_VERSION, COMPILER_VERSION, self.optimize_level)
+        )
+        return hasher.digest()
+
+    def path(self, digest):
+        return os.path.join(self.directory, digest.hex() + SUFFIX)
+
+    def load(self, source):
+        """
+        Return (ast, code) for the source bytes, or None on a miss
+        """
+        digest = self.digest(source)
+        path = self.path(digest)
+        try:
+            with open(path, "rb") as file:
+                header = file.read(HEADER.size)
+                if header != HEADER.pack(
+                    MAGIC, FORMAT_VERSION, COMPILER_VERSION, digest
+                ):
+                    raise ValueError("stale cache entry")
+                # Loading creates one object per node; with the collector off
+                # that stays linear instead of triggering repeated full scans
+                gc_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    ast, code = pickle.load(file)
+                finally:
+                    if gc_enabled:
+                        gc.enable()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception:
+            # Truncated, corrupt or written by another version: drop it
+            self.misses += 1
+            self.remove(path)
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return ast, code
+
+    def store(self, source, ast, code):
+        """
+        Save an entry atomically. Returns False if the program could not be
+        cached (e.g. an AST too deep for pickle), which is never an error.
+        """
+        digest = self.digest(source)
+        try:
+            payload = pickle.dumps((ast, code), protocol=pickle.HIGHEST_PROTOCOL)
+        except RecursionError:
+            return False
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, COMPILER_VERSION, digest)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as file:
+                    file.write(header)
+                    file.write(payload)
+                os.replace(temp_path, self.path(digest))
+            except BaseException:
+                self.remove(temp_path)
+                raise
+        except OSError:
+            # A read-only directory only means we cannot cache
+            return False
+        self.evict()
+        return True
+
+    def entries(self):
+        """
+        (mtime, size, path) of every entry, oldest first
+        """
+        entries = []
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        for name in names:
+            if not name.endswith(SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        entries.sort()
+        return entries
+
+    def evict(self):
+        """
+        Remove the least recently used entries until the cache fits in max_bytes
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    def clear(self):
+        for _, _, path in self.entries():
+            self.remove(path)
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def compile_source(source, optimize_level=0):
+    """
+    Run the front-end, the optimizer and the code generator over the source bytes
+    """
+    ast = Parser(Lexer(source.decode("utf-8"), mode="regex").iter_tokens()).parse()
+    ast = optimize(ast, optimize_level)
+    code = Compiler().compile_code(ast)
+    return ast, code
+
+
+def load_program(filename, cache=None, optimize_level=0):
+    """
+    Return (ast, code) for a script, from the cache when possible. A given cache
+    brings its own optimization level.
+    """
+    with open(filename, "rb") as file:
+        source = file.read()
+    if cache is None:
+        cache = ProgramCache(default_cache_dir(filename), optimize_level=optimize_level)
+    program = cache.load(source)
+    if program is None:
+        program = compile_source(source, cache.optimize_level)
+        cache.store(source, *program)
+    return program
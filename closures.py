@@ -0,0 +1,443 @@
+import operator
+from interpreter import *
+
+###############################################################################
+# Operators, grouped by the operand types they accept
+###############################################################################
+ARITHMETIC = {
+    TokenType.MINUS: operator.sub,
+    TokenType.STAR: operator.mul,
+    TokenType.MOD: operator.mod,
+    TokenType.CARET: operator.pow,
+}
+COMPARISON = {
+    TokenType.GT: operator.gt,
+    TokenType.GE: operator.ge,
+    TokenType.LT: operator.lt,
+    TokenType.LE: operator.le,
+}
+EQUALITY = {
+    TokenType.EQEQ: operator.eq,
+    TokenType.NE: operator.ne,
+}
+
+
+class ClosureCompiler(Interpreter):
+    """
+    Turns the AST into a tree of Python closures once, then runs the closures.
+    Each closure takes an environment and returns a runtime value, like
+    Interpreter.interpret does, but node dispatch, operator selection and literal
+    conversion have already happened at compile time. Errors are reported with
+    the same messages (and at the same points) as Interpreter.
+    """
+
+    def __init__(self, output=None):
+        super().__init__(output)
+        # Node class -> bound compile_<NodeClass> method
+        self.compilers = {}
+        # FuncDecl node -> compiled body, filled when the declaration is compiled
+        self.bodies = {}
+
+    def interpret(self, node, env):
+        return self.compile(node)(env)
+
+    def compile(self, node):
+        try:
+            compiler = self.compilers[node.__class__]
+        except KeyError:
+            compiler = self.compiler_for(node.__class__)
+        return compiler(node)
+
+    def compiler_for(self, node_class):
+        for cls in node_class.__mro__:
+            compiler = getattr(self, "compile_" + cls.__name__, None)
+            if compiler is not None:
+                break
+        else:
+            compiler = self.compile_unknown
+        self.compilers[node_class] = compiler
+        return compiler
+
+    def compile_unknown(self, node):
+        def run(env):
+            pass
+
+        return run
+
+    ###########################################################################
+    # Expressions
+    ###########################################################################
+    def compile_constant(self, value):
+        def constant(env):
+            return value
+
+        return constant
+
+    def compile_Integer(self, node):
+        return self.compile_constant((TYPE_NUMBER, float(node.value)))
+
+    def compile_Float(self, node):
+        return self.compile_constant((TYPE_NUMBER, float(node.value)))
+
+    def compile_String(self, node):
+        return self.compile_constant((TYPE_STRING, str(node.value)))
+
+    def compile_Bool(self, node):
+        return self.compile_constant((TYPE_BOOL, node.value))
+
+    def compile_Grouping(self, node):
+        return self.compile(node.value)
+
+    def compile_Identifier(self, node):
+        name = node.name
+        line = node.line
+
+        def identifier(env):
+            value = env.get_var(name)
+            if value is None:
+                runtime_error(f"Undeclared identifier {name!r}", line)
+            if value[1] is None:
+                runtime_error(f"Uninitialized identifier {name!r}", line)
+            return value
+
+        return identifier
+
+    def compile_BinOp(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        token_type = node.op.token_type
+        lexeme = node.op.lexeme
+        op_line = node.op.line
+
+        def unsupported(lefttype, righttype):
+            runtime_error(
+                f"Unsupported operator {lexeme!r} between {lefttype} and {righttype}.",
+                op_line,
+            )
+
+        if token_type == TokenType.PLUS:
+
+            def add(env):
+                lefttype, leftval = left(env)
+                righttype, rightval = right(env)
+                if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+                    return (TYPE_NUMBER, leftval + rightval)
+                elif lefttype == TYPE_STRING or righttype == TYPE_STRING:
+                    return (TYPE_STRING, concat(leftval, rightval))
+                unsupported(lefttype, righttype)
+
+            return add
+
+        if token_type == TokenType.SLASH:
+            line = node.line
+
+            def divide(env):
+                lefttype, leftval = left(env)
+                righttype, rightval = right(env)
+                if rightval == 0:
+                    runtime_error(f"Division by zero.", line)
+                if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+                    return (TYPE_NUMBER, leftval / rightval)
+                unsupported(lefttype, righttype)
+
+            return divide
+
+        if token_type in ARITHMETIC:
+            function = ARITHMETIC[token_type]
+
+            def arithmetic(env):
+                lefttype, leftval = left(env)
+                righttype, rightval = right(env)
+                if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+                    return (TYPE_NUMBER, function(leftval, rightval))
+                unsupported(lefttype, righttype)
+
+            return arithmetic
+
+        if token_type in COMPARISON:
+            function = COMPARISON[token_type]
+
+            def comparison(env):
+                lefttype, leftval = left(env)
+                righttype, rightval = right(env)
+                if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (
+                    lefttype == TYPE_STRING and righttype == TYPE_STRING
+                ):
+                    return (TYPE_BOOL, function(leftval, rightval))
+                unsupported(lefttype, righttype)
+
+            return comparison
+
+        if token_type in EQUALITY:
+            function = EQUALITY[token_type]
+
+            def equality(env):
+                lefttype, leftval = left(env)
+                righttype, rightval = right(env)
+                if lefttype == righttype and lefttype in (
+                    TYPE_NUMBER,
+                    TYPE_STRING,
+                    TYPE_BOOL,
+                ):
+                    return (TYPE_BOOL, function(leftval, rightval))
+                unsupported(lefttype, righttype)
+
+            return equality
+
+        # Like Interpreter.binop, an unknown operator evaluates to nothing
+        def unknown(env):
+            left(env)
+            right(env)
+
+        return unknown
+
+    def compile_UnOp(self, node):
+        operand = self.compile(node.operand)
+        token_type = node.op.token_type
+        lexeme = node.op.lexeme
+        op_line = node.op.line
+
+        def unsupported(operandtype):
+            runtime_error(
+                f"Unsupported operator {lexeme!r} with {operandtype}.", op_line
+            )
+
+        if token_type == TokenType.MINUS:
+
+            def negate(env):
+                operandtype, operandval = operand(env)
+                if operandtype == TYPE_NUMBER:
+                    return (TYPE_NUMBER, -operandval)
+                unsupported(operandtype)
+
+            return negate
+
+        if token_type == TokenType.PLUS:
+
+            def plus(env):
+                operandtype, operandval = operand(env)
+                if operandtype == TYPE_NUMBER:
+                    return (TYPE_NUMBER, operandval)
+                unsupported(operandtype)
+
+            return plus
+
+        if token_type == TokenType.NOT:
+
+            def negation(env):
+                operandtype, operandval = operand(env)
+                if operandtype == TYPE_BOOL:
+                    return (TYPE_BOOL, not operandval)
+                unsupported(operandtype)
+
+            return negation
+
+        def unknown(env):
+            operand(env)
+
+        return unknown
+
+    def compile_LogicalOp(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+
+        if node.op.token_type == TokenType.OR:
+
+            def logical_or(env):
+                value = left(env)
+                if value[1]:
+                    return value
+                return right(env)
+
+            return logical_or
+
+        if node.op.token_type == TokenType.AND:
+
+            def logical_and(env):
+                value = left(env)
+                if not value[1]:
+                    return value
+                return right(env)
+
+            return logical_and
+
+        def logical(env):
+            left(env)
+            return right(env)
+
+        return logical
+
+    def compile_FuncCall(self, node):
+        args = [self.compile(arg) for arg in node.args]
+        bodies = self.bodies
+        lookup_function = self.lookup_function
+        new_call_env = self.new_call_env
+
+        def call(env):
+            func_decl, func_env = lookup_function(node, env)
+            values = [arg(env) for arg in args]
+            new_func_env = new_call_env(func_decl, func_env, values)
+            signal = bodies[func_decl](new_func_env)
+            if signal is not None:
+                return signal.value
+
+        return call
+
+    ###########################################################################
+    # Statements
+    ###########################################################################
+    def compile_Stmts(self, node):
+        stmts = [self.compile(stmt) for stmt in node.stmts]
+
+        def block(env):
+            for stmt in stmts:
+                signal = stmt(env)
+                if signal is not None:
+                    return signal
+
+        return block
+
+    def compile_PrintStmt(self, node):
+        value = self.compile(node.value)
+        print_value = self.print_value
+
+        def print_stmt(env):
+            print_value(node, value(env))
+
+        return print_stmt
+
+    def compile_IfStmt(self, node):
+        test = self.compile(node.test)
+        then_stmts = self.compile(node.then_stmts)
+        else_stmts = None
+        if node.else_stmts is not None:
+            else_stmts = self.compile(node.else_stmts)
+        line = node.line
+
+        def if_stmt(env):
+            testtype, testval = test(env)
+            if testtype != TYPE_BOOL:
+                runtime_error("Condition test is not a boolean expression.", line)
+            if testval:
+                return then_stmts(env.new_env())
+            elif else_stmts is not None:
+                return else_stmts(env.new_env())
+
+        return if_stmt
+
+    def compile_WhileStmt(self, node):
+        test = self.compile(node.test)
+        body = self.compile(node.body_stmts)
+        line = node.line
+
+        def while_stmt(env):
+            new_env = env.new_env()
+            while True:
+                testtype, testval = test(env)
+                if testtype != TYPE_BOOL:
+                    runtime_error(f"While test is not a boolean expression.", line)
+                if not testval:
+                    break
+                signal = body(new_env)
+                if signal is not None:
+                    return signal
+
+        return while_stmt
+
+    def compile_ForStmt(self, node):
+        varname = node.ident.name
+        start = self.compile(node.start)
+        end = self.compile(node.end)
+        step = None if node.step is None else self.compile(node.step)
+        body = self.compile(node.body_stmts)
+
+        def for_stmt(env):
+            itype, i = start(env)
+            endtype, endval = end(env)
+            block_new_env = env.new_env()
+            ascending = i < endval
+            if step is None:
+                steptype, stepval = TYPE_NUMBER, 1 if ascending else -1
+            else:
+                steptype, stepval = step(env)
+            if not (i <= endval if ascending else i >= endval):
+                return
+            env.set_var(varname, (TYPE_NUMBER, i))
+            if itype == TYPE_NUMBER and endtype == TYPE_NUMBER and steptype == TYPE_NUMBER:
+                # Same as Interpreter.numeric_for: store straight into the scope
+                # the first store picked
+                variables = env.scope_vars(varname)
+                if ascending:
+                    while True:
+                        signal = body(block_new_env)
+                        if signal is not None:
+                            return signal
+                        i = i + stepval
+                        if not i <= endval:
+                            break
+                        variables[varname] = (TYPE_NUMBER, i)
+                else:
+                    while True:
+                        signal = body(block_new_env)
+                        if signal is not None:
+                            return signal
+                        i = i + stepval
+                        if not i >= endval:
+                            break
+                        variables[varname] = (TYPE_NUMBER, i)
+                return
+            while True:
+                signal = body(block_new_env)
+                if signal is not None:
+                    return signal
+                i = i + stepval
+                if not (i <= endval if ascending else i >= endval):
+                    break
+                env.set_var(varname, (TYPE_NUMBER, i))
+
+        return for_stmt
+
+    def compile_Assignment(self, node):
+        name = node.left.name
+        right = self.compile(node.right)
+
+        def assignment(env):
+            righttype, rightval = right(env)
+            env.set_var(name, (righttype, rightval))
+
+        return assignment
+
+    def compile_LocalAssignment(self, node):
+        name = node.left.name
+        right = self.compile(node.right)
+
+        def local_assignment(env):
+            right_type, right_val = right(env)
+            env.set_local_var(name, (right_type, right_val))
+
+        return local_assignment
+
+    def compile_FuncDecl(self, node):
+        self.bodies[node] = self.compile(node.body_stmts)
+        name = node.name
+
+        def func_decl(env):
+            env.set_func(name, (node, env))
+
+        return func_decl
+
+    def compile_RetStmt(self, node):
+        value = self.compile(node.value)
+
+        def ret(env):
+            return Signal(SIGNAL_RETURN, value(env))
+
+        return ret
+
+    def compile_FuncCallStmt(self, node):
+        expr = self.compile(node.expr)
+
+        def call_stmt(env):
+            expr(env)
+
+        return call_stmt
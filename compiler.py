@@ -3,12 +3,21 @@ from model import *
 from tokens import *
 from utils import *
 
+# Bump whenever the AST or the bytecode changes shape, so that programs cached
+# by an older compiler are recompiled (see cache.py)
+COMPILER_VERSION = 3
+
 
 class Compiler:
-    def __init__(self):
+    def __init__(self, unboxed=False):
         self.code = []
+        # Push plain floats/strings/bools instead of (TYPE_*, value) tuples, for
+        # UnboxedVM
+        self.unboxed = unboxed
 
     def emit(self, instruction):
+        if self.unboxed and instruction[0] == "PUSH":
+            instruction = ("PUSH", instruction[1][1])
         self.code.append(instruction)
 
     def compile(self, node):
@@ -90,14 +99,21 @@ class Compiler:
         return self.code
 
     def print_code(self):
-        for instruction in self.code:
-            if instruction[0] == "LABEL":
-                print(instruction[1] + ":")
-                continue
-            if instruction[0] == "PUSH":
-                print(f"    {instruction[0]} {stringify(instruction[1][1])}")
-                continue
-            if len(instruction) == 1:
-                print(f"    {instruction[0]}")
-            elif len(instruction) == 2:
-                print(f"    {instruction[0]} {instruction[1]}")
+        print_code(self.code)
+
+
+def print_code(code):
+    for instruction in code:
+        if instruction[0] == "LABEL":
+            print(instruction[1] + ":")
+            continue
+        if instruction[0] == "PUSH":
+            value = instruction[1]
+            if isinstance(value, tuple):
+                value = value[1]
+            print(f"    {instruction[0]} {stringify(value)}")
+            continue
+        if len(instruction) == 1:
+            print(f"    {instruction[0]}")
+        elif len(instruction) == 2:
+            print(f"    {instruction[0]} {instruction[1]}")
@@ -0,0 +1,317 @@
+"""
+A warm server for running scripts without starting Python each time.
+
+    python3 daemon.py --serve &                # once
+    python3 daemon.py script.pinky --no-verbose   # instead of python3 pinky.py ...
+
+Most of a short `python3 pinky.py` run goes into starting CPython and importing
+the toolchain. The server does that once: it imports pinky.py and everything
+behind it, runs a small script through it, and then forks a few workers that
+wait on a Unix socket. A worker starts with all of that already in memory
+(shared copy-on-write with the server), takes one request, runs pinky.py's
+main() with the client's command line in the client's directory, and exits;
+the server forks a new one in its place. Forking ahead of time keeps even the
+fork out of a request's way (and a worker warms up once more after forking,
+see spawn()), while every script still gets a fresh process.
+
+The client sends its stdin, stdout and stderr along with the request (as file
+descriptors, over the socket), so the worker reads and writes the client's own
+terminal, pipes or files directly. The server only sends back the exit code.
+This module imports nothing but the standard library until it is asked to
+serve, so the client stays as cheap to start as Python allows;
+request() can also be called from a long-running Python process, which skips
+even that.
+
+The socket is $PINKY_SOCKET, or pinky.sock in a pinky-<uid> directory of
+$XDG_RUNTIME_DIR or /tmp, which the server creates readable by its user only.
+Whoever listens on the socket gets the client's terminal, so both sides check
+who is on the other end (SO_PEERCRED, Linux) and only talk to their own user.
+"""
+
+import json
+import os
+import signal
+import socket
+import stat
+import struct
+import sys
+
+SOCKET_ENV = "PINKY_SOCKET"
+MAX_REQUEST = 64 * 1024  # bytes
+DEFAULT_WORKERS = 4  # forked ahead of time, waiting for requests
+
+
+def default_socket_path():
+    path = os.environ.get(SOCKET_ENV)
+    if path:
+        return path
+    directory = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(directory, f"pinky-{os.getuid()}", "pinky.sock")
+
+
+def peer_uid(sock):
+    """
+    The user id of the process on the other end of a connected Unix socket
+    """
+    size = struct.calcsize("3i")  # pid, uid, gid
+    creds = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, size)
+    _, uid, _ = struct.unpack("3i", creds)
+    return uid
+
+
+def private_directory(directory):
+    """
+    Create the directory for the default socket, or check that the one already
+    there is ours and closed to other users
+    """
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    info = os.lstat(directory)
+    if (
+        not stat.S_ISDIR(info.st_mode)
+        or info.st_uid != os.getuid()
+        or info.st_mode & 0o077
+    ):
+        raise PermissionError(f"{directory} is not a private directory of this user.")
+
+
+def remove_stale_socket(path):
+    """
+    Remove the socket a previous server left behind, but nothing else
+    """
+    try:
+        info = os.lstat(path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(info.st_mode) or info.st_uid != os.getuid():
+        raise FileExistsError(f"{path} exists and is not a socket of this user.")
+    os.unlink(path)
+
+
+###############################################################################
+# Server
+###############################################################################
+# A script exercising the common paths of pinky.py, run before serving
+WARMUP_SOURCE = """
+x := 3
+if x > 1 then
+  println "warm " + x
+end
+"""
+
+
+def preload(directory):
+    """
+    Import the toolchain and run a script through it once, so that workers
+    start with everything loaded
+    """
+    global pinky, warmup_script
+    import gc
+    import pinky
+
+    warmup_script = os.path.join(directory, "warmup.pinky")
+    with open(warmup_script, "w") as file:
+        file.write(WARMUP_SOURCE)
+    warm_up()
+    # Keep the loaded objects out of the collector's way, so that collections
+    # in the workers do not touch (and copy) the pages shared with the server
+    gc.freeze()
+
+
+def warm_up():
+    import contextlib
+
+    with open(os.devnull, "w") as devnull:
+        with contextlib.redirect_stdout(devnull):
+            pinky.main([warmup_script, "--no-verbose"])
+
+
+def serve(path=None, workers=DEFAULT_WORKERS):
+    import shutil
+    import tempfile
+
+    if path is None:
+        path = default_socket_path()
+        private_directory(os.path.dirname(path))
+    remove_stale_socket(path)
+    directory = tempfile.mkdtemp(prefix="pinky-daemon-")
+    preload(directory)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Made ready under another name, so the socket only appears at `path` once
+    # it is closed to other users and accepting connections
+    unready = f"{path}.{os.getpid()}"
+    server.bind(unready)
+    os.chmod(unready, 0o600)
+    server.listen(128)
+    os.rename(unready, path)
+    # `kill` stops the server like Ctrl-C does (background jobs ignore SIGINT)
+    signal.signal(signal.SIGTERM, stop)
+    pids = set()
+    try:
+        for _ in range(workers):
+            spawn(server, pids)
+        while True:
+            # Replace every worker that finished its request
+            pid, _ = os.wait()
+            pids.discard(pid)
+            spawn(server, pids)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        server.close()
+        os.unlink(path)
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def stop(signum, frame):
+    raise KeyboardInterrupt
+
+
+def spawn(server, pids):
+    """
+    Fork a worker that waits for the next request, serves it and exits
+    """
+    sys.stdout.flush()
+    sys.stderr.flush()
+    # Hold SIGTERM until the worker is in `pids`: raised inside fork() it would
+    # land in one of the at-fork hooks, which ignore exceptions
+    signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGTERM})
+    pid = os.fork()
+    if pid != 0:
+        pids.add(pid)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+        return
+    try:
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.pthread_sigmask(signal.SIG_UNBLOCK, {signal.SIGTERM})
+        # The first run in a new process is several times slower than the
+        # next ones (it copies the shared pages it writes to), so pay for that
+        # here, before there is a client waiting
+        warm_up()
+        while True:
+            conn, _ = server.accept()
+            if peer_uid(conn) == os.getuid():
+                break
+            conn.close()  # another user's request, not ours to run
+        message, fds, _, _ = socket.recv_fds(conn, MAX_REQUEST, 3)
+        server.close()
+    except BaseException:
+        os._exit(1)
+    work(conn, message, fds)  # never returns
+
+
+def work(conn, message, fds):
+    """
+    Run one request in a freshly forked worker, then exit
+    """
+    code = 1
+    try:
+        for target, fd in enumerate(fds):
+            os.dup2(fd, target)
+            os.close(fd)
+        # The inherited sys.stdout and friends need not write to fds 0-2 (a
+        # test runner may have swapped them for its own), so start afresh
+        sys.stdin = open(0, "r", closefd=False)
+        sys.stdout = open(1, "w", closefd=False)
+        sys.stderr = open(2, "w", closefd=False)
+        request = json.loads(message)
+        os.chdir(request["cwd"])
+        code = run_main(request["argv"])
+    finally:
+        try:
+            conn.sendall(f"{code}\n".encode())
+        finally:
+            os._exit(0)
+
+
+def run_main(argv):
+    """
+    pinky.py's main() with this command line, and the exit code it ended with
+    """
+    from output import flush_all
+
+    code = 0
+    sys.argv = ["pinky.py", *argv]  # for argparse's usage and error messages
+    try:
+        pinky.main(argv)
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException:
+        import traceback
+
+        traceback.print_exc()
+        code = 1
+    finally:
+        # os._exit() skips the atexit handlers that would flush these
+        flush_all()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    return code
+
+
+###############################################################################
+# Client
+###############################################################################
+def request(argv, path=None, fds=(0, 1, 2), cwd=None):
+    """
+    Run `pinky.py argv...` on the server, with the given stdin, stdout and
+    stderr, and return its exit code
+    """
+    message = json.dumps({"argv": list(argv), "cwd": cwd or os.getcwd()}).encode()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        path = path or default_socket_path()
+        sock.connect(path)
+        if peer_uid(sock) != os.getuid():
+            raise PermissionError(f"{path} is served by another user.")
+        socket.send_fds(sock, [message], list(fds))
+        # The exit code and a newline, sent before the worker exits
+        reply = b""
+        while not reply.endswith(b"\n"):
+            data = sock.recv(64)
+            if not data:
+                # The worker died before it could reply
+                return 1
+            reply += data
+    return int(reply)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ["--serve"]:
+        try:
+            serve(os.environ.get(SOCKET_ENV))
+        except OSError as e:
+            print(e, file=sys.stderr)
+            sys.exit(1)
+        return
+    sys.stdout.flush()
+    try:
+        code = request(argv)
+    except (FileNotFoundError, ConnectionRefusedError):
+        print(
+            f"No Pinky server on {default_socket_path()}, start one with "
+            "`python3 daemon.py --serve`",
+            file=sys.stderr,
+        )
+        code = 1
+    except PermissionError as e:
+        print(e, file=sys.stderr)
+        code = 1
+    sys.exit(code)
+
+
+if __name__ == "__main__":
+    main()
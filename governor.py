@@ -0,0 +1,175 @@
+"""
+Resource limits for untrusted scripts.
+
+A Governor enforces up to three limits on a run:
+
+- fuel: a number of steps. For the interpreter a step is one run of a block
+  (a loop iteration, a function body, an if branch); for the VM it is one
+  instruction. `while true do end` therefore burns fuel like any other loop.
+- a wall-clock deadline, in seconds from the start of the run.
+- a memory ceiling: how far the process may grow beyond its size at the start
+  of the run. It is approximate (it reads the resident set size from /proc and
+  is not enforced where there is none), but catches runaway string growth and
+  deep recursion long before the machine runs out.
+
+Going over a limit raises a LimitExceeded subclass, which callers can catch;
+the program's output up to that point is flushed as usual.
+
+Checking the clock and the memory on every step would cost more than the steps
+themselves, so the steps only count down, and the real checks run every
+`check_every` steps (and whenever a concatenation makes a string longer than
+LARGE_STRING characters, since a few doublings can allocate gigabytes in
+fewer steps than that). Only GovernedInterpreter and GovernedVM count steps,
+so ungoverned runs pay nothing.
+"""
+
+import os
+import time
+from interpreter import *
+from vm import VM
+
+DEFAULT_CHECK_EVERY = 1024  # steps between clock and memory checks
+LARGE_STRING = 1024**2  # characters
+
+
+class LimitExceeded(Exception):
+    """
+    A script went over one of its Governor limits
+    """
+
+
+class FuelExhausted(LimitExceeded):
+    pass
+
+
+class DeadlineExceeded(LimitExceeded):
+    pass
+
+
+class MemoryLimitExceeded(LimitExceeded):
+    pass
+
+
+def resident_bytes():
+    """
+    The current resident set size of the process, or None if unknown
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class Governor:
+    def __init__(
+        self, fuel=None, seconds=None, memory=None, check_every=DEFAULT_CHECK_EVERY
+    ):
+        self.fuel = fuel  # steps
+        self.seconds = seconds  # wall-clock
+        self.memory = memory  # bytes of growth
+        self.check_every = check_every
+        self.start()
+
+    def start(self):
+        """
+        Refill the fuel and restart the clock and the memory baseline for a run
+        """
+        self.steps = 0  # steps taken before the current period
+        self.deadline = None
+        if self.seconds is not None:
+            self.deadline = time.monotonic() + self.seconds
+        self.baseline = None
+        if self.memory is not None:
+            self.baseline = resident_bytes()
+        # Steps allowed until the next checkpoint, and how many are left of them
+        self.period = self.next_period()
+        self.countdown = self.period
+
+    def next_period(self):
+        if self.fuel is None:
+            return self.check_every
+        return max(0, min(self.check_every, self.fuel - self.steps))
+
+    def checkpoint(self):
+        """
+        Called by the step that took the countdown below zero: check every
+        limit, then start the next period with that step
+        """
+        self.steps += self.period
+        self.period = self.countdown = 0  # so used_steps() is right if we raise
+        if self.fuel is not None and self.steps >= self.fuel:
+            raise FuelExhausted(f"Ran out of fuel after {self.steps} steps.")
+        self.check()
+        self.period = self.next_period()
+        self.countdown = self.period - 1
+
+    def check(self):
+        """
+        Check the deadline and the memory ceiling
+        """
+        if self.deadline is not None and time.monotonic() > self.deadline:
+            raise DeadlineExceeded(f"Exceeded the time limit of {self.seconds}s.")
+        if self.baseline is not None:
+            resident = resident_bytes()
+            if resident is not None and resident - self.baseline > self.memory:
+                raise MemoryLimitExceeded(
+                    f"Exceeded the memory limit of {self.memory} bytes."
+                )
+
+    def used_steps(self):
+        return self.steps + self.period - self.countdown
+
+
+class GovernedInterpreter(Interpreter):
+    def __init__(self, governor, output=None):
+        super().__init__(output)
+        self.governor = governor
+
+    def interpret_ast(self, node, env=None):
+        self.governor.start()
+        return super().interpret_ast(node, env)
+
+    def interpret_Stmts(self, node, env):
+        # Same as Interpreter.interpret_Stmts, each run of a block costing a step
+        governor = self.governor
+        governor.countdown -= 1
+        if governor.countdown < 0:
+            governor.checkpoint()
+        interpret = self.interpret
+        for stmt in node.stmts:
+            signal = interpret(stmt, env)
+            if signal is not None:
+                return signal
+
+    def concat(self, left, right):
+        value = super().concat(left, right)
+        if len(value) > LARGE_STRING:
+            self.governor.check()
+        return value
+
+
+class GovernedVM(VM):
+    """
+    VM where each instruction costs a step of the governor's fuel
+    """
+
+    def __init__(self, governor, output=None):
+        super().__init__(output)
+        self.governor = governor
+
+    def run(self, instructions):
+        governor = self.governor
+        governor.start()
+        self.pc = 0
+        self.is_running = True
+        try:
+            while self.is_running:
+                governor.countdown -= 1
+                if governor.countdown < 0:
+                    governor.checkpoint()
+                opcode, *args = instructions[self.pc]
+                self.pc = self.pc + 1
+                getattr(self, opcode)(*args)
+        finally:
+            self.output.flush()
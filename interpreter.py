@@ -2,7 +2,8 @@ from utils import *
 from model import *
 from tokens import *
 from state import *
-import codecs
+from output import Output
+from rope import concat
 
 ###############################################################################
 # Constants for different runtime value types
@@ -13,333 +14,510 @@ TYPE_BOOL = "TYPE_BOOL"  # true | false
 
 
 class Interpreter:
-    def interpret(self, node, env):
-        if isinstance(node, Integer):
-            return (TYPE_NUMBER, float(node.value))
-
-        elif isinstance(node, Float):
-            return (TYPE_NUMBER, float(node.value))
-
-        elif isinstance(node, String):
-            return (TYPE_STRING, str(node.value))
-
-        elif isinstance(node, Bool):
-            return (TYPE_BOOL, node.value)
-
-        elif isinstance(node, Grouping):
-            return self.interpret(node.value, env)
-
-        elif isinstance(node, Identifier):
-            value = env.get_var(node.name)
-            if value is None:
-                runtime_error(f"Undeclared identifier {node.name!r}", node.line)
-            if value[1] is None:
-                runtime_error(f"Uninitialized identifier {node.name!r}", node.line)
-            return value
-
-        elif isinstance(node, Assignment):
-            # Evaluate the right-hand side expression
-            righttype, rightval = self.interpret(node.right, env)
-            # Update the value of the left-hand side variable or create a new one
-            env.set_var(node.left.name, (righttype, rightval))
-
-        elif isinstance(node, BinOp):
-            lefttype, leftval = self.interpret(node.left, env)
-            righttype, rightval = self.interpret(node.right, env)
-            if node.op.token_type == TokenType.PLUS:
-                if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-                    return (TYPE_NUMBER, leftval + rightval)
-                elif lefttype == TYPE_STRING or righttype == TYPE_STRING:
-                    return (TYPE_STRING, stringify(leftval) + stringify(rightval))
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.MINUS:
-                if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-                    return (TYPE_NUMBER, leftval - rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.STAR:
-                if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-                    return (TYPE_NUMBER, leftval * rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.SLASH:
-                if rightval == 0:
-                    runtime_error(f"Division by zero.", node.line)
-                if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-                    return (TYPE_NUMBER, leftval / rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.MOD:
-                if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-                    return (TYPE_NUMBER, leftval % rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.CARET:
-                if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
-                    return (TYPE_NUMBER, leftval**rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.GT:
-                if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (
-                    lefttype == TYPE_STRING and righttype == TYPE_STRING
-                ):
-                    return (TYPE_BOOL, leftval > rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.GE:
-                if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (
-                    lefttype == TYPE_STRING and righttype == TYPE_STRING
-                ):
-                    return (TYPE_BOOL, leftval >= rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.LT:
-                if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (
-                    lefttype == TYPE_STRING and righttype == TYPE_STRING
-                ):
-                    return (TYPE_BOOL, leftval < rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.LE:
-                if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (
-                    lefttype == TYPE_STRING and righttype == TYPE_STRING
-                ):
-                    return (TYPE_BOOL, leftval <= rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.EQEQ:
-                if (
-                    (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER)
-                    or (lefttype == TYPE_STRING and righttype == TYPE_STRING)
-                    or (lefttype == TYPE_BOOL and righttype == TYPE_BOOL)
-                ):
-                    return (TYPE_BOOL, leftval == rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.NE:
-                if (
-                    (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER)
-                    or (lefttype == TYPE_STRING and righttype == TYPE_STRING)
-                    or (lefttype == TYPE_BOOL and righttype == TYPE_BOOL)
-                ):
-                    return (TYPE_BOOL, leftval != rightval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
-                        node.op.line,
-                    )
-
-        elif isinstance(node, UnOp):
-            operandtype, operandval = self.interpret(node.operand, env)
-            if node.op.token_type == TokenType.MINUS:
-                if operandtype == TYPE_NUMBER:
-                    return (TYPE_NUMBER, -operandval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} with {operandtype}.",
-                        node.op.line,
-                    )
-
-            if node.op.token_type == TokenType.PLUS:
-                if operandtype == TYPE_NUMBER:
-                    return (TYPE_NUMBER, operandval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} with {operandtype}.",
-                        node.op.line,
-                    )
-
-            elif node.op.token_type == TokenType.NOT:
-                if operandtype == TYPE_BOOL:
-                    return (TYPE_BOOL, not operandval)
-                else:
-                    runtime_error(
-                        f"Unsupported operator {node.op.lexeme!r} with {operandtype}.",
-                        node.op.line,
-                    )
-
-        elif isinstance(node, LogicalOp):
-            lefttype, leftval = self.interpret(node.left, env)
-            if node.op.token_type == TokenType.OR:
-                if leftval:
-                    return (lefttype, leftval)
-            elif node.op.token_type == TokenType.AND:
-                if not leftval:
-                    return (lefttype, leftval)
-            return self.interpret(node.right, env)
-
-        elif isinstance(node, Stmts):
-            # Evaluate statements in sequence, one after the other.
-            for stmt in node.stmts:
-                self.interpret(stmt, env)
-
-        elif isinstance(node, PrintStmt):
-            exprtype, exprval = self.interpret(node.value, env)
-            val = stringify(exprval)
-            print(
-                codecs.escape_decode(bytes(val, "utf-8"))[0].decode("utf-8"),
-                end=node.end,
-            )
+    def __init__(self, output=None):
+        # Node class -> bound handler method, filled in the first time we see a class
+        self.handlers = {}
+        # Where print/println write to (buffered stdout by default, see output.py)
+        self.output = Output() if output is None else output
+        # FuncCall node -> its inline cache for the current run (see
+        # lookup_function), kept here rather than on the shared AST
+        self.call_caches = {}
+        # How often FuncCall inline caches answered the lookup
+        self.call_cache_hits = 0
+        self.call_cache_misses = 0
 
-        elif isinstance(node, IfStmt):
+    def interpret(self, node, env):
+        try:
+            handler = self.handlers[node.__class__]
+        except KeyError:
+            handler = self.handler_for(node.__class__)
+        return handler(node, env)
+
+    def handler_for(self, node_class):
+        """
+        Find the interpret_<NodeClass> method for a class (or for its closest base
+        class, so subclasses can override a single node type) and cache it
+        """
+        for cls in node_class.__mro__:
+            handler = getattr(self, "interpret_" + cls.__name__, None)
+            if handler is not None:
+                break
+        else:
+            handler = self.interpret_unknown
+        self.handlers[node_class] = handler
+        return handler
+
+    def interpret_unknown(self, node, env):
+        pass
+
+    def interpret_Integer(self, node, env):
+        return (TYPE_NUMBER, float(node.value))
+
+    def interpret_Float(self, node, env):
+        return (TYPE_NUMBER, float(node.value))
+
+    def interpret_String(self, node, env):
+        return (TYPE_STRING, str(node.value))
+
+    def interpret_Bool(self, node, env):
+        return (TYPE_BOOL, node.value)
+
+    def interpret_Grouping(self, node, env):
+        return self.interpret(node.value, env)
+
+    def interpret_Identifier(self, node, env):
+        value = env.get_var(node.name)
+        if value is None:
+            runtime_error(f"Undeclared identifier {node.name!r}", node.line)
+        if value[1] is None:
+            runtime_error(f"Uninitialized identifier {node.name!r}", node.line)
+        return value
+
+    def interpret_Assignment(self, node, env):
+        # Evaluate the right-hand side expression
+        righttype, rightval = self.interpret(node.right, env)
+        # Update the value of the left-hand side variable or create a new one
+        env.set_var(node.left.name, (righttype, rightval))
+
+    def interpret_BinOp(self, node, env):
+        left = self.interpret(node.left, env)
+        right = self.interpret(node.right, env)
+        return self.binop(node, left, right)
+
+    def interpret_UnOp(self, node, env):
+        operand = self.interpret(node.operand, env)
+        return self.unop(node, operand)
+
+    def interpret_LogicalOp(self, node, env):
+        lefttype, leftval = self.interpret(node.left, env)
+        if node.op.token_type == TokenType.OR:
+            if leftval:
+                return (lefttype, leftval)
+        elif node.op.token_type == TokenType.AND:
+            if not leftval:
+                return (lefttype, leftval)
+        return self.interpret(node.right, env)
+
+    def interpret_Stmts(self, node, env):
+        # Evaluate statements in sequence, one after the other, stopping early if
+        # one of them hands back a Signal (e.g. a ret statement)
+        interpret = self.interpret
+        for stmt in node.stmts:
+            signal = interpret(stmt, env)
+            if signal is not None:
+                return signal
+
+    def interpret_PrintStmt(self, node, env):
+        self.print_value(node, self.interpret(node.value, env))
+
+    def interpret_IfStmt(self, node, env):
+        testtype, testval = self.interpret(node.test, env)
+        if testtype != TYPE_BOOL:
+            runtime_error("Condition test is not a boolean expression.", node.line)
+        if testval:
+            return self.interpret(
+                node.then_stmts, env.new_env()
+            )  # We must create a new child scope for the then-block
+        else:
+            return self.interpret(
+                node.else_stmts, env.new_env()
+            )  # We must create a new child scope for the else-block
+
+    def interpret_WhileStmt(self, node, env):
+        new_env = env.new_env()
+        while True:
             testtype, testval = self.interpret(node.test, env)
             if testtype != TYPE_BOOL:
-                runtime_error("Condition test is not a boolean expression.", node.line)
-            if testval:
-                self.interpret(
-                    node.then_stmts, env.new_env()
-                )  # We must create a new child scope for the then-block
-            else:
-                self.interpret(
-                    node.else_stmts, env.new_env()
-                )  # We must create a new child scope for the else-block
-
-        elif isinstance(node, WhileStmt):
-            new_env = env.new_env()
+                runtime_error(f"While test is not a boolean expression.", node.line)
+            if not testval:
+                break
+            signal = self.interpret(
+                node.body_stmts, new_env
+            )  # pass the new child environment for the scope of the while block
+            if signal is not None:
+                return signal
+
+    def interpret_ForStmt(self, node, env):
+        itype, i = self.interpret(node.start, env)
+        endtype, end = self.interpret(node.end, env)
+        block_new_env = env.new_env()
+        ascending = i < end
+        if node.step is None:
+            steptype, step = TYPE_NUMBER, 1 if ascending else -1
+        else:
+            steptype, step = self.interpret(node.step, env)
+        if itype == TYPE_NUMBER and endtype == TYPE_NUMBER and steptype == TYPE_NUMBER:
+            loop = self.numeric_for
+        else:
+            loop = self.generic_for
+        return loop(node, env, block_new_env, i, end, step, ascending)
+
+    def generic_for(self, node, env, block_new_env, i, end, step, ascending):
+        varname = node.ident.name
+        if ascending:
+            while i <= end:
+                newval = (TYPE_NUMBER, i)
+                env.set_var(varname, newval)
+                signal = self.interpret(
+                    node.body_stmts, block_new_env
+                )  # pass the new child environment for the scope of the while block
+                if signal is not None:
+                    return signal
+                i = i + step
+        else:
+            while i >= end:
+                newval = (TYPE_NUMBER, i)
+                env.set_var(varname, newval)
+                signal = self.interpret(
+                    node.body_stmts, block_new_env
+                )  # pass the new child environment for the scope of the while block
+                if signal is not None:
+                    return signal
+                i = i + step
+
+    def numeric_for(self, node, env, block_new_env, i, end, step, ascending):
+        """
+        The loop for number bounds and step. The first store of the loop variable
+        decides which scope it lives in, after that each iteration writes the new
+        value straight into that scope's dict instead of searching for it again.
+        """
+        if not (i <= end if ascending else i >= end):
+            return
+        varname = node.ident.name
+        env.set_var(varname, (TYPE_NUMBER, i))
+        variables = env.scope_vars(varname)
+        interpret = self.interpret
+        body_stmts = node.body_stmts
+        if ascending:
             while True:
-                testtype, testval = self.interpret(node.test, env)
-                if testtype != TYPE_BOOL:
-                    runtime_error(f"While test is not a boolean expression.", node.line)
-                if not testval:
+                signal = interpret(body_stmts, block_new_env)
+                if signal is not None:
+                    return signal
+                i = i + step
+                if not i <= end:
                     break
-                self.interpret(
-                    node.body_stmts, new_env
-                )  # pass the new child environment for the scope of the while block
+                variables[varname] = (TYPE_NUMBER, i)
+        else:
+            while True:
+                signal = interpret(body_stmts, block_new_env)
+                if signal is not None:
+                    return signal
+                i = i + step
+                if not i >= end:
+                    break
+                variables[varname] = (TYPE_NUMBER, i)
+
+    def interpret_FuncDecl(self, node, env):
+        env.set_func(
+            node.name, (node, env)
+        )  # we also store the environment in which the function was declared
+
+    def interpret_FuncCall(self, node, env):
+        func_decl, func_env = self.lookup_function(node, env)
+
+        # We need to evaluate all the args
+        args = []
+        for arg in node.args:
+            args.append(self.interpret(arg, env))
+
+        new_func_env = self.new_call_env(func_decl, func_env, args)
+
+        # Finally, we ask to interpret the body_stmts of the function declaration
+        signal = self.interpret(func_decl.body_stmts, new_func_env)
+        if signal is not None:
+            return signal.value
+
+    def interpret_RetStmt(self, node, env):
+        return Signal(SIGNAL_RETURN, self.interpret(node.value, env))
+
+    def interpret_FuncCallStmt(self, node, env):
+        self.interpret(node.expr, env)
+
+    def interpret_LocalAssignment(self, node, env):
+        right_type, right_val = self.interpret(node.right, env)
+        env.set_local_var(node.left.name, (right_type, right_val))
+
+    def lookup_function(self, node, env):
+        """
+        Find the (declaration, closure env) pair a FuncCall node refers to.
+
+        The answer, with the arity already checked, is kept in
+        self.call_caches[node] as (epoch, environment the lookup starts from,
+        answer). It holds for as long as no function is declared anywhere in
+        the run (which bumps the epoch) and the calling environment's nearest
+        environment with functions is the same one, so a hot call site skips
+        the walk up the scopes and the checks.
+        """
+        epoch = env.root.epoch
+        cache = self.call_caches.get(node)
+        if cache is not None:
+            if (
+                cache[0] == epoch
+                and env.stamp == epoch
+                and env.func_owner is cache[1]
+            ):
+                self.call_cache_hits += 1
+                return cache[2]
+        self.call_cache_misses += 1
+
+        # We must make sure the function was declared
+        if env.stamp == epoch:
+            owner = env.func_owner
+        else:
+            owner = env.find_func_owner()
+        func = None if owner is None else owner.get_func(node.name)
+        if not func:
+            runtime_error(f"Function {node.name!r} not declared.", node.line)
+
+        # Fetch the function declaration
+        func_decl = func[
+            0
+        ]  # --> get the function declaration node that was saved in the environment
+        func_env = func[
+            1
+        ]  # --> get the environment in which the function was originally declared
+
+        # Does the number of args match the expected number of params
+        if len(node.args) != len(func_decl.params):
+            runtime_error(
+                f"Function {func_decl.name!r} expected {len(func_decl.params)} params but {len(node.args)} args were passed.",
+                node.line,
+            )
+        else:
+            self.call_caches[node] = (epoch, owner, (func_decl, func_env))
+        return func_decl, func_env
+
+    def call_cache_stats(self):
+        """
+        Hits and misses of the FuncCall inline caches, and the hit rate
+        """
+        calls = self.call_cache_hits + self.call_cache_misses
+        return {
+            "hits": self.call_cache_hits,
+            "misses": self.call_cache_misses,
+            "hit_rate": self.call_cache_hits / calls if calls else 0.0,
+        }
+
+    def new_call_env(self, func_decl, func_env, args):
+        """
+        Create the environment a function body runs in, with params bound to args
+        """
+        # Create a new nested block environment for the function
+        new_func_env = func_env.new_env()
+
+        # We must create local variables in the new child environment of the function for the parameters and bind the argument values to them!
+        for param, argval in zip(func_decl.params, args):
+            new_func_env.set_local_var(param.name, argval)
+        return new_func_env
+
+    def print_value(self, node, value):
+        exprtype, exprval = value
+        self.output.write(stringify(exprval) + node.end)
+
+    def concat(self, left, right):
+        """
+        String concatenation, separate so subclasses can watch strings grow
+        """
+        return concat(left, right)
+
+    def binop(self, node, left, right):
+        """
+        Apply a BinOp operator to its already evaluated operands
+        """
+        lefttype, leftval = left
+        righttype, rightval = right
+        if node.op.token_type == TokenType.PLUS:
+            if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+                return (TYPE_NUMBER, leftval + rightval)
+            elif lefttype == TYPE_STRING or righttype == TYPE_STRING:
+                return (TYPE_STRING, self.concat(leftval, rightval))
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
 
-        elif isinstance(node, ForStmt):
-            varname = node.ident.name
-            itype, i = self.interpret(node.start, env)
-            endtype, end = self.interpret(node.end, env)
-            block_new_env = env.new_env()
-            if i < end:
-                if node.step is None:
-                    step = 1
-                else:
-                    steptype, step = self.interpret(node.step, env)
-                while i <= end:
-                    newval = (TYPE_NUMBER, i)
-                    env.set_var(varname, newval)
-                    self.interpret(
-                        node.body_stmts, block_new_env
-                    )  # pass the new child environment for the scope of the while block
-                    i = i + step
+        elif node.op.token_type == TokenType.MINUS:
+            if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+                return (TYPE_NUMBER, leftval - rightval)
             else:
-                if node.step is None:
-                    step = -1
-                else:
-                    steptype, step = self.interpret(node.step, env)
-                while i >= end:
-                    newval = (TYPE_NUMBER, i)
-                    env.set_var(varname, newval)
-                    self.interpret(
-                        node.body_stmts, block_new_env
-                    )  # pass the new child environment for the scope of the while block
-                    i = i + step
-
-        elif isinstance(node, FuncDecl):
-            env.set_func(
-                node.name, (node, env)
-            )  # we also store the environment in which the function was declared
-
-        elif isinstance(node, FuncCall):
-            # We must make sure the function was declared
-            func = env.get_func(node.name)
-            if not func:
-                runtime_error(f"Function {node.name!r} not declared.", node.line)
-
-            # Fetch the function declaration
-            func_decl = func[
-                0
-            ]  # --> get the function declaration node that was saved in the environment
-            func_env = func[
-                1
-            ]  # --> get the environment in which the function was originally declared
-
-            # Does the number of args match the expected number of params
-            if len(node.args) != len(func_decl.params):
                 runtime_error(
-                    f"Function {func_decl.name!r} expected {len(func_decl.params)} params but {len(node.args)} args were passed.",
-                    node.line,
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
                 )
 
-            # We need to evaluate all the args
-            args = []
-            for arg in node.args:
-                args.append(self.interpret(arg, env))
+        elif node.op.token_type == TokenType.STAR:
+            if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+                return (TYPE_NUMBER, leftval * rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
 
-            # Create a new nested block environment for the function
-            new_func_env = func_env.new_env()
+        elif node.op.token_type == TokenType.SLASH:
+            if rightval == 0:
+                runtime_error(f"Division by zero.", node.line)
+            if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+                return (TYPE_NUMBER, leftval / rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
 
-            # We must create local variables in the new child environment of the function for the parameters and bind the argument values to them!
-            for param, argval in zip(func_decl.params, args):
-                new_func_env.set_local_var(param.name, argval)
+        elif node.op.token_type == TokenType.MOD:
+            if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+                return (TYPE_NUMBER, leftval % rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
 
-            # Finally, we ask to interpret the body_stmts of the function declaration
-            try:
-                self.interpret(func_decl.body_stmts, new_func_env)
-            except Return as e:
-                return e.args[0]
+        elif node.op.token_type == TokenType.CARET:
+            if lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER:
+                return (TYPE_NUMBER, leftval**rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
 
-        elif isinstance(node, RetStmt):
-            raise Return(self.interpret(node.value, env))
+        elif node.op.token_type == TokenType.GT:
+            if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (
+                lefttype == TYPE_STRING and righttype == TYPE_STRING
+            ):
+                return (TYPE_BOOL, leftval > rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
 
-        elif isinstance(node, FuncCallStmt):
-            self.interpret(node.expr, env)
+        elif node.op.token_type == TokenType.GE:
+            if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (
+                lefttype == TYPE_STRING and righttype == TYPE_STRING
+            ):
+                return (TYPE_BOOL, leftval >= rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
 
-        elif isinstance(node, LocalAssignment):
-            right_type, right_val = self.interpret(node.right, env)
-            env.set_local_var(node.left.name, (right_type, right_val))
+        elif node.op.token_type == TokenType.LT:
+            if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (
+                lefttype == TYPE_STRING and righttype == TYPE_STRING
+            ):
+                return (TYPE_BOOL, leftval < rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
+
+        elif node.op.token_type == TokenType.LE:
+            if (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER) or (
+                lefttype == TYPE_STRING and righttype == TYPE_STRING
+            ):
+                return (TYPE_BOOL, leftval <= rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
+
+        elif node.op.token_type == TokenType.EQEQ:
+            if (
+                (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER)
+                or (lefttype == TYPE_STRING and righttype == TYPE_STRING)
+                or (lefttype == TYPE_BOOL and righttype == TYPE_BOOL)
+            ):
+                return (TYPE_BOOL, leftval == rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
+
+        elif node.op.token_type == TokenType.NE:
+            if (
+                (lefttype == TYPE_NUMBER and righttype == TYPE_NUMBER)
+                or (lefttype == TYPE_STRING and righttype == TYPE_STRING)
+                or (lefttype == TYPE_BOOL and righttype == TYPE_BOOL)
+            ):
+                return (TYPE_BOOL, leftval != rightval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} between {lefttype} and {righttype}.",
+                    node.op.line,
+                )
+
+    def unop(self, node, operand):
+        """
+        Apply a UnOp operator to its already evaluated operand
+        """
+        operandtype, operandval = operand
+        if node.op.token_type == TokenType.MINUS:
+            if operandtype == TYPE_NUMBER:
+                return (TYPE_NUMBER, -operandval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} with {operandtype}.",
+                    node.op.line,
+                )
+
+        if node.op.token_type == TokenType.PLUS:
+            if operandtype == TYPE_NUMBER:
+                return (TYPE_NUMBER, operandval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} with {operandtype}.",
+                    node.op.line,
+                )
+
+        elif node.op.token_type == TokenType.NOT:
+            if operandtype == TYPE_BOOL:
+                return (TYPE_BOOL, not operandval)
+            else:
+                runtime_error(
+                    f"Unsupported operator {node.op.lexeme!r} with {operandtype}.",
+                    node.op.line,
+                )
 
-    def interpret_ast(self, node):
+    def interpret_ast(self, node, env=None):
         # Entry point of our interpreter creating a brand new global/parent environment
-        env = Environment()
-        self.interpret(node, env)
+        # (unless the caller brings one), returning the value of a top-level ret
+        if env is None:
+            env = Environment()
+        try:
+            signal = self.interpret(node, env)
+        finally:
+            self.output.flush()
+            # The caches refer to this run's environments
+            self.call_caches.clear()
+        if signal is not None:
+            return signal.value
+
+
+###############################################################################
+# Non-local control flow
+###############################################################################
+SIGNAL_RETURN = "SIGNAL_RETURN"  # ret <value>: unwinds to the enclosing call
+
+
+class Signal:
+    """
+    Statements evaluate to None, except for statements like ret that end the
+    blocks around them early: those evaluate to a Signal, which every block and
+    loop hands straight back to its caller until the construct it is meant for
+    (the FuncCall, for a ret) consumes it. This is much cheaper than raising an
+    exception through the Python stack on every return.
+    """
 
+    __slots__ = ("kind", "value")
 
-class Return(Exception):
-    pass
+    def __init__(self, kind, value=None):
+        self.kind = kind
+        self.value = value
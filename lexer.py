@@ -1,16 +1,77 @@
+import codecs
+import re
 from typing import List
-from tokens import Token, TokenType, keywords
+from tokens import Token, TokenBuffer, TokenType, keywords
 from utils import lexing_error
 
+###############################################################################
+# Master pattern for the regex tokenizer
+###############################################################################
+# The alternatives are tried in order, so longer operators must come before
+# their one-char prefixes, and the "--" comment before the minus operator.
+# A "--" comment swallows its newline without bumping the line counter, which
+# is exactly what the character scanner does too. Blanks are folded into the
+# front of every match so they never cost a trip through the Python loop
+# (EOF lets trailing blanks match without backtracking into MISMATCH).
+# Digits and identifier characters are ASCII only, in both engines (see
+# is_digit and is_identifier_char).
+TOKEN_PATTERNS = [
+    ("NEWLINE", r"\n"),
+    ("COMMENT", r"\#[^\n]*|--[^\n]*\n?"),
+    ("FLOAT", r"\d+\.\d+"),
+    ("INTEGER", r"\d+"),
+    ("STRING", r'"[^"]*"|\'[^\']*\''),
+    ("IDENTIFIER", r"[^\W\d]\w*"),
+    ("OPERATOR", r":=|==|~=|<=|>=|[-+*/^%(){}\[\].,;?~<>=:]"),
+    ("UNTERMINATED", r"[\"']"),
+    ("EOF", r"\Z"),
+    ("MISMATCH", r"."),
+]
+
+MASTER_PATTERN = re.compile(
+    r"[ \t\r]*(?:"
+    + "|".join(f"(?P<{name}>{pattern})" for name, pattern in TOKEN_PATTERNS)
+    + ")",
+    re.ASCII,
+)
+
+# Number of characters (or bytes) read at a time when streaming from a file
+CHUNK_SIZE = 1 << 16
+
+# Operator token types use their lexeme as the enum value
+OPERATORS = {
+    token_type.value: token_type
+    for token_type in TokenType
+    if not token_type.value.isalpha()
+}
+
+
+def is_digit(ch):
+    return "0" <= ch <= "9"
+
+
+def is_identifier_char(ch):
+    return ch.isascii() and (ch.isalnum() or ch == "_")
+
 
 class Lexer:
-    def __init__(self, source):
+    def __init__(self, source, mode="scan"):
+        """
+        mode selects the tokenizer engine:
+          "scan"  - the original character-by-character scanner
+          "regex" - a single compiled master pattern, producing the same tokens
+
+        source is normally a string, but it can also be a file object or mmap,
+        in which case it is read incrementally by iter_tokens() (regex engine).
+        """
+        if mode not in ("scan", "regex"):
+            raise ValueError(f"Unknown lexer mode {mode!r}")
         self.source = source
+        self.mode = mode
         self.start = 0
         self.curr = 0
         self.line = 1
         self.tokens: List[Token] = []
-        pass
 
     def advance(self):
         if self.is_index_out_of_bounds():
@@ -47,11 +108,11 @@ class Lexer:
         )
 
     def handle_number(self):
-        while self.peek().isdigit():
+        while is_digit(self.peek()):
             self.advance()
-        if self.peek() == "." and self.lookahead().isdigit():
+        if self.peek() == "." and is_digit(self.lookahead()):
             self.advance()
-            while self.peek().isdigit():
+            while is_digit(self.peek()):
                 self.advance()
             self.add_token(TokenType.FLOAT)
         else:
@@ -68,7 +129,7 @@ class Lexer:
         self.add_token(TokenType.STRING)
 
     def handle_identifier(self):
-        while self.peek().isalnum() or self.peek() == "_":
+        while is_identifier_char(self.peek()):
             self.advance()
         ## check if identifier matches a key in the keywords dict
         text = self.source[self.start : self.curr]
@@ -78,7 +139,98 @@ class Lexer:
         else:
             self.add_token(keyword_type)
 
+    def token_spans(self, text, final=True):
+        """
+        Generate (token type, start, end, line) for each token in text, using
+        MASTER_PATTERN. Each match is a full token (plus any leading blanks), so
+        the per-character work happens inside the regex engine instead of in
+        Python method calls. Both token representations are built from these:
+        Token objects (scan_text) and TokenBuffer entries (tokenize_compact).
+
+        When final is False more text may follow, so we stop before a token that
+        could still continue in the next chunk. Either way self.curr is left at
+        the offset to resume from.
+        """
+        line = self.line
+        limit = len(text) - 1
+        for match in MASTER_PATTERN.finditer(text):
+            kind = match.lastgroup
+            if not final and (match.end() >= limit or kind == "UNTERMINATED"):
+                self.line = line
+                self.curr = match.start()
+                return
+            start, end = match.span(kind)
+            if kind == "IDENTIFIER":
+                token_type = keywords.get(text[start:end], TokenType.IDENTIFIER)
+                yield token_type, start, end, line
+            elif kind == "OPERATOR":
+                yield OPERATORS[text[start:end]], start, end, line
+            elif kind == "NEWLINE":
+                line = line + 1
+            elif kind == "COMMENT" or kind == "EOF":
+                pass
+            elif kind == "UNTERMINATED":
+                lexing_error(f"Out of bounds index exception", line)
+            elif kind == "MISMATCH":
+                lexing_error(f"Unexpected character {text[start:end]}", line)
+            else:
+                yield TokenType[kind], start, end, line
+        self.line = line
+        self.curr = len(text)
+
+    def scan_text(self, text, final=True):
+        """
+        Generate the Tokens in text (see token_spans), and return the offset to
+        resume from
+        """
+        for token_type, start, end, line in self.token_spans(text, final):
+            yield Token(token_type, text[start:end], line)
+        return self.curr
+
+    def iter_tokens(self):
+        """
+        Generate tokens one at a time instead of building the full token list.
+        A file object (text or binary) or mmap source is read in chunks, so only
+        the unscanned tail of the current chunk is held in memory.
+        """
+        if isinstance(self.source, str):
+            yield from self.scan_text(self.source)
+            return
+
+        decoder = codecs.getincrementaldecoder("utf-8")()
+        pending = ""
+        while True:
+            # Read at least as much as we are carrying over (e.g. a very long
+            # string literal), so rescanning the tail stays linear overall
+            chunk = self.source.read(max(CHUNK_SIZE, len(pending)))
+            final = not chunk
+            if isinstance(chunk, bytes):
+                chunk = decoder.decode(chunk, final)
+            text = pending + chunk
+            resume = yield from self.scan_text(text, final)
+            if final:
+                return
+            pending = text[resume:]
+
+    def tokenize_compact(self):
+        """
+        Tokenize the whole (string) source into a TokenBuffer.
+        No Token objects or lexeme strings are created here, only array entries.
+        """
+        tokens = TokenBuffer(self.source)
+        append = tokens.append
+        for token_type, start, end, line in self.token_spans(self.source):
+            append(token_type, start, end, line)
+        return tokens
+
+    def tokenize_regex(self):
+        self.tokens.extend(self.iter_tokens())
+        return self.tokens
+
     def tokenize(self):
+        if self.mode == "regex" or not isinstance(self.source, str):
+            return self.tokenize_regex()
+
         while self.curr < len(self.source):
             self.start = self.curr
             ch = self.advance()
@@ -155,11 +307,11 @@ class Lexer:
                     self.add_token(TokenType.ASSIGN)
                 else:
                     self.add_token(TokenType.COLON)
-            elif ch.isdigit():
+            elif is_digit(ch):
                 self.handle_number()
             elif ch == '"' or ch == "'":
                 self.handle_string(ch)
-            elif ch.isalpha() or ch == "_":
+            elif is_identifier_char(ch):
                 self.handle_identifier()
             else:
                 lexing_error(
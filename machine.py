@@ -0,0 +1,234 @@
+from interpreter import *
+
+###############################################################################
+# Work items for the explicit-stack interpreter
+###############################################################################
+EVAL = 0  # (EVAL, node, env): evaluate a node
+STMTS = 1  # (STMTS, iterator, env): run the next statement of a block
+BINOP = 2  # (BINOP, node): combine the two values on top of the value stack
+UNOP = 3  # (UNOP, node)
+LOGICAL = 4  # (LOGICAL, node, env): short-circuit on the left value
+ASSIGN = 5  # (ASSIGN, node, env)
+LOCAL = 6  # (LOCAL, node, env)
+PRINT = 7  # (PRINT, node)
+IF = 8  # (IF, node, env): pick a branch from the test value
+WHILE = 9  # (WHILE, node, env, body_env): evaluate the test again
+WHILE_TEST = 10  # (WHILE_TEST, node, env, body_env): run the body if the test passed
+FOR_INIT = 11  # (FOR_INIT, node, env): start and end are on the value stack
+FOR_STEP = 12  # (FOR_STEP, node, env, body_env, i, end, ascending): step on the stack
+FOR_LOOP = 13  # (FOR_LOOP, node, env, body_env, i, end, step, ascending)
+CALL = 14  # (CALL, node, func_decl, func_env): the args are on the value stack
+RETURN = 15  # (RETURN, values_height): a function body fell off its end
+RET = 16  # (RET,): unwind to the nearest RETURN with the value on the stack
+DISCARD = 17  # (DISCARD,): drop the value of an expression statement
+
+
+class Machine(Interpreter):
+    """
+    An interpreter that keeps its own work and value stacks on the heap instead of
+    recursing on the Python stack, so neither nested expressions like ((((...))))
+    or a+a+a+... nor deeply nested blocks can hit Python's recursion limit.
+    Operators, printing and function lookup are shared with Interpreter.
+    """
+
+    def interpret_ast(self, node, env=None):
+        # interpret() hands back the value of a top-level ret itself, not a Signal
+        if env is None:
+            env = Environment()
+        try:
+            return self.interpret(node, env)
+        finally:
+            self.output.flush()
+            self.call_caches.clear()
+
+    def interpret(self, node, env):
+        values = []
+        self.execute([(EVAL, node, env)], values)
+        if values:
+            return values[-1]
+
+    def execute(self, work, values, steps=-1):
+        """
+        Run work items until there are none left (True), or until `steps` of
+        them have run (False): the stacks then hold everything needed to carry
+        on with another execute() call later
+        """
+        while work:
+            if steps == 0:
+                return False
+            steps -= 1
+            item = work.pop()
+            op = item[0]
+
+            if op == EVAL:
+                _, node, env = item
+                if isinstance(node, BinOp):
+                    work.append((BINOP, node))
+                    work.append((EVAL, node.right, env))
+                    work.append((EVAL, node.left, env))
+                elif isinstance(node, Grouping):
+                    work.append((EVAL, node.value, env))
+                elif isinstance(node, UnOp):
+                    work.append((UNOP, node))
+                    work.append((EVAL, node.operand, env))
+                elif isinstance(node, LogicalOp):
+                    work.append((LOGICAL, node, env))
+                    work.append((EVAL, node.left, env))
+                elif isinstance(node, Stmts):
+                    work.append((STMTS, iter(node.stmts), env))
+                elif isinstance(node, Assignment):
+                    work.append((ASSIGN, node, env))
+                    work.append((EVAL, node.right, env))
+                elif isinstance(node, LocalAssignment):
+                    work.append((LOCAL, node, env))
+                    work.append((EVAL, node.right, env))
+                elif isinstance(node, PrintStmt):
+                    work.append((PRINT, node))
+                    work.append((EVAL, node.value, env))
+                elif isinstance(node, IfStmt):
+                    work.append((IF, node, env))
+                    work.append((EVAL, node.test, env))
+                elif isinstance(node, WhileStmt):
+                    work.append((WHILE, node, env, env.new_env()))
+                elif isinstance(node, ForStmt):
+                    work.append((FOR_INIT, node, env))
+                    work.append((EVAL, node.end, env))
+                    work.append((EVAL, node.start, env))
+                elif isinstance(node, FuncCall):
+                    func_decl, func_env = self.lookup_function(node, env)
+                    work.append((CALL, node, func_decl, func_env))
+                    for arg in reversed(node.args):
+                        work.append((EVAL, arg, env))
+                elif isinstance(node, RetStmt):
+                    work.append((RET,))
+                    work.append((EVAL, node.value, env))
+                elif isinstance(node, FuncCallStmt):
+                    work.append((DISCARD,))
+                    work.append((EVAL, node.expr, env))
+                elif isinstance(node, (Integer, Float, String, Bool, Identifier)):
+                    # Leaves never recurse, so the tree-walker can handle them
+                    values.append(Interpreter.interpret(self, node, env))
+                else:
+                    Interpreter.interpret(self, node, env)
+
+            elif op == STMTS:
+                _, stmts, env = item
+                stmt = next(stmts, None)
+                if stmt is not None:
+                    work.append(item)
+                    work.append((EVAL, stmt, env))
+
+            elif op == BINOP:
+                right = values.pop()
+                values.append(self.binop(item[1], values.pop(), right))
+
+            elif op == UNOP:
+                values.append(self.unop(item[1], values.pop()))
+
+            elif op == LOGICAL:
+                _, node, env = item
+                lefttype, leftval = values[-1]
+                if node.op.token_type == TokenType.OR:
+                    if leftval:
+                        continue
+                elif node.op.token_type == TokenType.AND:
+                    if not leftval:
+                        continue
+                values.pop()
+                work.append((EVAL, node.right, env))
+
+            elif op == ASSIGN:
+                _, node, env = item
+                env.set_var(node.left.name, values.pop())
+
+            elif op == LOCAL:
+                _, node, env = item
+                env.set_local_var(node.left.name, values.pop())
+
+            elif op == PRINT:
+                self.print_value(item[1], values.pop())
+
+            elif op == IF:
+                _, node, env = item
+                testtype, testval = values.pop()
+                if testtype != TYPE_BOOL:
+                    runtime_error(
+                        "Condition test is not a boolean expression.", node.line
+                    )
+                if testval:
+                    work.append((EVAL, node.then_stmts, env.new_env()))
+                elif node.else_stmts is not None:
+                    work.append((EVAL, node.else_stmts, env.new_env()))
+
+            elif op == WHILE:
+                _, node, env, body_env = item
+                work.append((WHILE_TEST, node, env, body_env))
+                work.append((EVAL, node.test, env))
+
+            elif op == WHILE_TEST:
+                _, node, env, body_env = item
+                testtype, testval = values.pop()
+                if testtype != TYPE_BOOL:
+                    runtime_error(f"While test is not a boolean expression.", node.line)
+                if testval:
+                    work.append((WHILE, node, env, body_env))
+                    work.append((EVAL, node.body_stmts, body_env))
+
+            elif op == FOR_INIT:
+                _, node, env = item
+                endtype, end = values.pop()
+                itype, i = values.pop()
+                body_env = env.new_env()
+                # Like Interpreter, the direction is fixed by comparing start and end
+                ascending = i < end
+                if node.step is None:
+                    step = 1 if ascending else -1
+                    work.append(
+                        (FOR_LOOP, node, env, body_env, i, end, step, ascending)
+                    )
+                else:
+                    work.append((FOR_STEP, node, env, body_env, i, end, ascending))
+                    work.append((EVAL, node.step, env))
+
+            elif op == FOR_STEP:
+                _, node, env, body_env, i, end, ascending = item
+                steptype, step = values.pop()
+                work.append((FOR_LOOP, node, env, body_env, i, end, step, ascending))
+
+            elif op == FOR_LOOP:
+                _, node, env, body_env, i, end, step, ascending = item
+                if i <= end if ascending else i >= end:
+                    env.set_var(node.ident.name, (TYPE_NUMBER, i))
+                    work.append(
+                        (FOR_LOOP, node, env, body_env, i + step, end, step, ascending)
+                    )
+                    work.append((EVAL, node.body_stmts, body_env))
+
+            elif op == CALL:
+                _, node, func_decl, func_env = item
+                count = len(node.args)
+                args = values[len(values) - count :]
+                del values[len(values) - count :]
+                new_func_env = self.new_call_env(func_decl, func_env, args)
+                work.append((RETURN, len(values)))
+                work.append((EVAL, func_decl.body_stmts, new_func_env))
+
+            elif op == RETURN:
+                # The body finished without a ret statement
+                values.append(None)
+
+            elif op == RET:
+                value = values.pop()
+                while work and work[-1][0] != RETURN:
+                    work.pop()
+                if not work:
+                    # A ret outside of any function ends the program
+                    values[:] = [value]
+                    return True
+                del values[work.pop()[1] :]
+                values.append(value)
+
+            elif op == DISCARD:
+                values.pop()
+
+        return True
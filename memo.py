@@ -0,0 +1,213 @@
+"""
+Memoization of pure functions.
+
+A call to a Pinky function runs its whole body again even when the function
+only computes a result from its arguments, so the usual recursive definitions
+(fib, binomials, path counts) take exponential time. find_pure_functions()
+works out which declared functions are pure:
+
+- the body never prints,
+- it only reads and stores its own params and the names it declares with
+  `local` (a plain `x := ...` or a for loop may store into a variable further
+  out, and reading one makes the result depend on more than the arguments),
+- it declares no functions of its own, and
+- it only calls functions that are pure themselves (by name: a call goes to
+  whichever function of that name is in scope, so every function declared
+  under that name has to be pure).
+
+MemoizingInterpreter then answers calls to those functions from a bounded LRU
+cache keyed by the argument values, and counts hits, misses and evictions per
+function. There is one cache per declaration, not per closure: a pure function
+reads nothing from its closure, so a function declared inside another one
+shares its results across the outer calls (and the number of caches stays at
+most the number of declarations). What a pure function's calls go to can only
+change when a function is declared under a name already in scope (redeclared,
+or shadowed from an inner scope), which clears the caches.
+"""
+
+from collections import OrderedDict
+from interpreter import *
+
+DEFAULT_MAXSIZE = 4096  # cached results per function
+
+
+class PurityChecker:
+    """
+    Checks one function body, with a stack of the names declared in each block
+    """
+
+    def __init__(self, func_decl):
+        self.scopes = [{param.name for param in func_decl.params}]
+        self.calls = set()
+        self.pure = True
+        self.check_block(func_decl.body_stmts)
+
+    def is_local(self, name):
+        return any(name in scope for scope in self.scopes)
+
+    def check_block(self, block):
+        self.scopes.append(set())
+        for stmt in block.stmts:
+            self.check(stmt)
+        self.scopes.pop()
+
+    def check(self, node):
+        if not self.pure or node is None:
+            return
+        if isinstance(node, (PrintStmt, FuncDecl)):
+            self.pure = False
+        elif isinstance(node, Identifier):
+            if not self.is_local(node.name):
+                self.pure = False
+        elif isinstance(node, LocalAssignment):
+            self.check(node.right)
+            self.scopes[-1].add(node.left.name)
+        elif isinstance(node, Assignment):
+            self.check(node.right)
+            self.check(node.left)
+        elif isinstance(node, ForStmt):
+            for child in (node.ident, node.start, node.end, node.step):
+                self.check(child)
+            self.check_block(node.body_stmts)
+        elif isinstance(node, (IfStmt, WhileStmt)):
+            self.check(node.test)
+            for block in (
+                getattr(node, "then_stmts", None),
+                getattr(node, "else_stmts", None),
+                getattr(node, "body_stmts", None),
+            ):
+                if block is not None:
+                    self.check_block(block)
+        elif isinstance(node, FuncCall):
+            self.calls.add(node.name)
+            for arg in node.args:
+                self.check(arg)
+        else:
+            for child in iter_child_nodes(node):
+                self.check(child)
+
+
+def find_pure_functions(root):
+    """
+    The set of FuncDecl nodes in the program that are pure
+    """
+    decls = []
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        if isinstance(node, FuncDecl):
+            decls.append(node)
+        pending.extend(iter_child_nodes(node))
+
+    checked = {decl: PurityChecker(decl) for decl in decls}
+    pure = {decl for decl, checker in checked.items() if checker.pure}
+    # Drop functions that call an impure (or unknown) name until nothing changes,
+    # so mutually recursive pure functions stay pure
+    changed = True
+    while changed:
+        pure_names = {decl.name for decl in pure} - {
+            decl.name for decl in decls if decl not in pure
+        }
+        changed = False
+        for decl in list(pure):
+            if not checked[decl].calls <= pure_names:
+                pure.remove(decl)
+                changed = True
+    return pure
+
+
+class MemoCache:
+    """
+    Results of one pure function, least recently used first
+    """
+
+    __slots__ = ("name", "maxsize", "results", "hits", "misses", "evictions")
+
+    def __init__(self, name, maxsize):
+        self.name = name
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.results.move_to_end(key)
+        return result
+
+    def put(self, key, result):
+        self.results[key] = result
+        if len(self.results) > self.maxsize:
+            self.results.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "size": len(self.results),
+        }
+
+
+class MemoizingInterpreter(Interpreter):
+    """
+    Interpreter that reuses the results of pure function calls
+    """
+
+    def __init__(self, output=None, maxsize=DEFAULT_MAXSIZE):
+        super().__init__(output)
+        self.maxsize = maxsize
+        self.pure = set()
+        # FuncDecl -> MemoCache
+        self.caches = {}
+
+    def interpret_ast(self, node, env=None):
+        self.pure = find_pure_functions(node)
+        return super().interpret_ast(node, env)
+
+    def interpret_FuncDecl(self, node, env):
+        previous = env.get_func(node.name)
+        if previous is not None and previous[0] is not node:
+            # Calls made by name may now go to a different function
+            self.caches.clear()
+        super().interpret_FuncDecl(node, env)
+
+    def interpret_FuncCall(self, node, env):
+        func_decl, func_env = self.lookup_function(node, env)
+        if func_decl not in self.pure:
+            return super().interpret_FuncCall(node, env)
+
+        args = tuple(self.interpret(arg, env) for arg in node.args)
+        try:
+            cache = self.caches[func_decl]
+        except KeyError:
+            cache = self.caches[func_decl] = MemoCache(func_decl.name, self.maxsize)
+        result = cache.get(args)
+        if result is not None:
+            return result
+
+        new_func_env = self.new_call_env(func_decl, func_env, list(args))
+        signal = self.interpret(func_decl.body_stmts, new_func_env)
+        if signal is not None:
+            result = signal.value
+            # A call that ended in a runtime error has no result to reuse
+            if result is not None:
+                cache.put(args, result)
+            return result
+
+    def memo_stats(self):
+        """
+        Function name -> hits, misses, evictions and cached results
+        """
+        stats = {}
+        for cache in self.caches.values():
+            totals = stats.setdefault(cache.name, dict.fromkeys(cache.stats(), 0))
+            for key, value in cache.stats().items():
+                totals[key] += value
+        return stats
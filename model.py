@@ -3,10 +3,21 @@ from tokens import *
 
 class Node:
     """
-    The parent class for every node in the AST
+    The parent class for every node in the AST. Nodes only store their fields; the
+    shape checks live in verify() so that building a tree stays cheap. Trailing
+    fields that default to None (address, slot, size) are scope annotations filled
+    in by resolver.py.
     """
 
-    pass
+    __slots__ = ()
+
+    def verify(self):
+        pass
+
+    def __reduce__(self):
+        # Every constructor takes its fields in slot order, so a node pickles as
+        # a plain constructor call (smaller and faster to load, see cache.py)
+        return (type(self), tuple(getattr(self, name) for name in self.__slots__))
 
 
 class Expr(Node):
@@ -14,7 +25,7 @@ class Expr(Node):
     Expressions evaluate to a result, like x + (3 * y) >= 6
     """
 
-    pass
+    __slots__ = ()
 
 
 class Stmt(Node):
@@ -22,7 +33,7 @@ class Stmt(Node):
     Statements perform an action
     """
 
-    pass
+    __slots__ = ()
 
 
 class Decl(Stmt):
@@ -30,7 +41,7 @@ class Decl(Stmt):
     Declarations are statements to declare a new name (in our case, functions)
     """
 
-    pass
+    __slots__ = ()
 
 
 class Integer(Expr):
@@ -38,11 +49,15 @@ class Integer(Expr):
     Example: 17
     """
 
+    __slots__ = ("value", "line")
+
     def __init__(self, value, line):
-        assert isinstance(value, int), value
         self.value = value
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.value, int), self.value
+
     def __repr__(self):
         return f"Integer[{self.value}]"
 
@@ -52,11 +67,15 @@ class Float(Expr):
     Example: 3.141592
     """
 
+    __slots__ = ("value", "line")
+
     def __init__(self, value, line):
-        assert isinstance(value, float), value
         self.value = value
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.value, float), self.value
+
     def __repr__(self):
         return f"Float[{self.value}]"
 
@@ -66,11 +85,15 @@ class Bool(Expr):
     Example: true, false
     """
 
+    __slots__ = ("value", "line")
+
     def __init__(self, value, line):
-        assert isinstance(value, bool), value
         self.value = value
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.value, bool), self.value
+
     def __repr__(self):
         return f"Bool[{self.value}]"
 
@@ -80,11 +103,15 @@ class String(Expr):
     Example: 'this is a string'
     """
 
+    __slots__ = ("value", "line")
+
     def __init__(self, value, line):
-        assert isinstance(value, str), value
         self.value = value
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.value, str), self.value
+
     def __repr__(self):
         return f"String[{self.value}]"
 
@@ -94,13 +121,17 @@ class UnOp(Expr):
     Example: -operand
     """
 
+    __slots__ = ("op", "operand", "line")
+
     def __init__(self, op: Token, operand: Expr, line):
-        assert isinstance(op, Token), op
-        assert isinstance(operand, Expr), operand
         self.op = op
         self.operand = operand
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.op, Token), self.op
+        assert isinstance(self.operand, Expr), self.operand
+
     def __repr__(self):
         return f"UnOp({self.op.lexeme!r}, {self.operand})"
 
@@ -110,15 +141,19 @@ class BinOp(Expr):
     Example: x + y
     """
 
+    __slots__ = ("op", "left", "right", "line")
+
     def __init__(self, op: Token, left: Expr, right: Expr, line):
-        assert isinstance(op, Token), op
-        assert isinstance(left, Expr), left
-        assert isinstance(right, Expr), right
         self.op = op
         self.left = left
         self.right = right
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.op, Token), self.op
+        assert isinstance(self.left, Expr), self.left
+        assert isinstance(self.right, Expr), self.right
+
     def __repr__(self):
         return f"BinOp({self.op.lexeme!r}, {self.left}, {self.right})"
 
@@ -128,15 +163,19 @@ class LogicalOp(Expr):
     Example: x and y, x or y
     """
 
+    __slots__ = ("op", "left", "right", "line")
+
     def __init__(self, op: Token, left: Expr, right: Expr, line):
-        assert isinstance(op, Token), op
-        assert isinstance(left, Expr), left
-        assert isinstance(right, Expr), right
         self.op = op
         self.left = left
         self.right = right
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.op, Token), self.op
+        assert isinstance(self.left, Expr), self.left
+        assert isinstance(self.right, Expr), self.right
+
     def __repr__(self):
         return f"LogicalOp({self.op.lexeme!r}, {self.left}, {self.right})"
 
@@ -146,11 +185,15 @@ class Grouping(Expr):
     Example: ( <expr> )
     """
 
+    __slots__ = ("value", "line")
+
     def __init__(self, value, line):
-        assert isinstance(value, Expr), value
         self.value = value
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.value, Expr), self.value
+
     def __repr__(self):
         return f"Grouping({self.value})"
 
@@ -160,10 +203,15 @@ class Identifier(Expr):
     Example: x, PI, _score, numLives, start_vel
     """
 
-    def __init__(self, name, line):
-        assert isinstance(name, str), name
+    __slots__ = ("name", "line", "address")
+
+    def __init__(self, name, line, address=None):
         self.name = name
         self.line = line
+        self.address = address
+
+    def verify(self):
+        assert isinstance(self.name, str), self.name
 
     def __repr__(self):
         return f"Identifier[{self.name}]"
@@ -174,10 +222,15 @@ class Stmts(Node):
     A list of statements
     """
 
-    def __init__(self, stmts, line):
-        assert all(isinstance(stmt, Stmt) for stmt in stmts), stmts
+    __slots__ = ("stmts", "line", "size")
+
+    def __init__(self, stmts, line, size=None):
         self.stmts = stmts
         self.line = line
+        self.size = size
+
+    def verify(self):
+        assert all(isinstance(stmt, Stmt) for stmt in self.stmts), self.stmts
 
     def __repr__(self):
         return f"Stmts({self.stmts})"
@@ -188,12 +241,16 @@ class PrintStmt(Stmt):
     Example: print value, println value
     """
 
+    __slots__ = ("value", "end", "line")
+
     def __init__(self, value, end, line):
-        assert isinstance(value, Expr), value
         self.value = value
         self.end = end
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.value, Expr), self.value
+
     def __repr__(self):
         return f"PrintStmt({self.value}, end={self.end!r})"
 
@@ -203,15 +260,21 @@ class IfStmt(Stmt):
     "if" <expr> "then" <then_stmts> ("else" <else_stmts>)? "end"
     """
 
+    __slots__ = ("test", "then_stmts", "else_stmts", "line")
+
     def __init__(self, test, then_stmts, else_stmts, line):
-        assert isinstance(test, Expr), test
-        assert isinstance(then_stmts, Stmts), then_stmts
-        assert else_stmts is None or isinstance(else_stmts, Stmts), else_stmts
         self.test = test
         self.then_stmts = then_stmts
         self.else_stmts = else_stmts
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.test, Expr), self.test
+        assert isinstance(self.then_stmts, Stmts), self.then_stmts
+        assert self.else_stmts is None or isinstance(
+            self.else_stmts, Stmts
+        ), self.else_stmts
+
     def __repr__(self):
         return f"IfStmt({self.test}, then:{self.then_stmts}, else:{self.else_stmts})"
 
@@ -221,13 +284,17 @@ class WhileStmt(Stmt):
     "while" <expr> "do" <body_stmts> "end"
     """
 
+    __slots__ = ("test", "body_stmts", "line")
+
     def __init__(self, test, body_stmts, line):
-        assert isinstance(test, Expr), test
-        assert isinstance(body_stmts, Stmts), body_stmts
         self.test = test
         self.body_stmts = body_stmts
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.test, Expr), self.test
+        assert isinstance(self.body_stmts, Stmts), self.body_stmts
+
     def __repr__(self):
         return f"WhileStmt({self.test}, {self.body_stmts})"
 
@@ -237,12 +304,18 @@ class Assignment(Stmt):
     left := right
     """
 
-    def __init__(self, left, right, line):
-        assert isinstance(left, Expr), left
-        assert isinstance(right, Expr), right
+    __slots__ = ("left", "right", "line", "address", "slot")
+
+    def __init__(self, left, right, line, address=None, slot=None):
         self.left = left
         self.right = right
         self.line = line
+        self.address = address
+        self.slot = slot
+
+    def verify(self):
+        assert isinstance(self.left, Expr), self.left
+        assert isinstance(self.right, Expr), self.right
 
     def __repr__(self):
         return f"Assignment({self.left}, {self.right})"
@@ -253,18 +326,35 @@ class ForStmt(Stmt):
     "for" <identifier> ":=" <start> "," <end> ("," <step>)? "do" <body_stmts> "end"
     """
 
-    def __init__(self, ident, start, end, step, body_stmts, line):
-        assert isinstance(ident, Identifier), ident
-        assert isinstance(start, Expr), start
-        assert isinstance(end, Expr), end
-        assert isinstance(step, Expr) or step is None, step
-        assert isinstance(body_stmts, Stmts), body_stmts
+    __slots__ = (
+        "ident",
+        "start",
+        "end",
+        "step",
+        "body_stmts",
+        "line",
+        "address",
+        "slot",
+    )
+
+    def __init__(
+        self, ident, start, end, step, body_stmts, line, address=None, slot=None
+    ):
         self.ident = ident
         self.start = start
         self.end = end
         self.step = step
         self.body_stmts = body_stmts
         self.line = line
+        self.address = address
+        self.slot = slot
+
+    def verify(self):
+        assert isinstance(self.ident, Identifier), self.ident
+        assert isinstance(self.start, Expr), self.start
+        assert isinstance(self.end, Expr), self.end
+        assert isinstance(self.step, Expr) or self.step is None, self.step
+        assert isinstance(self.body_stmts, Stmts), self.body_stmts
 
     def __repr__(self):
         return f"ForStmt({self.ident}, {self.start}, {self.end}, {self.step}, {self.body_stmts})"
@@ -275,13 +365,18 @@ class FuncDecl(Decl):
     "func" <name> "(" <params>? ")" <body_stmts> "end"
     """
 
-    def __init__(self, name, params, body_stmts, line):
-        assert isinstance(name, str), name
-        assert all(isinstance(param, Param) for param in params), params
+    __slots__ = ("name", "params", "body_stmts", "line", "slot")
+
+    def __init__(self, name, params, body_stmts, line, slot=None):
         self.name = name
         self.params = params
         self.body_stmts = body_stmts
         self.line = line
+        self.slot = slot
+
+    def verify(self):
+        assert isinstance(self.name, str), self.name
+        assert all(isinstance(param, Param) for param in self.params), self.params
 
     def __repr__(self):
         return f"FuncDecl({self.name!r}, {self.params}, {self.body_stmts})"
@@ -292,10 +387,15 @@ class Param(Decl):
     A single function parameter
     """
 
-    def __init__(self, name, line):
-        assert isinstance(name, str), name
+    __slots__ = ("name", "line", "slot")
+
+    def __init__(self, name, line, slot=None):
         self.name = name
         self.line = line
+        self.slot = slot
+
+    def verify(self):
+        assert isinstance(self.name, str), self.name
 
     def __repr__(self):
         return f"Param[{self.name!r}]"
@@ -307,10 +407,13 @@ class FuncCall(Expr):
     <args> ::= <expr> ( ',' <expr> )*
     """
 
-    def __init__(self, name, args, line):
+    __slots__ = ("name", "args", "line", "address")
+
+    def __init__(self, name, args, line, address=None):
         self.name = name
         self.args = args
         self.line = line
+        self.address = address
 
     def __repr__(self):
         return f"FuncCall({self.name!r}, {self.args})"
@@ -321,20 +424,28 @@ class FuncCallStmt(Stmt):
     A special type of statement used to wrap FuncCall expressions
     """
 
+    __slots__ = ("expr",)
+
     def __init__(self, expr):
-        assert isinstance(expr, FuncCall), expr
         self.expr = expr
 
+    def verify(self):
+        assert isinstance(self.expr, FuncCall), self.expr
+
     def __repr__(self):
         return f"FuncCallStmt({self.expr})"
 
 
 class RetStmt(Stmt):
+    __slots__ = ("value", "line")
+
     def __init__(self, value, line):
-        assert isinstance(value, Expr), value
         self.value = value
         self.line = line
 
+    def verify(self):
+        assert isinstance(self.value, Expr), self.value
+
     def __repr__(self):
         return f"RetStmt({self.value})"
 
@@ -344,12 +455,44 @@ class LocalAssignment(Stmt):
     local left := right
     """
 
-    def __init__(self, left, right, line):
-        assert isinstance(left, Expr), left
-        assert isinstance(right, Expr), right
+    __slots__ = ("left", "right", "line", "slot")
+
+    def __init__(self, left, right, line, slot=None):
         self.left = left
         self.right = right
         self.line = line
+        self.slot = slot
+
+    def verify(self):
+        assert isinstance(self.left, Expr), self.left
+        assert isinstance(self.right, Expr), self.right
 
     def __repr__(self):
         return f"Local assignment({self.left}, {self.right})"
+
+
+def iter_child_nodes(node):
+    """
+    Yield the direct children of a node, including the ones held in lists
+    """
+    for name in node.__slots__:
+        value = getattr(node, name)
+        if isinstance(value, Node):
+            yield value
+        elif isinstance(value, list):
+            for item in value:
+                if isinstance(item, Node):
+                    yield item
+
+
+def verify_ast(root):
+    """
+    Run every node's verify() over a whole tree (without recursing, so deep trees
+    from the stack parser are fine)
+    """
+    pending = [root]
+    while pending:
+        node = pending.pop()
+        node.verify()
+        pending.extend(iter_child_nodes(node))
+    return root
@@ -0,0 +1,239 @@
+"""
+AST optimizer.
+
+The backends run the tree exactly as the parser built it, so `2 * 3.14 * r`
+multiplies the two constants again on every evaluation, every pair of
+parentheses is an extra Grouping level to walk through, and an `if false then`
+block is kept around. The optimizer rewrites the tree once, before it is run or
+compiled, as a sequence of passes chosen by the optimization level:
+
+    -O0  nothing
+    -O1  FoldConstants: fold BinOp/UnOp/LogicalOp over literals, drop Groupings
+    -O2  ... and EliminateDeadCode: drop statically dead if/while branches and
+         statements after a ret
+
+Optimizing never changes what a program prints, including its runtime errors:
+an operation that would report an error (e.g. 1 / 0 or 'a' < 1) is left in the
+tree to report it when it runs.
+"""
+
+from interpreter import *
+
+# Operators folded when both operands are numbers (see Interpreter.binop)
+ARITHMETIC = (
+    TokenType.PLUS,
+    TokenType.MINUS,
+    TokenType.STAR,
+    TokenType.SLASH,
+    TokenType.MOD,
+    TokenType.CARET,
+)
+# ... when both are numbers or both are strings
+COMPARISON = (TokenType.GT, TokenType.GE, TokenType.LT, TokenType.LE)
+# ... when both have the same type
+EQUALITY = (TokenType.EQEQ, TokenType.NE)
+
+
+class Pass:
+    """
+    One rewrite of the tree. visit() returns the node to put in place of the one
+    it was given; for a statement it may also return None to remove it, or a
+    list of statements to splice into the enclosing block.
+    """
+
+    def __init__(self):
+        # Node class -> bound visit_<NodeClass> method
+        self.handlers = {}
+
+    def run(self, root):
+        return self.visit(root)
+
+    def visit(self, node):
+        try:
+            handler = self.handlers[node.__class__]
+        except KeyError:
+            handler = getattr(
+                self, "visit_" + node.__class__.__name__, self.visit_children
+            )
+            self.handlers[node.__class__] = handler
+        return handler(node)
+
+    def visit_children(self, node):
+        for name in node.__slots__:
+            value = getattr(node, name)
+            if isinstance(value, Node):
+                setattr(node, name, self.visit(value))
+            elif isinstance(value, list):
+                value[:] = [
+                    self.visit(item) if isinstance(item, Node) else item
+                    for item in value
+                ]
+        return node
+
+    def visit_Stmts(self, node):
+        stmts = []
+        for stmt in node.stmts:
+            result = self.visit(stmt)
+            if result is None:
+                continue
+            if isinstance(result, list):
+                stmts.extend(result)
+            else:
+                stmts.append(result)
+        node.stmts = stmts
+        return node
+
+
+def literal_value(node):
+    """
+    The boxed runtime value of a literal node, or None if it is not a literal
+    """
+    if isinstance(node, (Integer, Float)):
+        return (TYPE_NUMBER, float(node.value))
+    if isinstance(node, String):
+        return (TYPE_STRING, str(node.value))
+    if isinstance(node, Bool):
+        return (TYPE_BOOL, node.value)
+    return None
+
+
+def literal_node(value, line):
+    """
+    A literal node evaluating to the boxed runtime value
+    """
+    valtype, val = value
+    if valtype == TYPE_NUMBER:
+        return Float(val, line)
+    if valtype == TYPE_STRING:
+        return String(str(val), line)  # long concatenations fold to a Rope
+    return Bool(val, line)
+
+
+class FoldConstants(Pass):
+    def __init__(self):
+        super().__init__()
+        # Only used for its binop/unop, so that folding computes exactly what
+        # the program would have computed at runtime
+        self.interpreter = Interpreter()
+
+    def visit_Grouping(self, node):
+        return self.visit(node.value)
+
+    def visit_BinOp(self, node):
+        self.visit_children(node)
+        left = literal_value(node.left)
+        right = literal_value(node.right)
+        if left is None or right is None or not self.can_fold(node, left, right):
+            return node
+        try:
+            value = self.interpreter.binop(node, left, right)
+        except ArithmeticError:
+            # e.g. an overflowing ^, left for the program to run into
+            return node
+        if value[0] == TYPE_NUMBER and not isinstance(value[1], (int, float)):
+            # (-8) ^ 0.5 is a complex number, which no literal can hold
+            return node
+        return literal_node(value, node.line)
+
+    def can_fold(self, node, left, right):
+        """
+        Does the operator succeed on these operands without a runtime error?
+        """
+        token_type = node.op.token_type
+        lefttype, righttype = left[0], right[0]
+        if token_type in ARITHMETIC and lefttype == righttype == TYPE_NUMBER:
+            return not (token_type == TokenType.SLASH and right[1] == 0)
+        if token_type == TokenType.PLUS:
+            # String concatenation (stringify() only handles true, not false)
+            return TYPE_STRING in (lefttype, righttype) and TYPE_BOOL not in (
+                lefttype,
+                righttype,
+            )
+        if token_type in COMPARISON:
+            return lefttype == righttype and lefttype != TYPE_BOOL
+        if token_type in EQUALITY:
+            return lefttype == righttype
+        return False
+
+    def visit_UnOp(self, node):
+        self.visit_children(node)
+        operand = literal_value(node.operand)
+        if operand is None:
+            return node
+        token_type = node.op.token_type
+        if token_type in (TokenType.MINUS, TokenType.PLUS):
+            foldable = operand[0] == TYPE_NUMBER
+        else:
+            foldable = token_type == TokenType.NOT and operand[0] == TYPE_BOOL
+        if not foldable:
+            return node
+        return literal_node(self.interpreter.unop(node, operand), node.line)
+
+    def visit_LogicalOp(self, node):
+        self.visit_children(node)
+        left = literal_value(node.left)
+        if left is None:
+            return node
+        # Same short-circuit rule as Interpreter.interpret_LogicalOp: the result
+        # is the left operand or, without evaluating it here, the right one
+        if node.op.token_type == TokenType.OR:
+            return node.left if left[1] else node.right
+        if node.op.token_type == TokenType.AND:
+            return node.right if left[1] else node.left
+        return node
+
+
+def binds_names(block):
+    """
+    Does a block store names of its own (which then live in the block's scope)?
+    """
+    return any(
+        isinstance(stmt, (Assignment, LocalAssignment, ForStmt, FuncDecl))
+        for stmt in block.stmts
+    )
+
+
+class EliminateDeadCode(Pass):
+    def visit_Stmts(self, node):
+        super().visit_Stmts(node)
+        for index, stmt in enumerate(node.stmts):
+            if isinstance(stmt, RetStmt):
+                del node.stmts[index + 1 :]
+                break
+        return node
+
+    def visit_IfStmt(self, node):
+        self.visit_children(node)
+        if not isinstance(node.test, Bool):
+            return node
+        taken = node.then_stmts if node.test.value else node.else_stmts
+        if taken is None or not taken.stmts:
+            return None
+        if binds_names(taken):
+            # The branch needs its own scope, keep it in an always-taken if
+            return IfStmt(Bool(True, node.test.line), taken, None, node.line)
+        return taken.stmts
+
+    def visit_WhileStmt(self, node):
+        self.visit_children(node)
+        if isinstance(node.test, Bool) and not node.test.value:
+            return None
+        return node
+
+
+# Optimization level -> passes to run, in order
+PASSES = {
+    0: [],
+    1: [FoldConstants],
+    2: [FoldConstants, EliminateDeadCode],
+}
+MAX_LEVEL = max(PASSES)
+
+
+def optimize(ast, level=MAX_LEVEL):
+    """
+    Rewrite the program's AST in place with the passes for the level
+    """
+    for pass_class in PASSES[min(level, MAX_LEVEL)]:
+        ast = pass_class().run(ast)
+    return ast
@@ -0,0 +1,98 @@
+"""
+Program output.
+
+print/println used to go through Python's print() one value at a time, after
+re-encoding the text and running codecs.escape_decode over it. Escape sequences
+are now decoded once, when the parser builds the String node (see
+utils.decode_escapes), and the backends write to an Output: a buffer in front
+of a text stream that joins the pieces and writes them out in one go.
+
+The stream can be stdout (looked up when flushing, so redirect_stdout works),
+a file or an in-memory io.StringIO. When the buffer is written out depends on
+the flush policy:
+
+    FLUSH_FULL    when the buffer holds buffer_size characters
+    FLUSH_LINE    at the end of every line as well (for interactive use)
+    FLUSH_ALWAYS  after every write, like print(..., flush=True)
+
+and every Output is flushed when the program ends and before a runtime error
+is reported, so the error appears after the output that came before it.
+"""
+
+import atexit
+import io
+import sys
+import weakref
+
+FLUSH_FULL = "full"
+FLUSH_LINE = "line"
+FLUSH_ALWAYS = "always"
+FLUSH_POLICIES = (FLUSH_FULL, FLUSH_LINE, FLUSH_ALWAYS)
+DEFAULT_BUFFER_SIZE = 64 * 1024  # characters
+
+# Outputs that may hold unwritten text
+_outputs = weakref.WeakSet()
+
+
+class Output:
+    def __init__(self, stream=None, flush=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        stream is a text stream, or None for whatever sys.stdout is when flushing.
+        The default policy is FLUSH_LINE on a terminal and FLUSH_FULL otherwise.
+        """
+        if flush is None:
+            target = sys.stdout if stream is None else stream
+            flush = FLUSH_LINE if target.isatty() else FLUSH_FULL
+        if flush not in FLUSH_POLICIES:
+            raise ValueError(f"unknown flush policy {flush!r}")
+        self.stream = stream
+        self.policy = flush
+        self.buffer_size = 1 if flush == FLUSH_ALWAYS else buffer_size
+        self.line_buffered = flush == FLUSH_LINE
+        self.parts = []
+        self.size = 0
+        _outputs.add(self)
+
+    @classmethod
+    def to_file(cls, filename, flush=FLUSH_FULL, buffer_size=DEFAULT_BUFFER_SIZE):
+        return cls(open(filename, "w"), flush, buffer_size)
+
+    @classmethod
+    def in_memory(cls):
+        """
+        An Output that keeps everything; read it back with getvalue()
+        """
+        return cls(io.StringIO(), FLUSH_FULL)
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.buffer_size or (self.line_buffered and "\n" in text):
+            self.flush()
+
+    def flush(self):
+        if not self.parts:
+            return
+        stream = sys.stdout if self.stream is None else self.stream
+        stream.write("".join(self.parts))
+        stream.flush()
+        self.parts.clear()
+        self.size = 0
+
+    def getvalue(self):
+        self.flush()
+        return self.stream.getvalue()
+
+    def close(self):
+        self.flush()
+        if self.stream is not None:
+            self.stream.close()
+        _outputs.discard(self)
+
+
+def flush_all():
+    for output in list(_outputs):
+        output.flush()
+
+
+atexit.register(flush_all)
@@ -1,41 +1,91 @@
-from typing import List
+from typing import Iterator, Optional
 from model import *
 from tokens import *
-from utils import parse_error
+from utils import decode_escapes, parse_error
+
+###############################################################################
+# Binding powers for the Pratt expression parser (higher binds tighter)
+###############################################################################
+BP_OR = 1
+BP_AND = 2
+BP_EQUALITY = 3
+BP_COMPARISON = 4
+BP_ADDITION = 5
+BP_MULTIPLICATION = 6
+BP_MODULO = 7
+BP_UNARY = 8
+BP_EXPONENT = 9
+
+# Infix operators: token type -> (binding power, node class)
+INFIX_OPERATORS = {
+    TokenType.OR: (BP_OR, LogicalOp),
+    TokenType.AND: (BP_AND, LogicalOp),
+    TokenType.NE: (BP_EQUALITY, BinOp),
+    TokenType.EQEQ: (BP_EQUALITY, BinOp),
+    TokenType.GT: (BP_COMPARISON, BinOp),
+    TokenType.GE: (BP_COMPARISON, BinOp),
+    TokenType.LT: (BP_COMPARISON, BinOp),
+    TokenType.LE: (BP_COMPARISON, BinOp),
+    TokenType.PLUS: (BP_ADDITION, BinOp),
+    TokenType.MINUS: (BP_ADDITION, BinOp),
+    TokenType.STAR: (BP_MULTIPLICATION, BinOp),
+    TokenType.SLASH: (BP_MULTIPLICATION, BinOp),
+    TokenType.MOD: (BP_MODULO, BinOp),
+    TokenType.CARET: (BP_EXPONENT, BinOp),
+}
+
+PREFIX_OPERATORS = {TokenType.NOT, TokenType.MINUS, TokenType.PLUS}
+
+# Right associative operators parse their right operand at their own binding power
+RIGHT_ASSOCIATIVE = {TokenType.CARET}
 
 
 class Parser:
-    def __init__(self, tokens):
-        self.tokens: List[Token] = tokens
-        self.curr = 0
-
-    def is_index_out_of_bounds(self, index):
-        return index >= len(self.tokens)
+    def __init__(self, tokens, mode="pratt"):
+        """
+        tokens can be a list or any iterator of tokens (e.g. Lexer.iter_tokens()).
+        The parser only ever looks one token ahead, so it keeps just the previous
+        and the current token instead of indexing into a materialized list.
+
+        mode selects how the program is parsed:
+          "pratt"   - precedence climbing driven by INFIX_OPERATORS
+          "descent" - one recursive descent method per precedence level
+          "stack"   - no recursion at all: expressions and blocks are parsed with
+                      explicit stacks, so nesting depth is only bounded by memory
+        All of them build exactly the same trees.
+        """
+        if mode not in ("pratt", "descent", "stack"):
+            raise ValueError(f"Unknown parser mode {mode!r}")
+        self.mode = mode
+        self.tokens: Iterator[Token] = iter(tokens)
+        self.previous: Optional[Token] = None
+        self.current: Optional[Token] = next(self.tokens, None)
+
+    def is_at_end(self):
+        return self.current is None
 
     def advance(self):
-        if self.is_index_out_of_bounds(self.curr):
+        if self.current is None:
             raise IndexError("Attempted to advance past the end of the token stream.")
-        char = self.tokens[self.curr]
-        self.curr += 1
-        return char
+        token = self.previous = self.current
+        self.current = next(self.tokens, None)
+        return token
 
     def peek(self):
-        if self.is_index_out_of_bounds(self.curr):
-            return
-        return self.tokens[self.curr]
+        return self.current
 
     def is_next(self, expected_type):
-        if self.curr >= len(self.tokens):
+        if self.current is None:
             return False
-        return self.peek().token_type == expected_type
+        return self.current.token_type == expected_type
 
     def expect(self, expected_type):
-        if self.curr >= len(self.tokens):
+        if self.current is None:
             parse_error(
                 f"Found {self.previous_token().lexeme!r} at the end of parsing",
                 self.previous_token().line,
             )
-        elif self.peek().token_type == expected_type:
+        elif self.current.token_type == expected_type:
             token = self.advance()
             return token
         else:
@@ -45,16 +95,14 @@ class Parser:
             )
 
     def previous_token(self):
-        return self.tokens[self.curr - 1]
+        return self.previous
 
     def match(self, expected_type):
-        if self.curr >= len(self.tokens):
+        if self.current is None:
             return False
-        if self.peek().token_type != expected_type:
+        if self.current.token_type != expected_type:
             return False
-        self.curr = (
-            self.curr + 1
-        )  # If it is a match, we return True and also comsume that token
+        self.advance()  # If it is a match, we also consume that token
         return True
 
     def args(self):
@@ -71,30 +119,10 @@ class Parser:
     #              |  <string>
     #              | '(' <expr> ')'
     def primary(self):
-        if self.match(TokenType.INTEGER):
-            return Integer(
-                int(self.previous_token().lexeme), line=self.previous_token().line
-            )
-        elif self.match(TokenType.FLOAT):
-            return Float(
-                float(self.previous_token().lexeme), line=self.previous_token().line
-            )
-        elif self.match(TokenType.TRUE):
-            return Bool(True, line=self.previous_token().line)
-        elif self.match(TokenType.FALSE):
-            return Bool(False, line=self.previous_token().line)
-        elif self.match(TokenType.STRING):
-            return String(
-                str(self.previous_token().lexeme[1:-1]), line=self.previous_token().line
-            )  # Remove the quotes at the beginning and at the end of the lexeme
-        elif self.match(TokenType.LPAREN):
-            expr = self.expr()
-            if not self.match(TokenType.RPAREN):
-                parse_error(f'Error: ")" expected.', self.previous_token().line)
-            else:
-                return Grouping(expr, line=self.previous_token().line)
-        else:
-            identifier = self.expect(TokenType.IDENTIFIER)
+        token = self.current
+        token_type = token.token_type if token is not None else None
+        if token_type == TokenType.IDENTIFIER:
+            identifier = self.advance()
             if self.match(TokenType.LPAREN):
                 args = self.args()
                 self.expect(TokenType.RPAREN)
@@ -102,7 +130,33 @@ class Parser:
                     identifier.lexeme, args, line=self.previous_token().line
                 )
             else:
-                return Identifier(identifier.lexeme, line=self.previous_token().line)
+                return Identifier(identifier.lexeme, line=identifier.line)
+        elif token_type == TokenType.INTEGER:
+            self.advance()
+            return Integer(int(token.lexeme), line=token.line)
+        elif token_type == TokenType.FLOAT:
+            self.advance()
+            return Float(float(token.lexeme), line=token.line)
+        elif token_type == TokenType.TRUE:
+            self.advance()
+            return Bool(True, line=token.line)
+        elif token_type == TokenType.FALSE:
+            self.advance()
+            return Bool(False, line=token.line)
+        elif token_type == TokenType.STRING:
+            self.advance()
+            # Remove the quotes at the beginning and at the end of the lexeme, and
+            # decode escape sequences once here rather than on every print
+            return String(decode_escapes(token.lexeme[1:-1]), line=token.line)
+        elif token_type == TokenType.LPAREN:
+            self.advance()
+            expr = self.expr()
+            if not self.match(TokenType.RPAREN):
+                parse_error(f'Error: ")" expected.', self.previous_token().line)
+            else:
+                return Grouping(expr, line=self.previous_token().line)
+        else:
+            self.expect(TokenType.IDENTIFIER)  # reports what we found instead
 
     # <exponent> ::= <primary> ( "^" <exponent> )*
     def exponent(self):
@@ -193,7 +247,117 @@ class Parser:
             expr = LogicalOp(op, expr, right, line=op.line)
         return expr
 
+    # Pratt parser for the same grammar as logical_or() and everything below it.
+    # A prefix operator is only allowed where <unary> is (not as the right
+    # operand of "^"), and each infix operator parses its right operand at a
+    # higher binding power, or at the same one when it is right associative.
+    def pratt_expr(self, min_bp=BP_OR):
+        token = self.current
+        if (
+            token is not None
+            and token.token_type in PREFIX_OPERATORS
+            and min_bp <= BP_UNARY
+        ):
+            self.advance()
+            operand = self.pratt_expr(BP_UNARY)
+            expr = UnOp(token, operand, line=token.line)
+        else:
+            expr = self.primary()
+
+        while self.current is not None:
+            op = self.current
+            infix = INFIX_OPERATORS.get(op.token_type)
+            if infix is None or infix[0] < min_bp:
+                break
+            bp, node_class = infix
+            self.advance()
+            if op.token_type in RIGHT_ASSOCIATIVE:
+                right = self.pratt_expr(bp)
+            else:
+                right = self.pratt_expr(bp + 1)
+            expr = node_class(op, expr, right, line=op.line)
+        return expr
+
+    # The same precedence climbing as pratt_expr(), but every pending prefix
+    # operator, infix operator, parenthesis and call argument list is pushed on an
+    # explicit stack instead of the Python call stack, together with the binding
+    # power to restore once its operand is complete.
+    def stack_expr(self):
+        pending = []
+        min_bp = BP_OR
+        while True:
+            # Parse an operand: a prefix operator, "(", a call or a plain primary
+            token = self.current
+            token_type = token.token_type if token is not None else None
+            if token_type in PREFIX_OPERATORS and min_bp <= BP_UNARY:
+                self.advance()
+                pending.append((UnOp, token, min_bp))
+                min_bp = BP_UNARY
+                continue
+            elif token_type == TokenType.LPAREN:
+                self.advance()
+                pending.append((Grouping, token, min_bp))
+                min_bp = BP_OR
+                continue
+            elif token_type == TokenType.IDENTIFIER:
+                self.advance()
+                if self.match(TokenType.LPAREN):
+                    if not self.is_next(TokenType.RPAREN):
+                        pending.append((FuncCall, (token, []), min_bp))
+                        min_bp = BP_OR
+                        continue
+                    self.expect(TokenType.RPAREN)
+                    expr = FuncCall(token.lexeme, [], line=self.previous_token().line)
+                else:
+                    expr = Identifier(token.lexeme, line=token.line)
+            else:
+                expr = self.primary()  # a literal (or a parse error)
+
+            # Extend the operand with infix operators, or hand it back to whatever
+            # is waiting for it on the stack
+            while True:
+                op = self.current
+                infix = INFIX_OPERATORS.get(op.token_type) if op is not None else None
+                if infix is not None and infix[0] >= min_bp:
+                    bp, node_class = infix
+                    self.advance()
+                    pending.append((node_class, (op, expr), min_bp))
+                    if op.token_type in RIGHT_ASSOCIATIVE:
+                        min_bp = bp
+                    else:
+                        min_bp = bp + 1
+                    break
+                if not pending:
+                    return expr
+                node_class, data, min_bp = pending.pop()
+                if node_class is UnOp:
+                    expr = UnOp(data, expr, line=data.line)
+                elif node_class is Grouping:
+                    if not self.match(TokenType.RPAREN):
+                        parse_error(f'Error: ")" expected.', self.previous_token().line)
+                    expr = Grouping(expr, line=self.previous_token().line)
+                elif node_class is FuncCall:
+                    identifier, args = data
+                    args.append(expr)
+                    if not self.is_next(TokenType.RPAREN):
+                        self.expect(TokenType.COMMA)
+                    if not self.is_next(TokenType.RPAREN):
+                        pending.append((FuncCall, data, min_bp))
+                        min_bp = BP_OR
+                        break
+                    self.expect(TokenType.RPAREN)
+                    expr = FuncCall(
+                        identifier.lexeme, args, line=self.previous_token().line
+                    )
+                else:
+                    op, left = data
+                    expr = node_class(op, left, expr, line=op.line)
+
     def expr(self):
+        if self.mode == "pratt":
+            return self.pratt_expr()
+        elif self.mode == "stack":
+            return self.stack_expr()
         return self.logical_or()
 
     # <print_stmt>  ::=  ( "print" | "println" ) <expr>
@@ -210,7 +374,7 @@ class Parser:
         self.expect(TokenType.END)
         return WhileStmt(test, while_stmts, line=self.previous_token().line)
 
-    def for_stmt(self):
+    def for_header(self):
         self.expect(TokenType.FOR)
         identifier = self.primary()
         self.expect(TokenType.ASSIGN)
@@ -223,6 +387,10 @@ class Parser:
         else:
             step = None
         self.expect(TokenType.DO)
+        return identifier, start, end, step
+
+    def for_stmt(self):
+        identifier, start, end, step = self.for_header()
         for_stmts = self.stmts()
         self.expect(TokenType.END)
         return ForStmt(
@@ -256,12 +424,16 @@ class Parser:
                 self.expect(TokenType.COMMA)
         return params
 
-    def func_decl(self):
+    def func_header(self):
         self.expect(TokenType.FUNC)
         name = self.expect(TokenType.IDENTIFIER)
         self.expect(TokenType.LPAREN)
         params = self.params()
         self.expect(TokenType.RPAREN)
+        return name, params
+
+    def func_decl(self):
+        name, params = self.func_header()
         body_stmts = self.stmts()
         self.expect(TokenType.END)
         return FuncDecl(
@@ -309,7 +481,7 @@ class Parser:
         stmts = []
         # Loop all statements of the current block (meaning until we find an "end", or "else", or EOF
         while (
-            self.curr < len(self.tokens)
+            not self.is_at_end()
             and not self.is_next(TokenType.ELSE)
             and not self.is_next(TokenType.END)
         ):
@@ -320,6 +492,70 @@ class Parser:
     def program(self):
         return self.stmts()
 
+    def stack_program(self):
+        """
+        Parse the program without recursing into nested blocks: every open
+        if/else/while/for/func block waits on an explicit stack, together with the
+        statement list it will be appended to once its "end" is found.
+        """
+        blocks = []
+        stmts = []
+        while True:
+            token = self.current
+            if (
+                token is None
+                or token.token_type == TokenType.ELSE
+                or token.token_type == TokenType.END
+            ):
+                block = Stmts(stmts, line=self.previous_token().line)
+                if not blocks:
+                    return block
+                kind, header, stmts = blocks.pop()
+                if kind == TokenType.IF and self.is_next(TokenType.ELSE):
+                    self.advance()  # consume the else
+                    blocks.append((TokenType.ELSE, (header, block), stmts))
+                    stmts = []
+                    continue
+                self.expect(TokenType.END)
+                line = self.previous_token().line
+                if kind == TokenType.IF:
+                    stmts.append(IfStmt(header, block, None, line=line))
+                elif kind == TokenType.ELSE:
+                    test, then_stmts = header
+                    stmts.append(IfStmt(test, then_stmts, block, line=line))
+                elif kind == TokenType.WHILE:
+                    stmts.append(WhileStmt(header, block, line=line))
+                elif kind == TokenType.FOR:
+                    identifier, start, end, step = header
+                    stmt = ForStmt(identifier, start, end, step, block, line=line)
+                    stmts.append(stmt)
+                else:
+                    name, params = header
+                    stmts.append(FuncDecl(name.lexeme, params, block, line=line))
+
+            elif token.token_type == TokenType.IF:
+                self.expect(TokenType.IF)
+                test = self.expr()
+                self.expect(TokenType.THEN)
+                blocks.append((TokenType.IF, test, stmts))
+                stmts = []
+            elif token.token_type == TokenType.WHILE:
+                self.expect(TokenType.WHILE)
+                test = self.expr()
+                self.expect(TokenType.DO)
+                blocks.append((TokenType.WHILE, test, stmts))
+                stmts = []
+            elif token.token_type == TokenType.FOR:
+                blocks.append((TokenType.FOR, self.for_header(), stmts))
+                stmts = []
+            elif token.token_type == TokenType.FUNC:
+                blocks.append((TokenType.FUNC, self.func_header(), stmts))
+                stmts = []
+            else:
+                stmts.append(self.stmt())
+
     def parse(self):
+        if self.mode == "stack":
+            return self.stack_program()
         ast = self.program()
         return ast
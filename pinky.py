@@ -1,65 +1,213 @@
+import argparse
+import json
 import sys
 from interpreter import Interpreter
+from closures import ClosureCompiler
+from machine import Machine
+from resolver import ResolvedInterpreter
+from unboxed import UnboxedInterpreter
+from memo import MemoizingInterpreter
 from parser import Parser
+from model import verify_ast
 from tokens import *
 from lexer import *
 from utils import Colors, pretty_print_ast
 from compiler import *
 from vm import *
+from cache import load_program
+from output import FLUSH_POLICIES, Output
+from optimizer import MAX_LEVEL, optimize
+from profiler import ProfilingInterpreter, ProfilingVM
+from governor import Governor, GovernedInterpreter, GovernedVM, LimitExceeded
+from batch import collect_scripts, run_batch
 
 VERBOSE = True
+CACHE = True  # Reuse the compiled program from __pinkycache__ when not verbose
 
-if __name__ == "__main__":
-    if len(sys.argv) != 2:
-        raise SystemExit("Usage: python3 pinky.py <filename>")
+# Ways of running the AST, selected with --backend
+BACKENDS = {
+    "tree": Interpreter,  # the tree-walking interpreter
+    "closures": ClosureCompiler,  # compiles the AST to Python closures first
+    "machine": Machine,  # explicit stacks, for very deeply nested programs
+    "resolved": ResolvedInterpreter,  # names resolved to frame slots up front
+    "unboxed": UnboxedInterpreter,  # plain floats/strings/bools, no type tuples
+    "memo": MemoizingInterpreter,  # caches the results of pure functions
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run a Pinky script")
+    parser.add_argument("filename", nargs="?")
+    parser.add_argument(
+        "--batch",
+        metavar="DIR_OR_LIST",
+        help="run every script in a directory (or listed in a file) and print a "
+        "JSON report",
+    )
+    parser.add_argument(
+        "-j", "--jobs", type=int, help="worker processes for --batch (default: cores)"
+    )
+    parser.add_argument("--backend", choices=list(BACKENDS), default="tree")
+    parser.add_argument(
+        "-O",
+        dest="optimize",
+        type=int,
+        choices=range(MAX_LEVEL + 1),
+        default=0,
+        help="optimization level (see optimizer.py)",
+    )
+    parser.add_argument("--output", help="write the program's output to this file")
+    parser.add_argument(
+        "--flush",
+        choices=FLUSH_POLICIES,
+        help="when to write out buffered output (default: line on a terminal)",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="profile the run (tree backend) and print a report to stderr",
+    )
+    parser.add_argument("--profile-json", help="also save the profile as JSON here")
+    parser.add_argument(
+        "--profile-stacks", help="also save collapsed stacks (for flamegraphs) here"
+    )
+    parser.add_argument(
+        "--max-steps",
+        type=int,
+        help="fuel: blocks the interpreter may run (and VM instructions)",
+    )
+    parser.add_argument("--timeout", type=float, help="wall-clock limit in seconds")
+    parser.add_argument(
+        "--max-memory", type=int, help="how many MB the process may grow while running"
+    )
+    parser.add_argument(
+        "--verbose",
+        action=argparse.BooleanOptionalAction,
+        default=VERBOSE,
+        help="print the source, tokens, AST and bytecode",
+    )
+    args = parser.parse_args(argv)
+    args.profile = args.profile or bool(args.profile_json or args.profile_stacks)
+    if args.profile and args.backend != "tree":
+        parser.error("--profile only works with --backend tree")
+    governor = None
+    limits = None
+    if args.max_steps is not None or args.timeout is not None or args.max_memory:
+        if args.backend != "tree" or args.profile:
+            parser.error("resource limits only work with --backend tree")
+        memory = args.max_memory * 1024**2 if args.max_memory else None
+        limits = {"fuel": args.max_steps, "seconds": args.timeout, "memory": memory}
+        governor = Governor(**limits)
 
-    filename = sys.argv[1]
-    with open(filename) as file:
-        source = file.read()
+    if args.batch:
+        report = run_batch(
+            collect_scripts(args.batch), args.jobs, args.optimize, limits
+        )
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        sys.exit(1 if report["failed"] else 0)
+    if args.filename is None:
+        parser.error("a script to run (or --batch) is required")
+
+    filename = args.filename
+    if args.verbose:
+        with open(filename) as file:
+            source = file.read()
         tokens = Lexer(source).tokenize()
-        ast = Parser(tokens).parse()
-
-        if VERBOSE:
-            print(f"{Colors.GREEN}**************************************")
-            print(f"{Colors.GREEN}SOURCE:{Colors.WHITE}")
-            print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
-            print("")
-
-            print(source)
-
-            print("")
-            print(f"{Colors.GREEN}**************************************")
-            print(f"{Colors.GREEN}TOKENS:{Colors.WHITE}")
-            print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
-
-            for token in tokens:
-                print(token)
-
-            print("")
-            print(f"{Colors.GREEN}**************************************")
-            print(f"{Colors.GREEN}AST:{Colors.WHITE}")
-            print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
-            ast = Parser(tokens).parse()
-            pretty_print_ast(ast)
-
-        if VERBOSE:
-            print("")
-            print(f"{Colors.GREEN}**************************************")
-            print(f"{Colors.GREEN}INTERPRETER:{Colors.WHITE}")
-            print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
-
-        interpreter = Interpreter()
+        ast = optimize(verify_ast(Parser(tokens).parse()), args.optimize)
+        code = Compiler().compile_code(ast)
+    elif CACHE:
+        # Skips the lexer, parser and compiler when this source was seen before
+        ast, code = load_program(filename, optimize_level=args.optimize)
+    else:
+        with open(filename) as file:
+            # Stream tokens straight from the file into the parser
+            ast = Parser(Lexer(file, mode="regex").iter_tokens()).parse()
+        ast = optimize(ast, args.optimize)
+        code = Compiler().compile_code(ast)
+
+    if args.verbose:
+        print(f"{Colors.GREEN}**************************************")
+        print(f"{Colors.GREEN}SOURCE:{Colors.WHITE}")
+        print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
+        print("")
+
+        print(source)
+
+        print("")
+        print(f"{Colors.GREEN}**************************************")
+        print(f"{Colors.GREEN}TOKENS:{Colors.WHITE}")
+        print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
+
+        for token in tokens:
+            print(token)
+
+        print("")
+        print(f"{Colors.GREEN}**************************************")
+        print(f"{Colors.GREEN}AST:{Colors.WHITE}")
+        print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
+        pretty_print_ast(ast)
+
+    if args.verbose:
+        print("")
+        print(f"{Colors.GREEN}**************************************")
+        print(f"{Colors.GREEN}INTERPRETER:{Colors.WHITE}")
+        print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
+
+    if args.output:
+        output = Output.to_file(args.output, flush=args.flush or "full")
+    else:
+        output = Output(flush=args.flush)
+
+    if args.profile:
+        interpreter = ProfilingInterpreter(output=output)
+    elif governor is not None:
+        interpreter = GovernedInterpreter(governor, output=output)
+    else:
+        interpreter = BACKENDS[args.backend](output=output)
+    try:
         interpreter.interpret_ast(ast)
+    except LimitExceeded as e:
+        print(f"{Colors.RED}{e}{Colors.WHITE}")
+        sys.exit(1)
+
+    if args.profile:
+        profile = interpreter.profile
+        sys.stderr.write(profile.report())
+        if args.profile_json:
+            profile.write_json(args.profile_json)
+        if args.profile_stacks:
+            profile.write_collapsed(args.profile_stacks)
+
+    if args.verbose:
+        print("")
+        print(f"{Colors.GREEN}**************************************")
+        print(f"{Colors.GREEN}CODE GENERATION:{Colors.WHITE}")
+        print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
 
-        if VERBOSE:
-            print("")
-            print(f"{Colors.GREEN}**************************************")
-            print(f"{Colors.GREEN}CODE GENERATION:{Colors.WHITE}")
-            print(f"{Colors.GREEN}**************************************{Colors.WHITE}")
+    if args.backend == "unboxed":
+        # The cached bytecode pushes (TYPE_*, value) tuples, UnboxedVM wants bare values
+        code = Compiler(unboxed=True).compile_code(ast)
+        vm = UnboxedVM(output)
+    elif args.profile:
+        vm = ProfilingVM(output)
+    elif governor is not None:
+        vm = GovernedVM(governor, output)
+    else:
+        vm = VM(output)
 
-        compiler = Compiler()
-        code = compiler.compile_code(ast)
-        compiler.print_code()
+    print_code(code)
 
-        vm = VM()
+    try:
         vm.run(code)
+    except LimitExceeded as e:
+        print(f"{Colors.RED}{e}{Colors.WHITE}")
+        sys.exit(1)
+    output.close()
+
+    if args.profile:
+        sys.stderr.write("\n" + vm.report())
+
+
+if __name__ == "__main__":
+    main()
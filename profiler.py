@@ -0,0 +1,232 @@
+"""
+Profiling Pinky programs.
+
+ProfilingInterpreter records how many times each source line's statements run
+and, for every Pinky function, how many calls it got and the time spent in it:
+cumulative (including the functions it calls, counted once for recursive
+calls) and self (excluding them). Self time is also kept per call stack, which
+is the collapsed-stack format flamegraph tools read:
+
+    <main>;outer;inner 1234      (microseconds)
+
+ProfilingVM does the same for bytecode, per instruction and per opcode.
+
+Profiling costs nothing when it is off: the plain Interpreter and VM have no
+profiling checks at all. ProfilingInterpreter wraps the statement handlers in
+its own handler table instead (see Interpreter.handler_for), so only a
+profiled run pays for the counting.
+"""
+
+import json
+import time
+from collections import Counter
+from interpreter import *
+from vm import VM
+
+MAIN = "<main>"  # the stack frame of the top-level statements
+
+
+class FunctionStats:
+    __slots__ = ("calls", "cumulative", "self_time", "active")
+
+    def __init__(self):
+        self.calls = 0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+        # Calls of this function currently on the stack, so that the cumulative
+        # time of a recursive function only counts the outermost call
+        self.active = 0
+
+
+class Profile:
+    def __init__(self):
+        # Source line -> statements run on it
+        self.line_hits = Counter()
+        # Function name -> FunctionStats
+        self.functions = {}
+        # Call stack (tuple of names) -> self time in seconds
+        self.stacks = Counter()
+        # Inline cache statistics of the interpreter (see lookup_function)
+        self.call_cache = {}
+
+    def function(self, name):
+        try:
+            return self.functions[name]
+        except KeyError:
+            stats = self.functions[name] = FunctionStats()
+            return stats
+
+    def report(self, limit=20):
+        """
+        A human readable summary: the busiest functions and lines
+        """
+        lines = [
+            f"{'function':<20} {'calls':>9} {'cumulative s':>13} {'self s':>9}",
+        ]
+        functions = sorted(
+            self.functions.items(), key=lambda item: item[1].self_time, reverse=True
+        )
+        for name, stats in functions[:limit]:
+            lines.append(
+                f"{name:<20} {stats.calls:>9} {stats.cumulative:>13.6f} "
+                f"{stats.self_time:>9.6f}"
+            )
+        lines.append("")
+        lines.append(f"{'line':>6} {'hits':>10}")
+        for line, hits in self.line_hits.most_common(limit):
+            lines.append(f"{line:>6} {hits:>10}")
+        if self.call_cache:
+            lines.append("")
+            lines.append(
+                f"call site caches: {self.call_cache['hits']} hits, "
+                f"{self.call_cache['misses']} misses "
+                f"({self.call_cache['hit_rate']:.1%} hit rate)"
+            )
+        return "\n".join(lines) + "\n"
+
+    def collapsed(self):
+        """
+        Self time per call stack, one `frame;frame;frame microseconds` per line
+        """
+        return "".join(
+            f"{';'.join(stack)} {round(seconds * 1e6)}\n"
+            for stack, seconds in sorted(self.stacks.items())
+        )
+
+    def to_json(self):
+        return {
+            "lines": {str(line): hits for line, hits in sorted(self.line_hits.items())},
+            "functions": {
+                name: {
+                    "calls": stats.calls,
+                    "cumulative": stats.cumulative,
+                    "self": stats.self_time,
+                }
+                for name, stats in self.functions.items()
+            },
+            "stacks": {";".join(stack): seconds for stack, seconds in self.stacks.items()},
+            "call_cache": self.call_cache,
+        }
+
+    def write_json(self, filename):
+        with open(filename, "w") as file:
+            json.dump(self.to_json(), file, indent=2)
+
+    def write_collapsed(self, filename):
+        with open(filename, "w") as file:
+            file.write(self.collapsed())
+
+
+class ProfilingInterpreter(Interpreter):
+    def __init__(self, output=None, profile=None):
+        super().__init__(output)
+        self.profile = Profile() if profile is None else profile
+        # One [name, start time, time spent in callees] per active call
+        self.frames = []
+
+    def handler_for(self, node_class):
+        handler = super().handler_for(node_class)
+        if not issubclass(node_class, Stmt):
+            return handler
+        line_hits = self.profile.line_hits
+        if node_class is FuncCallStmt:
+
+            def counted(node, env):
+                line_hits[node.expr.line] += 1
+                return handler(node, env)
+
+        else:
+
+            def counted(node, env):
+                line_hits[node.line] += 1
+                return handler(node, env)
+
+        self.handlers[node_class] = counted
+        return counted
+
+    def interpret_ast(self, node, env=None):
+        self.frames = [[MAIN, time.perf_counter(), 0.0]]
+        try:
+            return super().interpret_ast(node, env)
+        finally:
+            name, start, callees = self.frames.pop()
+            self.profile.stacks[(MAIN,)] += time.perf_counter() - start - callees
+            self.profile.call_cache = self.call_cache_stats()
+
+    def interpret_FuncCall(self, node, env):
+        # Same as Interpreter.interpret_FuncCall, with only the body timed
+        func_decl, func_env = self.lookup_function(node, env)
+        args = [self.interpret(arg, env) for arg in node.args]
+        new_func_env = self.new_call_env(func_decl, func_env, args)
+
+        stats = self.profile.function(func_decl.name)
+        stats.calls += 1
+        stats.active += 1
+        frame = [func_decl.name, time.perf_counter(), 0.0]
+        self.frames.append(frame)
+        try:
+            signal = self.interpret(func_decl.body_stmts, new_func_env)
+        finally:
+            elapsed = time.perf_counter() - frame[1]
+            self.frames.pop()
+            stats.active -= 1
+            if stats.active == 0:
+                stats.cumulative += elapsed
+            self_time = elapsed - frame[2]
+            stats.self_time += self_time
+            stack = tuple(name for name, _, _ in self.frames) + (func_decl.name,)
+            self.profile.stacks[stack] += self_time
+            self.frames[-1][2] += elapsed
+        if signal is not None:
+            return signal.value
+
+
+class ProfilingVM(VM):
+    """
+    VM that counts and times every instruction it runs, per pc and per opcode
+    """
+
+    def __init__(self, output=None):
+        super().__init__(output)
+        # pc -> times run
+        self.pc_hits = Counter()
+        # opcode -> [times run, seconds]
+        self.opcodes = {}
+
+    def run(self, instructions):
+        self.pc = 0
+        self.is_running = True
+        pc_hits = self.pc_hits
+        opcodes = self.opcodes
+        clock = time.perf_counter
+        try:
+            while self.is_running:
+                pc = self.pc
+                opcode, *args = instructions[pc]
+                self.pc = pc + 1
+                start = clock()
+                getattr(self, opcode)(*args)
+                elapsed = clock() - start
+                pc_hits[pc] += 1
+                stats = opcodes.setdefault(opcode, [0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+        finally:
+            self.output.flush()
+
+    def report(self):
+        lines = [f"{'opcode':<10} {'count':>10} {'seconds':>10}"]
+        for opcode, (count, seconds) in sorted(
+            self.opcodes.items(), key=lambda item: item[1][1], reverse=True
+        ):
+            lines.append(f"{opcode:<10} {count:>10} {seconds:>10.6f}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        return {
+            "pcs": {str(pc): hits for pc, hits in sorted(self.pc_hits.items())},
+            "opcodes": {
+                opcode: {"count": count, "seconds": seconds}
+                for opcode, (count, seconds) in self.opcodes.items()
+            },
+        }
@@ -0,0 +1,127 @@
+"""
+Embedding Pinky in Python.
+
+    from program import compile
+
+    rule = compile(source)  # lex, parse and optimize once
+    for order in orders:
+        discount = rule.run(globals={"total": order.total, "country": order.country})
+
+compile() runs the front-end and the optimizer once and returns a Program
+holding the AST. A Program cannot be changed after it is made, so it can be
+kept around and shared, and every run() starts from the same prepared tree
+instead of going through the lexer and parser again. Nothing a run does is
+kept in the tree (the call-site caches live in the Interpreter, for the length
+of a run, see Interpreter.lookup_function), so threads can run the same
+Program at once. Programs run on the tree-walking Interpreter: the bytecode VM
+only covers expressions and print.
+
+Each run gets a fresh global environment, with `globals` bound in it. Values
+cross between Python and Pinky as float (ints are converted), str and bool.
+run() returns the value of the program's top-level `ret` statement, or None if
+it finishes without one. Errors are reported as pinky.py reports them.
+
+Runs reuse one Interpreter per thread, so its handler table (see
+Interpreter.handler_for) is only filled in once.
+"""
+
+import threading
+from lexer import Lexer
+from parser import Parser
+from optimizer import optimize as optimize_ast
+from interpreter import TYPE_BOOL, TYPE_NUMBER, TYPE_STRING, Interpreter
+from output import Output
+from governor import GovernedInterpreter
+from state import Environment
+
+
+# Per-thread state: the Interpreter that ungoverned runs reuse
+local = threading.local()
+
+
+def to_pinky(value):
+    """
+    Python value -> boxed runtime value
+    """
+    if isinstance(value, bool):
+        return (TYPE_BOOL, value)
+    if isinstance(value, (int, float)):
+        return (TYPE_NUMBER, float(value))
+    if isinstance(value, str):
+        return (TYPE_STRING, value)
+    raise TypeError(f"Pinky has no values of type {type(value).__name__}.")
+
+
+def to_python(value):
+    """
+    Boxed runtime value -> Python value
+    """
+    if value is None:
+        return None
+    valtype, val = value
+    if valtype == TYPE_STRING:
+        return str(val)  # a Rope becomes the str it stands for
+    return val
+
+
+class Program:
+    __slots__ = ("source", "ast", "optimize_level")
+
+    def __init__(self, source, ast, optimize_level=0):
+        set_slot = object.__setattr__
+        set_slot(self, "source", source)
+        set_slot(self, "ast", ast)
+        set_slot(self, "optimize_level", optimize_level)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("Program objects are immutable.")
+
+    def __delattr__(self, name):
+        raise AttributeError("Program objects are immutable.")
+
+    def __repr__(self):
+        return f"<Program {len(self.source)} characters, -O{self.optimize_level}>"
+
+    def new_env(self, globals=None):
+        """
+        A fresh global environment for a run, with the globals bound in it
+        """
+        env = Environment()
+        if globals:
+            env.vars.update((name, to_pinky(value)) for name, value in globals.items())
+        return env
+
+    def run(self, globals=None, output=None, governor=None):
+        """
+        Run the program and return the value of its top-level ret. The program
+        prints to `output` (an Output, stdout if it is None); a Governor limits
+        what the run may use (see governor.py).
+        """
+        env = self.new_env(globals)
+        if governor is None:
+            interpreter = getattr(local, "interpreter", None)
+            if interpreter is None:
+                interpreter = local.interpreter = Interpreter()
+            interpreter.output = Output() if output is None else output
+        else:
+            interpreter = GovernedInterpreter(governor, output)
+        return to_python(interpreter.interpret_ast(self.ast, env))
+
+    def run_to_string(self, globals=None, governor=None):
+        """
+        Run the program and return (result, everything it printed)
+        """
+        output = Output.in_memory()
+        result = self.run(globals, output, governor)
+        return result, output.getvalue()
+
+
+def compile(source, optimize=0):
+    """
+    Prepare a Program from Pinky source (str or UTF-8 bytes), optimized at the
+    given level (see optimizer.py)
+    """
+    if isinstance(source, bytes):
+        source = source.decode("utf-8")
+    ast = Parser(Lexer(source, mode="regex").iter_tokens()).parse()
+    return Program(source, optimize_ast(ast, optimize), optimize)
@@ -0,0 +1,337 @@
+"""
+Static scope resolution.
+
+Environment looks every name up by walking the chain of parent scopes with a
+dict lookup per level. The Resolver works out once, before the program runs,
+where each name can live: every block that introduces a scope (the program, a
+function body, and the then/else/loop bodies) gets an array of slots, and every
+Identifier, Assignment, LocalAssignment, ForStmt and FuncCall is annotated with
+the (level, slot) pairs it has to look at. ResolvedInterpreter then runs the
+program on Frame arrays instead of Environment dicts.
+
+Pinky decides at runtime whether `x := 1` updates an existing x further out or
+creates a new one in the current block, so an address is a short tuple of
+candidate slots, innermost first, rather than a single slot. The resolver keeps
+it short by tracking which names are definitely bound at each point: the search
+stops at the first scope where the name is known to exist, and an assignment to
+a name that is known to exist further out does not get a slot in its block. For
+the usual programs (globals, params, locals and loop variables) that leaves one
+candidate, so a lookup is display[level][slot] whatever the nesting depth.
+"""
+
+from interpreter import *
+
+VAR = 0
+FUNC = 1
+
+
+class Scope:
+    """
+    What the resolver knows about one block while resolving it
+    """
+
+    __slots__ = ("level", "names", "bound", "reachable", "size")
+
+    def __init__(self, level):
+        self.level = level
+        # (VAR|FUNC, name) -> slot, for every name that may live in this block
+        self.names = {}
+        # Names definitely stored in this block at the current point
+        self.bound = set()
+        # Names definitely found from this block (here or further out)
+        self.reachable = set()
+        self.size = 0
+
+    def declare(self, key):
+        if key not in self.names:
+            self.names[key] = self.size
+            self.size += 1
+        return self.names[key]
+
+
+class Resolver:
+    def __init__(self):
+        self.scopes = []
+        # Node class -> bound resolve_<NodeClass> method
+        self.handlers = {}
+
+    def resolve_program(self, node, params=()):
+        """
+        Resolve a program, with `params` (Param nodes) as names that are bound
+        before it starts, such as the globals a caller brings
+        """
+        self.resolve_block(node, params, top_level=True)
+        return node
+
+    def resolve(self, node):
+        try:
+            handler = self.handlers[node.__class__]
+        except KeyError:
+            handler = getattr(
+                self, "resolve_" + node.__class__.__name__, self.resolve_children
+            )
+            self.handlers[node.__class__] = handler
+        handler(node)
+
+    def resolve_children(self, node):
+        for child in iter_child_nodes(node):
+            self.resolve(child)
+
+    ###########################################################################
+    # Scopes
+    ###########################################################################
+    def is_reachable(self, key):
+        """
+        Is the name definitely found by a lookup from the current point?
+        """
+        for scope in self.scopes:
+            if key in scope.bound or key in scope.reachable:
+                return True
+        return False
+
+    def address(self, key):
+        """
+        The candidate (level, slot) pairs for a name, innermost first, and whether
+        the last one is certain to hold it
+        """
+        candidates = []
+        for scope in reversed(self.scopes):
+            slot = scope.names.get(key)
+            if slot is not None:
+                candidates.append((scope.level, slot))
+                if key in scope.bound:
+                    return tuple(candidates), True
+        return tuple(candidates), False
+
+    def resolve_block(self, block, params=(), top_level=False):
+        if top_level:
+            level = 0
+        else:
+            level = self.scopes[-1].level + 1
+        scope = Scope(level)
+        for param in params:
+            param.slot = scope.declare((VAR, param.name))
+            scope.bound.add((VAR, param.name))
+        # Hoist every name the block may store, so its frame can be sized up front
+        for stmt in block.stmts:
+            if isinstance(stmt, LocalAssignment):
+                scope.declare((VAR, stmt.left.name))
+            elif isinstance(stmt, Assignment):
+                if not self.is_reachable((VAR, stmt.left.name)):
+                    scope.declare((VAR, stmt.left.name))
+            elif isinstance(stmt, ForStmt):
+                if not self.is_reachable((VAR, stmt.ident.name)):
+                    scope.declare((VAR, stmt.ident.name))
+            elif isinstance(stmt, FuncDecl):
+                scope.declare((FUNC, stmt.name))
+        if scope.size == 0 and not top_level:
+            # Nothing lives here, so the block runs in the enclosing frame
+            scope.level -= 1
+        block.size = scope.size
+
+        self.scopes.append(scope)
+        for stmt in block.stmts:
+            self.resolve(stmt)
+        self.scopes.pop()
+
+    def assign(self, key):
+        """
+        Resolve a store that updates the innermost existing name or creates it in
+        the current block. Returns (address, slot to create it in or None).
+        """
+        scope = self.scopes[-1]
+        address, found = self.address(key)
+        if found or self.is_reachable(key):
+            return address, None
+        slot = scope.names[key]
+        if len(address) == 1:
+            # Nowhere else to go: from now on it lives in this block
+            scope.bound.add(key)
+        else:
+            scope.reachable.add(key)
+        return address, slot
+
+    ###########################################################################
+    # Nodes
+    ###########################################################################
+    def resolve_Identifier(self, node):
+        node.address = self.address((VAR, node.name))[0]
+
+    def resolve_Assignment(self, node):
+        self.resolve(node.right)
+        node.address, node.slot = self.assign((VAR, node.left.name))
+
+    def resolve_LocalAssignment(self, node):
+        self.resolve(node.right)
+        scope = self.scopes[-1]
+        node.slot = scope.names[(VAR, node.left.name)]
+        scope.bound.add((VAR, node.left.name))
+
+    def resolve_IfStmt(self, node):
+        self.resolve(node.test)
+        self.resolve_block(node.then_stmts)
+        if node.else_stmts is not None:
+            self.resolve_block(node.else_stmts)
+
+    def resolve_WhileStmt(self, node):
+        self.resolve(node.test)
+        self.resolve_block(node.body_stmts)
+
+    def resolve_ForStmt(self, node):
+        self.resolve(node.start)
+        self.resolve(node.end)
+        if node.step is not None:
+            self.resolve(node.step)
+        key = (VAR, node.ident.name)
+        scope = self.scopes[-1]
+        bound, reachable = set(scope.bound), set(scope.reachable)
+        # The loop variable is stored before every run of the body...
+        node.address, node.slot = self.assign(key)
+        self.resolve_block(node.body_stmts)
+        # ...but the body may not run at all
+        scope.bound, scope.reachable = bound, reachable
+
+    def resolve_FuncDecl(self, node):
+        scope = self.scopes[-1]
+        node.slot = scope.names[(FUNC, node.name)]
+        # The body only runs once the declaration has been executed
+        scope.bound.add((FUNC, node.name))
+        self.resolve_block(node.body_stmts, params=node.params)
+
+    def resolve_FuncCall(self, node):
+        for arg in node.args:
+            self.resolve(arg)
+        node.address = self.address((FUNC, node.name))[0]
+
+
+def lookup(frame, address):
+    """
+    The value in the innermost candidate slot that holds one, or None
+    """
+    display = frame.display
+    for level, slot in address:
+        value = display[level][slot]
+        if value is not None:
+            return value
+    return None
+
+
+def store(frame, address, slot, value):
+    display = frame.display
+    for level, index in address:
+        values = display[level]
+        if values[index] is not None:
+            values[index] = value
+            return
+    frame.values[slot] = value
+
+
+class ResolvedInterpreter(Interpreter):
+    """
+    Runs a resolved AST on Frame arrays. Everything apart from name lookups and
+    scope creation is inherited from Interpreter.
+    """
+
+    def interpret_ast(self, node, env=None):
+        # The variables of a caller's Environment get slots in the program's
+        # frame, like the parameters of a function
+        globals = {} if env is None else env.vars
+        params = [Param(name, 0) for name in globals]
+        Resolver().resolve_program(node, params)
+        frame = Frame(node.size)
+        for param in params:
+            frame.values[param.slot] = globals[param.name]
+        try:
+            signal = self.interpret(node, frame)
+        finally:
+            self.output.flush()
+        if signal is not None:
+            return signal.value
+
+    def interpret_Identifier(self, node, env):
+        value = lookup(env, node.address)
+        if value is None:
+            runtime_error(f"Undeclared identifier {node.name!r}", node.line)
+        if value[1] is None:
+            runtime_error(f"Uninitialized identifier {node.name!r}", node.line)
+        return value
+
+    def interpret_Assignment(self, node, env):
+        righttype, rightval = self.interpret(node.right, env)
+        store(env, node.address, node.slot, (righttype, rightval))
+
+    def interpret_LocalAssignment(self, node, env):
+        right_type, right_val = self.interpret(node.right, env)
+        env.values[node.slot] = (right_type, right_val)
+
+    def interpret_IfStmt(self, node, env):
+        testtype, testval = self.interpret(node.test, env)
+        if testtype != TYPE_BOOL:
+            runtime_error("Condition test is not a boolean expression.", node.line)
+        if testval:
+            block = node.then_stmts
+        elif node.else_stmts is not None:
+            block = node.else_stmts
+        else:
+            return None
+        return self.interpret(block, env.new_frame(block.size))
+
+    def interpret_WhileStmt(self, node, env):
+        new_env = env.new_frame(node.body_stmts.size)
+        while True:
+            testtype, testval = self.interpret(node.test, env)
+            if testtype != TYPE_BOOL:
+                runtime_error(f"While test is not a boolean expression.", node.line)
+            if not testval:
+                break
+            signal = self.interpret(node.body_stmts, new_env)
+            if signal is not None:
+                return signal
+
+    def interpret_ForStmt(self, node, env):
+        itype, i = self.interpret(node.start, env)
+        endtype, end = self.interpret(node.end, env)
+        block_new_env = env.new_frame(node.body_stmts.size)
+        if i < end:
+            if node.step is None:
+                step = 1
+            else:
+                steptype, step = self.interpret(node.step, env)
+            while i <= end:
+                store(env, node.address, node.slot, (TYPE_NUMBER, i))
+                signal = self.interpret(node.body_stmts, block_new_env)
+                if signal is not None:
+                    return signal
+                i = i + step
+        else:
+            if node.step is None:
+                step = -1
+            else:
+                steptype, step = self.interpret(node.step, env)
+            while i >= end:
+                store(env, node.address, node.slot, (TYPE_NUMBER, i))
+                signal = self.interpret(node.body_stmts, block_new_env)
+                if signal is not None:
+                    return signal
+                i = i + step
+
+    def interpret_FuncDecl(self, node, env):
+        env.values[node.slot] = (node, env)
+
+    def lookup_function(self, node, env):
+        func = lookup(env, node.address)
+        if not func:
+            runtime_error(f"Function {node.name!r} not declared.", node.line)
+        func_decl, func_env = func
+        if len(node.args) != len(func_decl.params):
+            runtime_error(
+                f"Function {func_decl.name!r} expected {len(func_decl.params)} params but {len(node.args)} args were passed.",
+                node.line,
+            )
+        return func_decl, func_env
+
+    def new_call_env(self, func_decl, func_env, args):
+        new_func_env = func_env.new_frame(func_decl.body_stmts.size)
+        for param, argval in zip(func_decl.params, args):
+            new_func_env.values[param.slot] = argval
+        return new_func_env
@@ -0,0 +1,93 @@
+"""
+Rope strings for repeated concatenation.
+
+`s := s + x` copies all of s into a new str, so building a long string in a
+loop takes time quadratic in its final length. Once a concatenation gets
+longer than ROPE_THRESHOLD characters its result is a Rope instead: the pieces
+in a list, joined into a str only when the value is printed, compared or
+hashed (and then only once).
+
+Appending to a Rope appends to its list in place and returns a new Rope that
+sees one more piece, so a loop of appends is amortized O(1) per append. The
+older Rope still only looks at the first `count` pieces; if it is appended to
+as well, it copies those first instead of sharing the list.
+
+Ropes are only ever the value half of a (TYPE_STRING, value) pair and behave
+like the str they stand for, so stringify(), comparisons and dict keys work on
+them unchanged.
+"""
+
+from utils import stringify
+
+ROPE_THRESHOLD = 256  # shorter concatenations stay plain str
+
+
+class Rope:
+    __slots__ = ("parts", "count", "length", "flat")
+
+    def __init__(self, parts, length):
+        self.parts = parts
+        self.count = len(parts)
+        self.length = length
+        self.flat = None
+
+    def append(self, text):
+        parts = self.parts
+        if len(parts) != self.count:
+            # A later Rope already appended to the shared list
+            parts = parts[: self.count]
+        parts.append(text)
+        return Rope(parts, self.length + len(text))
+
+    def __str__(self):
+        if self.flat is None:
+            if len(self.parts) == self.count:
+                self.flat = "".join(self.parts)
+            else:
+                self.flat = "".join(self.parts[: self.count])
+        return self.flat
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return f"Rope({str(self)!r})"
+
+    def __hash__(self):
+        return hash(str(self))
+
+    def __eq__(self, other):
+        if isinstance(other, (str, Rope)):
+            return str(self) == str(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, (str, Rope)):
+            return str(self) != str(other)
+        return NotImplemented
+
+    def __lt__(self, other):
+        return str(self) < str(other)
+
+    def __le__(self, other):
+        return str(self) <= str(other)
+
+    def __gt__(self, other):
+        return str(self) > str(other)
+
+    def __ge__(self, other):
+        return str(self) >= str(other)
+
+
+def concat(left, right):
+    """
+    The value of left + right when one of them is a string (str or Rope)
+    """
+    right = str(right) if type(right) is Rope else stringify(right)
+    if type(left) is Rope:
+        return left.append(right)
+    left = stringify(left)
+    length = len(left) + len(right)
+    if length < ROPE_THRESHOLD:
+        return left + right
+    return Rope([left, right], length)
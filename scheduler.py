@@ -0,0 +1,122 @@
+"""
+Running Pinky programs inside asyncio.
+
+Program.run() only returns when the program is done, so a long script run from
+a coroutine blocks the event loop for as long as it runs. Here programs run on
+the explicit-stack Machine instead, whose work and value stacks hold the whole
+state of a run between two steps. An Execution runs a program `quantum` steps
+at a time and can be picked up again later, which makes it easy to interleave:
+
+    result = await run_async(program, globals={"n": 10})
+
+runs the program as a coroutine that gives the event loop back every quantum
+steps, and
+
+    scheduler = Scheduler()
+    results = await asyncio.gather(
+        *(scheduler.submit(program, {"n": n}) for n in range(10_000))
+    )
+
+runs thousands of programs at once in one task. The scheduler gives each ready
+Execution one quantum in turn (round robin, so a long script cannot starve the
+short ones), and returns control to the event loop after every `slice_seconds`
+so other coroutines keep running too. Having one task step every Execution
+avoids going through the event loop once per quantum per program.
+"""
+
+import asyncio
+import time
+from collections import deque
+from machine import EVAL, Machine
+from program import to_python
+
+DEFAULT_QUANTUM = 1000  # Machine steps per turn
+DEFAULT_SLICE = 0.005  # seconds the scheduler runs before yielding to the loop
+
+
+class Execution:
+    """
+    A run of a Program that can be paused between any two steps
+    """
+
+    def __init__(self, program, globals=None, output=None):
+        self.machine = Machine(output)
+        self.work = [(EVAL, program.ast, program.new_env(globals))]
+        self.values = []
+        self.done = False
+
+    def step(self, quantum=DEFAULT_QUANTUM):
+        """
+        Run up to `quantum` steps, and return whether the program has finished
+        """
+        self.done = self.machine.execute(self.work, self.values, quantum)
+        if self.done:
+            self.machine.output.flush()
+        return self.done
+
+    @property
+    def result(self):
+        """
+        The value of the program's top-level ret, once it is done
+        """
+        if self.values:
+            return to_python(self.values[-1])
+
+
+async def run_async(program, globals=None, output=None, quantum=DEFAULT_QUANTUM):
+    """
+    Run a program without blocking the event loop for more than `quantum` steps
+    at a time, and return the value of its top-level ret
+    """
+    execution = Execution(program, globals, output)
+    while not execution.step(quantum):
+        await asyncio.sleep(0)
+    return execution.result
+
+
+class Scheduler:
+    def __init__(self, quantum=DEFAULT_QUANTUM, slice_seconds=DEFAULT_SLICE):
+        self.quantum = quantum
+        self.slice_seconds = slice_seconds
+        # (Execution, future for its result) waiting for their next turn
+        self.ready = deque()
+        # The task stepping the ready executions, while there are any
+        self.runner = None
+
+    def submit(self, program, globals=None, output=None):
+        """
+        Start running a program; the returned future gets its result
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.ready.append((Execution(program, globals, output), future))
+        if self.runner is None or self.runner.done():
+            self.runner = loop.create_task(self.run())
+        return future
+
+    async def run(self):
+        ready = self.ready
+        quantum = self.quantum
+        clock = time.monotonic
+        while ready:
+            deadline = clock() + self.slice_seconds
+            while ready and clock() < deadline:
+                execution, future = ready.popleft()
+                if future.cancelled():
+                    continue
+                try:
+                    done = execution.step(quantum)
+                except Exception as e:
+                    # Without this frame in the traceback: whoever gets the
+                    # exception may clear the traceback's frames, and this one
+                    # is still running
+                    future.set_exception(e.with_traceback(e.__traceback__.tb_next))
+                    continue
+                if done:
+                    future.set_result(execution.result)
+                else:
+                    ready.append((execution, future))
+            await asyncio.sleep(0)
+
+    def __len__(self):
+        return len(self.ready)
@@ -3,6 +3,20 @@ class Environment:
         self.vars = {}
         self.funcs = {}  # a dict to store the functions in the env
         self.parent = parent
+        # The global environment of the run. Its epoch is bumped by every
+        # set_func in the run, which makes every function lookup cached before
+        # it stale (see Interpreter.lookup_function); runs do not share it.
+        # The nearest environment with functions, from here up (None if there is
+        # none), is only known to be right while `stamp` is the current epoch.
+        if parent is None:
+            self.root, self.epoch = self, 0
+            self.func_owner, self.stamp = None, 0
+        else:
+            self.root = root = parent.root
+            if parent.funcs:
+                self.func_owner, self.stamp = parent, root.epoch
+            else:
+                self.func_owner, self.stamp = parent.func_owner, parent.stamp
 
     def get_var(self, name):
         """
@@ -29,6 +43,17 @@ class Environment:
             self = self.parent
         original_env.vars[name] = value
 
+    def scope_vars(self, name):
+        """
+        The vars dict of the innermost environment holding a variable, which is
+        where set_var would store it, or None
+        """
+        while self:
+            if name in self.vars:
+                return self.vars
+            self = self.parent
+        return None
+
     def set_local_var(self, name, value):
         """
         Sets a new variable in the current/immediate environment (shadowing any previous values of that variable name)
@@ -51,8 +76,21 @@ class Environment:
                 self = self.parent
         return None
 
+    def find_func_owner(self):
+        """
+        Walk up to the nearest environment with functions and remember it
+        """
+        owner = self
+        while owner is not None and not owner.funcs:
+            owner = owner.parent
+        self.func_owner, self.stamp = owner, self.root.epoch
+        return owner
+
     def set_func(self, name, value):
         self.funcs[name] = value
+        root = self.root
+        root.epoch += 1
+        self.func_owner, self.stamp = self, root.epoch
 
     def __repr__(self):
         print("Params")
@@ -64,3 +102,31 @@ class Environment:
         print("└──")
         for var in self.vars:
             print(f"     {var}")
+
+
+class Frame:
+    """
+    The environment of a program that went through resolver.py. Every name was
+    given a slot in the array of its enclosing block, so a frame is just that
+    array. The display holds the arrays of all the lexically enclosing frames,
+    indexed by nesting level, which makes a (level, slot) lookup two indexing
+    operations no matter how deeply the code is nested.
+    """
+
+    __slots__ = ("values", "display")
+
+    def __init__(self, size, parent=None):
+        self.values = [None] * size
+        if parent is None:
+            self.display = [self.values]
+        else:
+            self.display = parent.display + [self.values]
+
+    def new_frame(self, size):
+        """
+        The frame for a nested block. Blocks that declare nothing (size 0) were
+        not given a level by the resolver and simply run in this frame.
+        """
+        if size:
+            return Frame(size, self)
+        return self
@@ -0,0 +1,95 @@
+import os
+import tempfile
+import unittest
+import cache
+from cache import *
+
+SOURCE = b"""
+x := 1
+while x < 4 do
+  x := x + 1
+end
+println x * 2
+"""
+
+
+class TestProgramCache(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.tempdir.name, CACHE_DIR_NAME)
+        self.script = os.path.join(self.tempdir.name, "script.pinky")
+        with open(self.script, "wb") as file:
+            file.write(SOURCE)
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def test_miss_then_hit(self):
+        program_cache = ProgramCache(self.directory)
+        ast, code = load_program(self.script, program_cache)
+        cached_ast, cached_code = load_program(self.script, program_cache)
+        self.assertEqual((program_cache.misses, program_cache.hits), (1, 1))
+        self.assertEqual(repr(cached_ast), repr(ast))
+        self.assertEqual(cached_code, code)
+
+    def test_default_directory_is_next_to_script(self):
+        load_program(self.script)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_edited_source_misses(self):
+        program_cache = ProgramCache(self.directory)
+        self.assertIsNone(program_cache.load(SOURCE))
+        program_cache.store(SOURCE, *compile_source(SOURCE))
+        self.assertIsNone(program_cache.load(SOURCE + b"println 1\n"))
+        self.assertIsNotNone(program_cache.load(SOURCE))
+
+    def test_corrupt_entry_is_removed(self):
+        program_cache = ProgramCache(self.directory)
+        program_cache.store(SOURCE, *compile_source(SOURCE))
+        (path,) = [path for _, _, path in program_cache.entries()]
+        with open(path, "r+b") as file:
+            file.truncate(HEADER.size + 3)
+        self.assertIsNone(program_cache.load(SOURCE))
+        self.assertFalse(os.path.exists(path))
+
+    def test_other_compiler_version_misses(self):
+        program_cache = ProgramCache(self.directory)
+        program_cache.store(SOURCE, *compile_source(SOURCE))
+        old_version = cache.COMPILER_VERSION
+        cache.COMPILER_VERSION = old_version + 1
+        try:
+            self.assertIsNone(program_cache.load(SOURCE))
+        finally:
+            cache.COMPILER_VERSION = old_version
+
+    def test_other_optimization_level_misses(self):
+        load_program(self.script, ProgramCache(self.directory))
+        program_cache = ProgramCache(self.directory, optimize_level=2)
+        load_program(self.script, program_cache)
+        self.assertEqual((program_cache.misses, program_cache.hits), (1, 0))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_eviction_keeps_most_recent(self):
+        program_cache = ProgramCache(self.directory)
+        sources = [SOURCE + f"println {i}\n".encode() for i in range(4)]
+        for i, source in enumerate(sources):
+            program_cache.store(source, *compile_source(source))
+            path = program_cache.path(program_cache.digest(source))
+            os.utime(path, (i, i))
+        entry_size = max(size for _, size, _ in program_cache.entries())
+        program_cache.max_bytes = 2 * entry_size
+        program_cache.evict()
+        self.assertEqual(len(program_cache.entries()), 2)
+        self.assertIsNone(program_cache.load(sources[0]))
+        self.assertIsNotNone(program_cache.load(sources[3]))
+
+    def test_no_temporary_files_left(self):
+        program_cache = ProgramCache(self.directory)
+        program_cache.store(SOURCE, *compile_source(SOURCE))
+        self.assertEqual(
+            [name for name in os.listdir(self.directory) if name.endswith(".tmp")], []
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+import contextlib
+import io
+import mmap
+import tempfile
+import unittest
+import lexer
+from tokens import *
+from lexer import *
+
+PROGRAM = """
+func fib(n)
+  if n <= 1 then
+    ret n
+  end
+  ret fib(n - 1) + fib(n - 2)
+end
+
+for i := 1, 10 do
+  println fib(i) -- print the i-th fibonacci number
+end
+"""
+
+
+class TestRegexLexer(unittest.TestCase):
+    def assertSameTokens(self, source):
+        expected = Lexer(source).tokenize()
+        result = Lexer(source, mode="regex").tokenize()
+        self.assertEqual(repr(result), repr(expected))
+
+    def test_operators(self):
+        source = """( ) { } [ ] , . + - * / ^ % ; ? ~ > < = >= <= ~= == := :"""
+        self.assertSameTokens(source)
+
+    def test_numbers(self):
+        source = """1 23 4.5 6.78.9 10.x"""
+        self.assertSameTokens(source)
+
+    def test_strings(self):
+        source = """x := "hello" + 'world' + "it's" + 'say "hi"'"""
+        self.assertSameTokens(source)
+
+    def test_keywords_and_identifiers(self):
+        source = """if then else true false and or while do for func null end print println ret local _x x1 iff"""
+        self.assertSameTokens(source)
+
+    def test_comments_and_lines(self):
+        source = """x := 1 # comment\n-- another comment\ny := x-1\r\n\tprintln 'a\nb' z  \n  """
+        self.assertSameTokens(source)
+
+    def test_program(self):
+        self.assertSameTokens(PROGRAM)
+
+    def test_non_ascii(self):
+        # Digits and names are ASCII in both engines, whatever str.isdigit() says
+        self.assertSameTokens("x := 'é²' + 3")
+        for source in ("x := ²", "x := ٣", "café := 1", "x1² := 1"):
+            for mode in ("scan", "regex"):
+                with self.subTest(source, mode=mode):
+                    with contextlib.redirect_stdout(io.StringIO()) as output:
+                        with self.assertRaises(SystemExit):
+                            Lexer(source, mode=mode).tokenize()
+                    self.assertIn("Unexpected character", output.getvalue())
+
+    def test_token_types(self):
+        tokens = Lexer("""x := 2.5 >= 1""", mode="regex").tokenize()
+        self.assertEqual(
+            [token.token_type for token in tokens],
+            [TokenType.IDENTIFIER, TokenType.ASSIGN, TokenType.FLOAT, TokenType.GE, TokenType.INTEGER],
+        )
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            Lexer("1", mode="fast")
+
+
+class TestStreamingLexer(unittest.TestCase):
+    def setUp(self):
+        # Tiny chunks so that tokens straddle chunk boundaries
+        self.chunk_size = lexer.CHUNK_SIZE
+        lexer.CHUNK_SIZE = 3
+
+    def tearDown(self):
+        lexer.CHUNK_SIZE = self.chunk_size
+
+    def test_text_file(self):
+        source = PROGRAM + """x := 'a long string literal' + 12.75 # tail"""
+        expected = Lexer(source).tokenize()
+        result = list(Lexer(io.StringIO(source)).iter_tokens())
+        self.assertEqual(repr(result), repr(expected))
+
+    def test_binary_file(self):
+        source = """println 'héllo wörld' >= 'ü' -- unicode\nx := 1.5"""
+        expected = Lexer(source).tokenize()
+        result = list(Lexer(io.BytesIO(source.encode("utf-8"))).iter_tokens())
+        self.assertEqual(repr(result), repr(expected))
+
+    def test_mmap(self):
+        with tempfile.TemporaryFile() as file:
+            file.write(PROGRAM.encode("utf-8"))
+            file.flush()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                result = list(Lexer(source).iter_tokens())
+        self.assertEqual(repr(result), repr(Lexer(PROGRAM).tokenize()))
+
+    def test_iter_tokens_is_lazy(self):
+        tokens = Lexer(io.StringIO(PROGRAM)).iter_tokens()
+        self.assertEqual(next(tokens).token_type, TokenType.FUNC)
+        self.assertEqual(next(tokens).lexeme, "fib")
+
+
+class TestTokenBuffer(unittest.TestCase):
+    def test_same_tokens(self):
+        expected = Lexer(PROGRAM).tokenize()
+        tokens = Lexer(PROGRAM).tokenize_compact()
+        self.assertEqual(len(tokens), len(expected))
+        self.assertEqual(repr(list(tokens)), repr(expected))
+
+    def test_indexing(self):
+        tokens = Lexer("""x := 'abc' + 12""").tokenize_compact()
+        self.assertEqual(repr(tokens[2]), repr(Token(TokenType.STRING, "'abc'", 1)))
+        self.assertEqual(tokens.token_type(1), TokenType.ASSIGN)
+        self.assertEqual(tokens.lexeme(4), "12")
+        self.assertEqual(tokens.line(0), 1)
+
+    def test_token_has_no_dict(self):
+        token = Token(TokenType.PLUS, "+", 1)
+        self.assertFalse(hasattr(token, "__dict__"))
+
+
+if __name__ == "__main__":
+    unittest.main()
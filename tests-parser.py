@@ -0,0 +1,144 @@
+import io
+import unittest
+from tokens import *
+from lexer import *
+from parser import *
+
+PROGRAM = """
+func fib(n)
+  if n <= 1 then
+    ret n
+  else
+    ret fib(n - 1) + fib(n - 2)
+  end
+end
+
+x := 0
+while x < 10 do
+  local y := -x ^ 2 % 3 * 4 / 5
+  x := x + 1
+end
+
+for i := 10, 1, -1 do
+  println fib(i) >= 3 and ~(i == 4) or i ~= 2
+end
+"""
+
+
+class TestStreamingParser(unittest.TestCase):
+    def test_parse_token_stream(self):
+        expected = Parser(Lexer(PROGRAM).tokenize()).parse()
+        tokens = Lexer(io.StringIO(PROGRAM)).iter_tokens()
+        result = Parser(tokens).parse()
+        self.assertEqual(repr(result), repr(expected))
+
+    def test_parse_token_buffer(self):
+        expected = Parser(Lexer(PROGRAM).tokenize()).parse()
+        result = Parser(Lexer(PROGRAM).tokenize_compact()).parse()
+        self.assertEqual(repr(result), repr(expected))
+
+    def test_parse_generator_is_consumed_lazily(self):
+        tokens = Lexer(PROGRAM).iter_tokens()
+        parser = Parser(tokens)
+        self.assertEqual(parser.peek().token_type, TokenType.FUNC)
+        self.assertIsNone(parser.previous_token())
+
+
+class TestPrattParser(unittest.TestCase):
+    def assertSameTree(self, source):
+        expected = Parser(Lexer(source).tokenize(), mode="descent").parse()
+        for mode in ("pratt", "stack"):
+            result = Parser(Lexer(source).tokenize(), mode=mode).parse()
+            self.assertEqual(repr(result), repr(expected), mode)
+
+    def test_precedence(self):
+        self.assertSameTree("""x := 1 + 2 * 3 - 4 / 5 % 6 ^ 7""")
+
+    def test_associativity(self):
+        self.assertSameTree("""x := 1 - 2 - 3 + 2 ^ 3 ^ 2 / 4 / 5""")
+
+    def test_unary(self):
+        self.assertSameTree("""x := - - 2 ^ 2 * -3 % ~true + +4""")
+
+    def test_logical(self):
+        self.assertSameTree("""x := a or b and c == d ~= e or f < g and h >= i""")
+
+    def test_grouping_and_calls(self):
+        self.assertSameTree("""x := (1 + f(2, (3 - g()) * 4)) ^ (2 % h(x, y))""")
+
+    def test_program(self):
+        self.assertSameTree(PROGRAM)
+
+    def test_blocks(self):
+        self.assertSameTree(
+            """
+if a then if b then x := f() else y := g(1,) end else while c do z := 1 end end
+func h(p, q) for i := 1, 10, 2 do ret p end ret q end
+print h(1, 2)
+"""
+        )
+
+    def test_tree_shape(self):
+        ast = Parser(Lexer("""x := 2 ^ 3 ^ 2""").tokenize(), mode="pratt").parse()
+        self.assertEqual(
+            repr(ast.stmts[0].right), "BinOp('^', Integer[2], BinOp('^', Integer[3], Integer[2]))"
+        )
+
+    def test_unary_not_allowed_after_caret(self):
+        for mode in ("pratt", "stack"):
+            with self.assertRaises(SystemExit):
+                Parser(Lexer("""x := 2 ^ -3""").tokenize(), mode=mode).parse()
+
+
+class TestStackParser(unittest.TestCase):
+    def test_deeply_nested_expression(self):
+        depth = 100000
+        source = "x := " + "-(" * depth + "1" + ")" * depth + " + 1" * depth
+        ast = Parser(Lexer(source, mode="regex").tokenize(), mode="stack").parse()
+        expr = ast.stmts[0].right
+        for _ in range(depth):
+            expr = expr.left
+        self.assertIsInstance(expr, UnOp)
+
+    def test_deeply_nested_blocks(self):
+        depth = 20000
+        source = "if true then while x do " * depth + "x := 1" + " end end" * depth
+        ast = Parser(Lexer(source, mode="regex").tokenize(), mode="stack").parse()
+        stmt = ast.stmts[0]
+        for _ in range(depth - 1):
+            stmt = stmt.then_stmts.stmts[0].body_stmts.stmts[0]
+        self.assertIsInstance(stmt.then_stmts.stmts[0].body_stmts.stmts[0], Assignment)
+
+    def test_missing_end(self):
+        with self.assertRaises(SystemExit):
+            Parser(Lexer("""while x do y := 1""").tokenize(), mode="stack").parse()
+
+
+class TestSlottedNodes(unittest.TestCase):
+    def test_nodes_have_no_instance_dict(self):
+        node = Parser(Lexer("x := 1 + 2").tokenize()).parse()
+        with self.assertRaises(AttributeError):
+            node.__dict__
+
+    def test_verify_program(self):
+        for mode in ("pratt", "descent", "stack"):
+            ast = Parser(Lexer(PROGRAM).tokenize(), mode=mode).parse()
+            self.assertIs(verify_ast(ast), ast)
+
+    def test_verify_reports_malformed_tree(self):
+        one = Integer(1, 1)
+        with self.assertRaises(AssertionError):
+            verify_ast(Stmts([PrintStmt(BinOp(one, one, one, 1), "", 1)], 1))
+
+    def test_iter_child_nodes(self):
+        ast = Parser(Lexer("if x then println 1 else println 2 end").tokenize()).parse()
+        (stmt,) = iter_child_nodes(ast)
+        self.assertIsInstance(stmt, IfStmt)
+        self.assertEqual(
+            [type(child) for child in iter_child_nodes(stmt)],
+            [Identifier, Stmts, Stmts],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,1196 @@
+import contextlib
+import gc
+import io
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from lexer import *
+from parser import *
+from interpreter import *
+from machine import *
+from closures import *
+from resolver import *
+from unboxed import *
+from optimizer import *
+from memo import *
+from output import *
+from rope import *
+from profiler import *
+from governor import *
+import program
+import utils
+from batch import collect_scripts, run_batch, run_script
+import asyncio
+from scheduler import Execution, Scheduler, run_async
+import daemon
+from compiler import Compiler
+from vm import VM, UnboxedVM
+
+PROGRAMS = {
+    "fib": """
+func fib(n)
+  if n <= 1 then
+    ret n
+  end
+  ret fib(n - 1) + fib(n - 2)
+end
+for i := 0, 15 do
+  print fib(i) + " "
+end
+println ""
+""",
+    "loops": """
+x := 0
+while x < 5 do
+  x := x + 1
+  print x
+end
+println ""
+for i := 10, 1, -3 do
+  print i + ","
+end
+println ""
+for i := 1, 2, 0.5 do
+  print i + " "
+end
+println ""
+for i := 3, 3 do
+  println "once " + i
+end
+println "after loop i = " + i
+""",
+    "scopes": """
+x := 1
+local y := 2
+func counter()
+  local count := 0
+  func inc(by)
+    count := count + by
+    ret count
+  end
+  inc(1)
+  inc(2)
+  ret inc(3)
+end
+println counter()
+if x == 1 then
+  local x := 100
+  z := x + y
+  println z
+else
+  println "never"
+end
+println x
+func shadow(x)
+  x := x * 2
+  ret x
+end
+println shadow(21) + " " + x
+""",
+    "exprs": """
+println 2 * (9 + 13) + 2^2 + (((3 * 3) - 3) + 3.324) / 2.1
+println 2^3^2 - -5 % 3
+println (44 >= 2) or false and 1 > 0
+println ~(3 ~= 2) == false
+println "abc" < "abd"
+println "a" + 1 + true
+println 1 and "yes"
+println 0 or "fallback"
+println "tab\\there"
+""",
+    "early_return": """
+func find(limit)
+  i := 0
+  while true do
+    for j := 1, 100 do
+      if i * j > limit then
+        ret i + ":" + j
+      end
+    end
+    i := i + 1
+  end
+end
+println find(50)
+func noret()
+  x := 1
+end
+noret()
+""",
+}
+
+
+def run_program_ast(interpreter, ast):
+    output = io.StringIO()
+    with contextlib.redirect_stdout(output):
+        interpreter.interpret_ast(ast)
+    return output.getvalue()
+
+
+def run_program(interpreter, source):
+    return run_program_ast(interpreter, Parser(Lexer(source).tokenize()).parse())
+
+
+def run_program_or_error(interpreter, source):
+    """
+    The output up to a runtime error, and the Python exception it ended with
+    """
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output):
+            interpreter.interpret_ast(Parser(Lexer(source).tokenize()).parse())
+    except Exception as e:
+        return output.getvalue(), type(e)
+    return output.getvalue(), None
+
+
+class TestInterpreter(unittest.TestCase):
+    def test_fib(self):
+        self.assertEqual(
+            run_program(Interpreter(), PROGRAMS["fib"]),
+            "0 1 1 2 3 5 8 13 21 34 55 89 144 233 377 610 \n",
+        )
+
+    def test_handlers_are_cached_per_class(self):
+        interpreter = Interpreter()
+        run_program(interpreter, PROGRAMS["loops"])
+        self.assertEqual(
+            interpreter.handlers[WhileStmt], interpreter.interpret_WhileStmt
+        )
+        self.assertNotIn(FuncDecl, interpreter.handlers)
+
+    def test_subclass_overrides_one_node_type(self):
+        class Shouting(Interpreter):
+            def interpret_String(self, node, env):
+                return (TYPE_STRING, node.value.upper())
+
+        self.assertEqual(run_program(Shouting(), "println 'hi ' + 1"), "HI 1\n")
+
+    def test_ret_unwinds_loops_without_exceptions(self):
+        source = """
+func find(limit)
+  for i := 1, 100 do
+    while true do
+      if i == limit then
+        ret i
+      end
+      i := i + 1
+    end
+  end
+end
+println find(7)
+"""
+        for backend in (Interpreter, ClosureCompiler, ResolvedInterpreter, Machine):
+            with self.subTest(backend.__name__):
+                self.assertEqual(run_program(backend(), source), "7\n")
+
+    def test_ret_outside_a_function_ends_the_program(self):
+        for backend in (Interpreter, ClosureCompiler, ResolvedInterpreter, Machine):
+            with self.subTest(backend.__name__):
+                source = "println 1\nret 0\nprintln 2"
+                self.assertEqual(run_program(backend(), source), "1\n")
+
+    def test_numeric_for_loops(self):
+        source = """
+i := 100
+func last(n)
+  for i := 1, n do
+    i := i * 10
+  end
+  ret i
+end
+println last(3) + " " + i
+for j := 3, 1 do print j + "," end
+for j := 2, 1, -0.5 do print j + "," end
+for j := 1, 1.5, 0.25 do print j + "," end
+println ""
+"""
+        expected = "30 30\n3,2,1,2,1.5,1,1,1.25,1.5,\n"
+        for backend in (Interpreter, ClosureCompiler, UnboxedInterpreter):
+            with self.subTest(backend.__name__):
+                self.assertEqual(run_program(backend(), source), expected)
+
+    def test_call_site_caches(self):
+        interpreter = Interpreter()
+        run_program(interpreter, PROGRAMS["fib"])
+        stats = interpreter.call_cache_stats()
+        self.assertGreater(stats["hit_rate"], 0.99)
+        self.assertEqual(stats["hits"] + stats["misses"], 5150)
+
+    def test_call_site_caches_follow_redeclarations(self):
+        source = """
+func f() ret "global" end
+func g(n)
+  for k := 1, 3 do
+    print f() + " "
+    if n == 0 then
+      ret 0
+    end
+    func f() ret "inner" + n end
+    if k == 2 then
+      g(n - 1)
+    end
+  end
+end
+g(1)
+println ""
+for i := 1, 2 do
+  print f() + " "
+  func f() ret "redeclared" end
+end
+println f()
+"""
+        expected = "global inner1 global inner1 \nglobal redeclared global\n"
+        for backend in (Interpreter, ClosureCompiler, ResolvedInterpreter):
+            with self.subTest(backend.__name__):
+                self.assertEqual(run_program(backend(), source), expected)
+
+    def test_unknown_nodes_are_ignored(self):
+        self.assertIsNone(Interpreter().interpret(None, Environment()))
+
+
+class TestMachine(unittest.TestCase):
+    def test_programs(self):
+        for name, source in PROGRAMS.items():
+            with self.subTest(name):
+                expected = run_program(Interpreter(), source)
+                self.assertEqual(run_program(Machine(), source), expected)
+
+    def test_expression_value(self):
+        ast = Parser(Lexer("""x := 1""").tokenize()).parse().stmts[0].right
+        self.assertEqual(Machine().interpret(ast, Environment()), (TYPE_NUMBER, 1.0))
+
+    def test_deep_nesting(self):
+        depth = 50000
+        source = "x := " + "(" * depth + "1" + ")" * depth + " + 1" * depth
+        source += "\nprintln x"
+        tokens = Lexer(source, mode="regex").tokenize()
+        ast = Parser(tokens, mode="stack").parse()
+        self.assertEqual(run_program_ast(Machine(), ast), f"{depth + 1}\n")
+
+
+ERRORS = {
+    "undeclared": "println y",
+    "types": "x := true + 1\nx := 'a' - 1\nx := 1 < 'a'\nx := 1 == 'a'\nx := -'a'",
+    "division": "x := 1 / 0",
+    "condition": "if 1 then println 1 end",
+    "arity": "func f(a) ret a end\nx := f(1, 2)",
+}
+
+
+class TestClosureCompiler(unittest.TestCase):
+    def test_programs(self):
+        for name, source in PROGRAMS.items():
+            with self.subTest(name):
+                expected = run_program(Interpreter(), source)
+                self.assertEqual(run_program(ClosureCompiler(), source), expected)
+
+    def test_same_errors(self):
+        for name, source in ERRORS.items():
+            with self.subTest(name):
+                expected = run_program_or_error(Interpreter(), source)
+                actual = run_program_or_error(ClosureCompiler(), source)
+                self.assertEqual(actual, expected)
+
+    def test_compiles_once(self):
+        ast = Parser(Lexer(PROGRAMS["fib"]).tokenize()).parse()
+        compiler = ClosureCompiler()
+        run = compiler.compile(ast)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            run(Environment())
+            run(Environment())
+            compiler.output.flush()
+        expected = run_program(Interpreter(), PROGRAMS["fib"])
+        self.assertEqual(output.getvalue(), expected * 2)
+
+
+SCOPING = {
+    # An assignment creates the name in its own block unless it already exists
+    "created_in_block": "if true then x := 1 end\nx := 2\nprintln x",
+    "updates_outer": "x := 1\nif true then x := 2 end\nprintln x",
+    "local_shadows": "x := 1\nif true then local x := 2 println x end\nprintln x",
+    # Whether x exists further out is only known when the function is called
+    "global_declared_later": """
+func show()
+  x := 'local'
+  ret x
+end
+println show()
+x := 'global'
+println show()
+println x
+""",
+    "loop_variable_leaks": "for i := 1, 3 do end\nprintln i",
+    "loop_variable_in_function": "func f() for i := 1, 2 do end ret i end\nprintln f()",
+    "closures": """
+func outer(a)
+  func inner(b)
+    ret a + b
+  end
+  ret inner(10)
+end
+println outer(1)
+""",
+    "while_body_persists": """
+n := 0
+while n < 3 do
+  if n > 0 then
+    println last
+  end
+  local last := n
+  n := n + 1
+end
+""",
+}
+
+
+class TestResolvedInterpreter(unittest.TestCase):
+    def test_programs(self):
+        for name, source in {**PROGRAMS, **SCOPING}.items():
+            with self.subTest(name):
+                expected = run_program(Interpreter(), source)
+                self.assertEqual(run_program(ResolvedInterpreter(), source), expected)
+
+    def test_same_errors(self):
+        for name, source in ERRORS.items():
+            with self.subTest(name):
+                expected = run_program_or_error(Interpreter(), source)
+                actual = run_program_or_error(ResolvedInterpreter(), source)
+                self.assertEqual(actual, expected)
+
+    def test_single_slot_for_nested_reads(self):
+        source = "total := 0\n" + "if true then local pad := 0\n" * 10
+        source += "total := total + 1\n" + "end\n" * 10
+        ast = Resolver().resolve_program(Parser(Lexer(source).tokenize()).parse())
+        stmt = ast.stmts[1]
+        for _ in range(10):
+            stmt = stmt.then_stmts.stmts[-1]
+        self.assertIsInstance(stmt, Assignment)
+        self.assertEqual(stmt.address, ((0, 0),))
+        self.assertEqual(stmt.right.left.address, ((0, 0),))
+        self.assertIsNone(stmt.slot)
+
+    def test_empty_blocks_share_the_frame(self):
+        ast = Parser(Lexer("x := 1\nwhile x < 3 do x := x + 1 end").tokenize()).parse()
+        Resolver().resolve_program(ast)
+        self.assertEqual(ast.size, 1)
+        self.assertEqual(ast.stmts[1].body_stmts.size, 0)
+
+
+class TestUnboxedInterpreter(unittest.TestCase):
+    def test_programs(self):
+        for name, source in {**PROGRAMS, **SCOPING}.items():
+            with self.subTest(name):
+                expected = run_program(Interpreter(), source)
+                self.assertEqual(run_program(UnboxedInterpreter(), source), expected)
+
+    def test_same_error_messages(self):
+        # Interpreter stops with a Python error right after the first runtime
+        # error (it unpacks the missing value), so only that one is comparable
+        for name, source in ERRORS.items():
+            with self.subTest(name):
+                expected, _ = run_program_or_error(Interpreter(), source)
+                actual, _ = run_program_or_error(UnboxedInterpreter(), source)
+                self.assertEqual(actual.splitlines()[0], expected.splitlines()[0])
+
+    def test_values_are_unboxed(self):
+        ast = Parser(Lexer("x := 'n = ' + (1 + 2) * 3 >= 'a'").tokenize()).parse()
+        expr = ast.stmts[0].right
+        interpreter = UnboxedInterpreter()
+        self.assertIs(interpreter.interpret(expr, Environment()), True)
+        self.assertEqual(interpreter.evaluate(expr, Environment()), (TYPE_BOOL, True))
+        self.assertEqual(interpreter.interpret(expr.left.right, Environment()), 9.0)
+        self.assertEqual(unbox(box("s")), "s")
+
+    def test_unboxed_vm(self):
+        ast = Parser(Lexer("println 7 * 3 - 1\nprint 'done'").tokenize()).parse()
+        for compiler, vm in ((Compiler(), VM()), (Compiler(unboxed=True), UnboxedVM())):
+            code = compiler.compile_code(ast)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                vm.run(code)
+            self.assertEqual(output.getvalue(), "20\ndone")
+
+
+class TestOptimizer(unittest.TestCase):
+    def optimized(self, source, level=MAX_LEVEL):
+        return optimize(Parser(Lexer(source).tokenize()).parse(), level)
+
+    def test_programs(self):
+        for name, source in {**PROGRAMS, **SCOPING}.items():
+            expected = run_program(Interpreter(), source)
+            for backend in (Interpreter, ClosureCompiler, ResolvedInterpreter):
+                with self.subTest(name, backend=backend.__name__):
+                    ast = self.optimized(source)
+                    self.assertEqual(run_program_ast(backend(), ast), expected)
+
+    def test_same_errors(self):
+        for name, source in ERRORS.items():
+            with self.subTest(name):
+                expected, _ = run_program_or_error(Interpreter(), source)
+                output = io.StringIO()
+                with contextlib.redirect_stdout(output):
+                    try:
+                        Interpreter().interpret_ast(self.optimized(source))
+                    except Exception:
+                        pass
+                self.assertEqual(
+                    output.getvalue().splitlines()[0], expected.splitlines()[0]
+                )
+
+    def test_constant_folding(self):
+        ast = self.optimized("x := 2 * (3.5 + 0.5) * r\ny := -(1) < 2 and 'a' + 1")
+        self.assertEqual(repr(ast.stmts[0].right), "BinOp('*', Float[8.0], Identifier[r])")
+        self.assertEqual(repr(ast.stmts[1].right), "String[a1]")
+        # Would be a runtime error, so it stays for the program to report
+        ast = self.optimized("x := 1 / 0 + ('a' < 1)")
+        self.assertIsInstance(ast.stmts[0].right.left, BinOp)
+        self.assertIsInstance(ast.stmts[0].right.right, BinOp)
+        ast = self.optimized("x := (1 + 2)", level=0)
+        self.assertIsInstance(ast.stmts[0].right, Grouping)
+
+    def test_complex_results_are_not_folded(self):
+        source = "println (-8) ^ 0.5"
+        ast = self.optimized(source, level=1)
+        self.assertIsInstance(ast.stmts[0].value, BinOp)
+        expected = run_program(Interpreter(), source)
+        self.assertEqual(run_program_ast(Interpreter(), ast), expected)
+
+    def test_dead_code(self):
+        source = """
+if 1 > 2 then
+  println "dead"
+else
+  println "inlined"
+end
+if true then
+  local y := 1
+end
+while false do
+  println "dead"
+end
+func f()
+  ret 1
+  println "dead"
+end
+"""
+        ast = self.optimized(source)
+        stmts = ast.stmts
+        self.assertEqual(len(stmts), 3)
+        self.assertEqual(repr(stmts[0].value), "String[inlined]")
+        # A branch with names of its own keeps its scope
+        self.assertIsInstance(stmts[1], IfStmt)
+        self.assertIsNone(stmts[1].else_stmts)
+        self.assertEqual(len(stmts[2].body_stmts.stmts), 1)
+        # -O1 only folds
+        self.assertEqual(len(self.optimized(source, level=1).stmts), 4)
+
+
+class TestMemoization(unittest.TestCase):
+    def pure_names(self, source):
+        ast = Parser(Lexer(source).tokenize()).parse()
+        return sorted(decl.name for decl in find_pure_functions(ast))
+
+    def test_programs(self):
+        for name, source in {**PROGRAMS, **SCOPING}.items():
+            with self.subTest(name):
+                expected = run_program(Interpreter(), source)
+                self.assertEqual(run_program(MemoizingInterpreter(), source), expected)
+
+    def test_purity(self):
+        source = """
+func add(a, b) local c := a + b ret c end
+func twice(a) ret add(a, a) end
+func even(n) if n == 0 then ret true end ret odd(n - 1) end
+func odd(n) if n == 0 then ret false end ret even(n - 1) end
+func shout(a) println a ret a end
+func calls_shout(a) ret shout(a) end
+func reads_global(a) ret a + g end
+func stores_global(a) g := a ret a end
+func loop_global(a) for i := 1, a do end ret a end
+func nested(a) func inner() ret 1 end ret a end
+"""
+        self.assertEqual(self.pure_names(source), ["add", "even", "inner", "odd", "twice"])
+
+    def test_fib_calls_each_argument_once(self):
+        interpreter = MemoizingInterpreter()
+        source = PROGRAMS["fib"].replace("0, 15", "0, 60")
+        output = run_program(interpreter, source)
+        self.assertTrue(output.endswith(" 1548008755920 \n"))
+        self.assertEqual(interpreter.memo_stats()["fib"]["misses"], 61)
+
+    def test_bounded_cache(self):
+        interpreter = MemoizingInterpreter(maxsize=4)
+        source = "func sq(x) ret x * x end\nfor i := 1, 10 do print sq(i) + ' ' end"
+        self.assertEqual(run_program(interpreter, source), "1 4 9 16 25 36 49 64 81 100 ")
+        stats = interpreter.memo_stats()["sq"]
+        self.assertEqual((stats["size"], stats["evictions"]), (4, 6))
+
+    def test_nested_functions_share_a_cache(self):
+        interpreter = MemoizingInterpreter(maxsize=16)
+        source = """
+func outer(n)
+  func sq(x) ret x * x end
+  ret sq(n % 10)
+end
+total := 0
+for i := 1, 2000 do
+  total := total + outer(i)
+end
+println total
+"""
+        expected = run_program(Interpreter(), source)
+        self.assertEqual(run_program(interpreter, source), expected)
+        self.assertEqual(len(interpreter.caches), 1)
+        stats = interpreter.memo_stats()["sq"]
+        self.assertEqual((stats["misses"], stats["hits"]), (10, 1990))
+
+    def test_redeclared_functions(self):
+        source = """
+func add(x) ret x + 1 end
+func twice(x) ret add(add(x)) end
+print twice(1) + " "
+func add(x) ret x + 10 end
+println twice(1)
+"""
+        self.assertEqual(run_program(MemoizingInterpreter(), source), "3 21\n")
+        source = """
+func h(x) ret 1 end
+func outer()
+  func g(x) ret h(x) end
+  print g(0) + " "
+  func h(x) ret 2 end
+  println g(0)
+end
+outer()
+"""
+        self.assertEqual(run_program(MemoizingInterpreter(), source), "1 2\n")
+
+
+class TestOutput(unittest.TestCase):
+    def test_escapes_are_decoded_by_the_parser(self):
+        ast = Parser(Lexer("println 'a\\tb\\n'").tokenize()).parse()
+        self.assertEqual(ast.stmts[0].value.value, "a\tb\n")
+
+    def test_backslashes_that_escape_nothing_are_kept(self):
+        output = run_program(Interpreter(), "println 'a\\'\nprintln 'b\\x4\\t.'")
+        self.assertEqual(output, "a\\\nb\\x4\t.\n")
+        # Each literal is decoded on its own, so the backslash ending one piece
+        # stays a backslash instead of escaping the start of the next
+        output = run_program(Interpreter(), "println 'a\\' + 'n' + 'b\\' + 't'")
+        self.assertEqual(output, "a\\nb\\t\n")
+
+    def test_in_memory(self):
+        output = Output.in_memory()
+        interpreter = Interpreter(output)
+        interpreter.interpret_ast(Parser(Lexer(PROGRAMS["fib"]).tokenize()).parse())
+        self.assertEqual(output.getvalue(), run_program(Interpreter(), PROGRAMS["fib"]))
+
+    def test_flush_policies(self):
+        stream = io.StringIO()
+        output = Output(stream, FLUSH_FULL, buffer_size=8)
+        output.write("abc\n")
+        self.assertEqual(stream.getvalue(), "")
+        output.write("defgh")
+        self.assertEqual(stream.getvalue(), "abc\ndefgh")
+        output = Output(stream, FLUSH_LINE)
+        output.write("no newline")
+        output.write("\n")
+        self.assertEqual(stream.getvalue(), "abc\ndefghno newline\n")
+        with self.assertRaises(ValueError):
+            Output(stream, "sometimes")
+
+    def test_output_comes_before_errors(self):
+        output, _ = run_program_or_error(Interpreter(), "println 'first'\nprintln y")
+        self.assertTrue(output.startswith("first\n"))
+        self.assertIn("Undeclared identifier", output)
+
+    def test_vm(self):
+        output = Output.in_memory()
+        ast = Parser(Lexer("println 'a\\tb'\nprint 1 + 2").tokenize()).parse()
+        VM(output).run(Compiler().compile_code(ast))
+        self.assertEqual(output.getvalue(), "a\tb\n3")
+
+
+class TestRope(unittest.TestCase):
+    def test_long_concatenations_are_ropes(self):
+        self.assertIs(type(concat("a", 1.0)), str)
+        value = concat("x" * ROPE_THRESHOLD, "y")
+        self.assertIs(type(value), Rope)
+        self.assertEqual(len(value), ROPE_THRESHOLD + 1)
+        self.assertEqual(str(concat(value, 2.0)), "x" * ROPE_THRESHOLD + "y2")
+        self.assertEqual(concat(3.0, value), "3" + "x" * ROPE_THRESHOLD + "y")
+
+    def test_branching_appends(self):
+        base = concat("x" * ROPE_THRESHOLD, "")
+        left = concat(base, "left")
+        right = concat(base, "right")
+        self.assertEqual(str(left)[-4:], "left")
+        self.assertEqual(str(right)[-5:], "right")
+        self.assertEqual(str(base), "x" * ROPE_THRESHOLD)
+
+    def test_behaves_like_str(self):
+        rope = concat("a" * ROPE_THRESHOLD, "b")
+        text = "a" * ROPE_THRESHOLD + "b"
+        self.assertEqual(rope, text)
+        self.assertEqual(hash(rope), hash(text))
+        self.assertTrue(rope < text + "c" and text + "c" > rope)
+        self.assertEqual(stringify(rope), text)
+
+    def test_programs(self):
+        source = """
+s := ""
+for i := 1, 200 do
+  s := s + "abc" + i
+end
+t := s + "!"
+println s < t
+println s == "" + s
+println t
+"""
+        expected = run_program(UnboxedInterpreter(), source)
+        for backend in (Interpreter, ClosureCompiler, ResolvedInterpreter):
+            with self.subTest(backend.__name__):
+                self.assertEqual(run_program(backend(), source), expected)
+
+
+class TestProfiler(unittest.TestCase):
+    SOURCE = """
+func inner(n)
+  ret n * 2
+end
+func outer(n)
+  total := 0
+  for i := 1, n do
+    total := total + inner(i)
+  end
+  ret total
+end
+println outer(10)
+"""
+
+    def test_same_output(self):
+        for name, source in PROGRAMS.items():
+            with self.subTest(name):
+                expected = run_program(Interpreter(), source)
+                self.assertEqual(run_program(ProfilingInterpreter(), source), expected)
+
+    def test_counts(self):
+        interpreter = ProfilingInterpreter()
+        self.assertEqual(run_program(interpreter, self.SOURCE), "110\n")
+        profile = interpreter.profile
+        self.assertEqual(profile.functions["inner"].calls, 10)
+        self.assertEqual(profile.functions["outer"].calls, 1)
+        self.assertEqual(profile.line_hits[3], 10)
+        self.assertEqual(profile.line_hits[8], 10)
+        outer = profile.functions["outer"]
+        self.assertLessEqual(outer.self_time, outer.cumulative)
+        self.assertEqual(profile.call_cache["hits"] + profile.call_cache["misses"], 11)
+
+    def test_recursive_cumulative_time_counts_once(self):
+        interpreter = ProfilingInterpreter()
+        run_program(interpreter, PROGRAMS["fib"])
+        fib = interpreter.profile.functions["fib"]
+        self.assertAlmostEqual(fib.cumulative, fib.self_time, delta=fib.self_time * 0.5)
+
+    def test_reports(self):
+        interpreter = ProfilingInterpreter()
+        run_program(interpreter, self.SOURCE)
+        profile = interpreter.profile
+        stacks = [line.rsplit(" ", 1)[0] for line in profile.collapsed().splitlines()]
+        self.assertEqual(stacks, ["<main>", "<main>;outer", "<main>;outer;inner"])
+        data = profile.to_json()
+        self.assertEqual(data["functions"]["inner"]["calls"], 10)
+        self.assertEqual(data["lines"]["3"], 10)
+        self.assertIn("inner", profile.report())
+
+    def test_plain_interpreter_is_not_wrapped(self):
+        interpreter = Interpreter()
+        run_program(interpreter, self.SOURCE)
+        self.assertEqual(interpreter.handlers[RetStmt], interpreter.interpret_RetStmt)
+
+    def test_vm(self):
+        ast = Parser(Lexer("println 2 * 3 + 1").tokenize()).parse()
+        vm = ProfilingVM(Output.in_memory())
+        vm.run(Compiler().compile_code(ast))
+        self.assertEqual(vm.output.getvalue(), "7\n")
+        self.assertEqual(vm.to_json()["opcodes"]["PUSH"]["count"], 3)
+
+
+
+class TestGovernor(unittest.TestCase):
+    def run_governed(self, source, **limits):
+        governor = Governor(**limits)
+        output, error = run_program_or_error(GovernedInterpreter(governor), source)
+        return output, error, governor
+
+    def test_same_output(self):
+        for name, source in PROGRAMS.items():
+            with self.subTest(name):
+                expected = run_program(Interpreter(), source)
+                governor = Governor(fuel=10**9, seconds=600, memory=2**40)
+                self.assertEqual(
+                    run_program(GovernedInterpreter(governor), source), expected
+                )
+
+    def test_fuel(self):
+        # One step for the program's block and one per loop iteration
+        source = "for i := 1, 10 do\n  println i\nend\n"
+        output, error, governor = self.run_governed(source, fuel=4)
+        self.assertEqual(output, "1\n2\n3\n")
+        self.assertIs(error, FuelExhausted)
+        self.assertEqual(governor.used_steps(), 4)
+        output, error, governor = self.run_governed(source, fuel=11)
+        self.assertIsNone(error)
+        self.assertEqual(governor.used_steps(), 11)
+
+    def test_fuel_spans_checkpoints(self):
+        output, error, governor = self.run_governed(
+            "while true do end", fuel=5000, check_every=64
+        )
+        self.assertIs(error, FuelExhausted)
+        self.assertEqual(governor.used_steps(), 5000)
+
+    def test_fuel_for_calls(self):
+        output, error, governor = self.run_governed(
+            "func f(n)\n  ret f(n + 1)\nend\nprintln f(0)\n", fuel=100
+        )
+        self.assertIs(error, FuelExhausted)
+
+    def test_deadline(self):
+        output, error, governor = self.run_governed("while true do end", seconds=0.05)
+        self.assertIs(error, DeadlineExceeded)
+
+    def test_memory(self):
+        if resident_bytes() is None:
+            self.skipTest("no resident set size on this platform")
+        output, error, governor = self.run_governed(
+            "s := 'ab'\nwhile true do\n  s := s + s\nend\n", memory=32 * 1024**2
+        )
+        self.assertIs(error, MemoryLimitExceeded)
+
+    def test_memory_unknown_during_run(self):
+        # Known for the baseline (read by the constructor and again when the
+        # run starts), then unreadable: the checks are skipped
+        sizes = iter([1024**2, 1024**2])
+        with mock.patch("governor.resident_bytes", lambda: next(sizes, None)):
+            output, error, governor = self.run_governed(
+                "while true do end", fuel=500, memory=1, check_every=16
+            )
+        self.assertIsNotNone(governor.baseline)
+        self.assertIs(error, FuelExhausted)
+
+    def test_limit_errors_are_catchable(self):
+        governor = Governor(fuel=10)
+        ast = Parser(Lexer("while true do println 1 end").tokenize()).parse()
+        interpreter = GovernedInterpreter(governor, Output.in_memory())
+        with self.assertRaises(LimitExceeded):
+            interpreter.interpret_ast(ast)
+        # Flushed on the way out, and the governor refills for the next run
+        self.assertEqual(interpreter.output.getvalue(), "1\n" * 9)
+        with self.assertRaises(FuelExhausted):
+            interpreter.interpret_ast(ast)
+        self.assertEqual(governor.used_steps(), 10)
+
+    def test_vm(self):
+        code = Compiler().compile_code(
+            Parser(Lexer("println 1\nprintln 2\n").tokenize()).parse()
+        )
+        vm = GovernedVM(Governor(fuel=4), Output.in_memory())
+        with self.assertRaises(FuelExhausted):
+            vm.run(code)
+        self.assertEqual(vm.output.getvalue(), "1\n")
+        vm = GovernedVM(Governor(fuel=100), Output.in_memory())
+        vm.run(code)
+        self.assertEqual(vm.output.getvalue(), "1\n2\n")
+
+
+class TestProgram(unittest.TestCase):
+    RULE = """
+func rate(country)
+  if country == "NL" then
+    ret 0.25
+  end
+  ret 0.5
+end
+println country
+ret total * rate(country)
+"""
+
+    def test_run_many(self):
+        rule = program.compile(self.RULE)
+        self.assertEqual(
+            rule.run_to_string({"total": 100, "country": "NL"}), (25.0, "NL\n")
+        )
+        self.assertEqual(
+            rule.run_to_string({"total": 10, "country": "DE"}), (5.0, "DE\n")
+        )
+
+    def test_same_output(self):
+        for name, source in PROGRAMS.items():
+            with self.subTest(name):
+                expected = run_program(Interpreter(), source)
+                compiled = program.compile(source)
+                self.assertEqual(compiled.run_to_string(), (None, expected))
+                self.assertEqual(compiled.run_to_string(), (None, expected))
+
+    def test_runs_do_not_share_globals(self):
+        counter = program.compile("if n == 0 then x := 1 end\nret x")
+        self.assertEqual(counter.run({"n": 0, "x": 5}), 1.0)
+        self.assertEqual(counter.run({"n": 1, "x": 5}), 5.0)
+
+    def test_values(self):
+        identity = program.compile("ret value")
+        for value in (1.5, "text", True, False):
+            self.assertEqual(identity.run({"value": value}), value)
+        self.assertEqual(identity.run({"value": 3}), 3.0)
+        self.assertIs(program.compile("println 1").run_to_string()[0], None)
+        long_string = program.compile("ret s + s")
+        self.assertEqual(long_string.run({"s": "x" * 300}), "x" * 600)
+        with self.assertRaises(TypeError):
+            identity.run({"value": [1]})
+
+    def test_output(self):
+        output = Output.in_memory()
+        rule = program.compile(b"println 'a' + x")
+        rule.run({"x": "b"}, output)
+        rule.run({"x": "c"}, output)
+        self.assertEqual(output.getvalue(), "ab\nac\n")
+
+    def test_immutable(self):
+        rule = program.compile("ret 1 + 2", optimize=1)
+        with self.assertRaises(AttributeError):
+            rule.ast = None
+        self.assertIsInstance(rule.ast.stmts[0].value, Float)
+        self.assertEqual(rule.run(), 3.0)
+
+    def test_threads(self):
+        # Every run declares its own functions and calls them in a loop, so
+        # runs that shared call-site caches or epochs would call each other's
+        rule = program.compile(
+            """
+func scale(x) ret x * n end
+total := 0
+for i := 1, 200 do
+  total := total + scale(i)
+  func scale(x) ret x * n * 2 end
+end
+ret total
+"""
+        )
+        expected = {n: n * (1 + 2 * sum(range(2, 201))) for n in range(8)}
+        results = {}
+
+        def run(n):
+            for _ in range(20):
+                result = rule.run({"n": n})
+                if result != expected[n]:
+                    results[n] = result
+                    return
+            results[n] = result
+
+        # Switch threads often, so runs interleave inside the loop
+        self.addCleanup(sys.setswitchinterval, sys.getswitchinterval())
+        sys.setswitchinterval(1e-5)
+        threads = [threading.Thread(target=run, args=(n,)) for n in expected]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, expected)
+        # Nothing of the last run is left behind for the Program to keep alive
+        rule.run({"n": 1})
+        self.assertEqual(program.local.interpreter.call_caches, {})
+
+    def test_backends_take_an_env(self):
+        rule = program.compile(self.RULE)
+        backends = (
+            Interpreter,
+            Machine,
+            ClosureCompiler,
+            ResolvedInterpreter,
+            UnboxedInterpreter,
+            MemoizingInterpreter,
+            ProfilingInterpreter,
+        )
+        for backend in backends:
+            with self.subTest(backend.__name__):
+                env = rule.new_env({"total": 100, "country": "NL"})
+                interpreter = backend(Output.in_memory())
+                result = interpreter.interpret_ast(rule.ast, env)
+                self.assertEqual(result, (TYPE_NUMBER, 25.0))
+
+    def test_governor(self):
+        spin = program.compile("while true do end")
+        with self.assertRaises(FuelExhausted):
+            spin.run(governor=Governor(fuel=100))
+
+
+class TestBatch(unittest.TestCase):
+    SCRIPTS = {
+        "ok.pinky": "println 'hello'\n",
+        "syntax.pinky": "println 1\nprintln (\n",
+        "sub/fib.pinky": PROGRAMS["fib"],
+        "sub/spin.pinky": "while true do end\n",
+    }
+
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.directory = self.tempdir.name
+        os.mkdir(os.path.join(self.directory, "sub"))
+        for name, source in self.SCRIPTS.items():
+            with open(os.path.join(self.directory, name), "w") as file:
+                file.write(source)
+        with open(os.path.join(self.directory, "notes.txt"), "w") as file:
+            file.write("not a script\n")
+
+    def tearDown(self):
+        self.tempdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def test_collect_scripts(self):
+        self.assertEqual(
+            collect_scripts(self.directory),
+            [self.path(name) for name in sorted(self.SCRIPTS)],
+        )
+        listing = self.path("scripts.txt")
+        with open(listing, "w") as file:
+            file.write("# two of them\nok.pinky\n\nsub/fib.pinky\n")
+        self.assertEqual(
+            collect_scripts(listing), [self.path("ok.pinky"), self.path("sub/fib.pinky")]
+        )
+        self.assertEqual(collect_scripts(self.path("ok.pinky")), [self.path("ok.pinky")])
+
+    def test_run_script(self):
+        result = run_script(self.path("ok.pinky"))
+        self.assertEqual((result["exit_code"], result["output"]), (0, "hello\n"))
+        self.assertIsNone(result["error"])
+        result = run_script(self.path("syntax.pinky"))
+        self.assertEqual(result["exit_code"], 1)
+        self.assertIn("[Line 2]", result["output"])
+        result = run_script(self.path("sub/spin.pinky"), limits={"fuel": 1000})
+        self.assertEqual(result["exit_code"], 1)
+        self.assertIn("fuel", result["error"])
+        with open(self.path("error.pinky"), "w") as file:
+            file.write("println 'before'\nprintln 1 + y\n")
+        result = run_script(self.path("error.pinky"))
+        self.assertEqual(result["exit_code"], 1)
+        self.assertEqual(result["error"], "[Line 2]: Undeclared identifier 'y'")
+        self.assertTrue(result["output"].startswith("before\n"))
+
+    def test_first_runtime_error(self):
+        # The operators around a failed one report errors of their own
+        utils.last_runtime_error = None
+        output, _ = run_program_or_error(
+            UnboxedInterpreter(), "println ('a' + (true ~= 'a')) - 1"
+        )
+        self.assertEqual(output.count("Unsupported operator"), 2)
+        self.assertEqual(
+            utils.last_runtime_error,
+            "[Line 1]: Unsupported operator '~=' between TYPE_BOOL and TYPE_STRING.",
+        )
+
+    def test_run_batch(self):
+        scripts = collect_scripts(self.directory)
+        report = run_batch(scripts, jobs=2, limits={"fuel": 10_000})
+        self.assertEqual((report["total"], report["passed"], report["failed"]), (4, 2, 2))
+        self.assertEqual([result["script"] for result in report["scripts"]], scripts)
+        fib = report["scripts"][scripts.index(self.path("sub/fib.pinky"))]
+        self.assertEqual(fib["output"], run_program(Interpreter(), PROGRAMS["fib"]))
+        self.assertGreater(fib["seconds"], 0)
+
+
+class TestScheduler(unittest.TestCase):
+    COUNT = """
+i := 0
+while i < n do
+  i := i + 1
+  print i
+end
+ret i
+"""
+
+    def test_execution_resumes(self):
+        for name, source in PROGRAMS.items():
+            with self.subTest(name):
+                expected = run_program(Interpreter(), source)
+                output = Output.in_memory()
+                execution = Execution(program.compile(source), output=output)
+                steps = 0
+                while not execution.step(7):
+                    steps += 1
+                self.assertGreater(steps, 1)
+                self.assertEqual(output.getvalue(), expected)
+
+    def test_run_async(self):
+        output = Output.in_memory()
+        result = asyncio.run(
+            run_async(program.compile(self.COUNT), {"n": 5}, output, quantum=3)
+        )
+        self.assertEqual((result, output.getvalue()), (5.0, "12345"))
+
+    def test_scheduler_interleaves(self):
+        compiled = program.compile(self.COUNT)
+        shared = Output.in_memory()
+
+        finished = []
+
+        async def main():
+            scheduler = Scheduler(quantum=20)
+            futures = [
+                scheduler.submit(compiled, {"n": 3}, shared),
+                scheduler.submit(compiled, {"n": 50}, Output.in_memory()),
+                scheduler.submit(compiled, {"n": 3}, shared),
+            ]
+            for index, future in enumerate(futures):
+                future.add_done_callback(lambda _, index=index: finished.append(index))
+            return await asyncio.gather(*futures)
+
+        self.assertEqual(asyncio.run(main()), [3.0, 50.0, 3.0])
+        # The short scripts took turns with each other (and the long one), and
+        # did not have to wait for the long one to finish
+        self.assertEqual(shared.getvalue(), "112233")
+        self.assertEqual(finished, [0, 2, 1])
+
+    def test_scheduler_many(self):
+        compiled = program.compile("ret n * 2")
+
+        async def main():
+            scheduler = Scheduler()
+            return await asyncio.gather(
+                *(
+                    scheduler.submit(compiled, {"n": n}, Output.in_memory())
+                    for n in range(1000)
+                )
+            )
+
+        self.assertEqual(asyncio.run(main()), [n * 2.0 for n in range(1000)])
+
+    def test_scheduler_errors(self):
+        async def main():
+            scheduler = Scheduler()
+            with self.assertRaises(TypeError):
+                await scheduler.submit(
+                    program.compile("println x"), output=Output.in_memory()
+                )
+            return await scheduler.submit(program.compile("ret 1"))
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.assertEqual(asyncio.run(main()), 1.0)
+
+
+class TestDaemon(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.directory = self.tempdir.name
+        self.socket = os.path.join(self.directory, "pinky.sock")
+        self.server = subprocess.Popen(
+            [sys.executable, "daemon.py", "--serve"],
+            env={**os.environ, daemon.SOCKET_ENV: self.socket},
+            stdout=subprocess.DEVNULL,
+        )
+        while not os.path.exists(self.socket):
+            self.assertIsNone(self.server.poll())
+            time.sleep(0.01)
+
+    def tearDown(self):
+        self.server.terminate()
+        self.server.wait()
+        self.tempdir.cleanup()
+
+    def run_script(self, source, *options, path=None):
+        script = os.path.join(self.directory, "script.pinky")
+        with open(script, "w") as file:
+            file.write(source)
+        with tempfile.TemporaryFile("w+") as out, tempfile.TemporaryFile("w+") as err:
+            fds = (0, out.fileno(), err.fileno())
+            argv = ["script.pinky", *options]
+            path = path or self.socket
+            code = daemon.request(argv, path, fds, self.directory)
+            out.seek(0)
+            err.seek(0)
+            return code, out.read(), err.read()
+
+    def test_runs_scripts(self):
+        code, out, err = self.run_script("println 6 * 7\n", "--no-verbose")
+        self.assertEqual(code, 0)
+        self.assertTrue(out.startswith("42\n"))
+        # A fresh worker for every request
+        code, out, err = self.run_script("println 'again'\n", "--no-verbose")
+        self.assertEqual(code, 0)
+        self.assertTrue(out.startswith("again\n"))
+
+    def test_exit_codes(self):
+        code, out, err = self.run_script("while true do end\n", "--max-steps", "10")
+        self.assertEqual(code, 1)
+        code, out, err = self.run_script("println 1\n", "--bogus")
+        self.assertEqual(code, 2)
+        self.assertIn("pinky.py: error", err)
+
+    def test_shutdown(self):
+        self.server.terminate()
+        self.server.wait()
+        self.assertFalse(os.path.exists(self.socket))
+
+    def test_worker(self):
+        # One worker forked from this process, with no server around it
+        daemon.preload(self.directory)
+        self.addCleanup(gc.unfreeze)
+        path = os.path.join(self.directory, "worker.sock")
+        pids = set()
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            server.bind(path)
+            server.listen()
+            daemon.spawn(server, pids)
+            source = "println 'forked'\n"
+            code, out, err = self.run_script(source, "--no-verbose", path=path)
+        self.assertEqual(code, 0)
+        self.assertTrue(out.startswith("forked\n"))
+        (pid,) = pids
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+    def test_only_replaces_its_own_socket(self):
+        path = os.path.join(self.directory, "not-a-socket")
+        with open(path, "w") as file:
+            file.write("keep me")
+        with self.assertRaises(FileExistsError):
+            daemon.serve(path)
+        with open(path) as file:
+            self.assertEqual(file.read(), "keep me")
+
+    @unittest.skipUnless(os.getuid() == 0, "needs to listen as another user")
+    def test_refuses_other_users(self):
+        os.chmod(self.directory, 0o711)
+        shared = os.path.join(self.directory, "shared")
+        os.mkdir(shared)
+        os.chmod(shared, 0o777)
+        path = os.path.join(shared, "pinky.sock")
+        ready, ready_writer = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.setuid(65534)  # nobody
+                listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                listener.bind(path)
+                listener.listen()
+                os.write(ready_writer, b".")
+                conn, _ = listener.accept()
+                conn.recv(1)  # until the client hangs up
+            finally:
+                os._exit(0)
+        os.read(ready, 1)
+        with self.assertRaises(PermissionError):
+            daemon.request(["script.pinky"], path)
+        os.waitpid(pid, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
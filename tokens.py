@@ -2,10 +2,16 @@
 # Constants for different token types
 ###############################################################################
 # Single-char tokens
+from array import array
 from enum import Enum
 
 
 class TokenType(Enum):
+    # Members are singletons compared by identity, so hash them by identity too.
+    # Enum's default __hash__ is a Python-level method, and token types are used
+    # as dict keys on every token in the lexer and parser tables.
+    __hash__ = object.__hash__
+
     # Single-char tokens
     LPAREN = "("
     RPAREN = ")"
@@ -86,10 +92,93 @@ keywords = {
 
 
 class Token:
+    __slots__ = ("token_type", "lexeme", "line")
+
     def __init__(self, token_type, lexeme, line):
         self.token_type = token_type
         self.lexeme = lexeme
         self.line = line
 
+    def __reduce__(self):
+        # Pickle as a constructor call, which is smaller and faster to load
+        return (Token, (self.token_type, self.lexeme, self.line))
+
     def __repr__(self):
         return f"({self.token_type}, {self.lexeme!r}, {self.line})"
+
+
+###############################################################################
+# Compact token storage
+###############################################################################
+# Small-int codes for the token types, so a token kind fits in one byte
+TOKEN_TYPES = list(TokenType)
+TOKEN_CODES = {token_type: code for code, token_type in enumerate(TOKEN_TYPES)}
+
+# Keywords and operators always have the same lexeme, so we can hand out a shared
+# string instead of slicing a new one out of the source
+FIXED_LEXEMES = {token_type: text for text, token_type in keywords.items()}
+FIXED_LEXEMES.update(
+    {
+        token_type: token_type.value
+        for token_type in TokenType
+        if not token_type.value.isalpha()
+    }
+)
+
+
+class TokenBuffer:
+    """
+    A struct-of-arrays token store: token kinds, start/end offsets and lines are
+    kept in parallel typed arrays (13 bytes per token) instead of Token objects.
+    Lexemes are not copied out of the source; a Token is only built when the
+    parser asks for it (by index or by iterating over the buffer).
+    """
+
+    __slots__ = ("source", "kinds", "starts", "ends", "lines")
+
+    def __init__(self, source):
+        offset_type = "I" if len(source) < 2**32 else "Q"
+        self.source = source
+        self.kinds = array("B")
+        self.starts = array(offset_type)
+        self.ends = array(offset_type)
+        self.lines = array("I")
+
+    def append(self, token_type, start, end, line):
+        self.kinds.append(TOKEN_CODES[token_type])
+        self.starts.append(start)
+        self.ends.append(end)
+        self.lines.append(line)
+
+    def token_type(self, index):
+        return TOKEN_TYPES[self.kinds[index]]
+
+    def lexeme(self, index):
+        token_type = TOKEN_TYPES[self.kinds[index]]
+        text = FIXED_LEXEMES.get(token_type)
+        if text is None:
+            text = self.source[self.starts[index] : self.ends[index]]
+        return text
+
+    def line(self, index):
+        return self.lines[index]
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, index):
+        return Token(self.token_type(index), self.lexeme(index), self.lines[index])
+
+    def __iter__(self):
+        source = self.source
+        fixed_lexemes = FIXED_LEXEMES
+        columns = zip(self.kinds, self.starts, self.ends, self.lines)
+        for code, start, end, line in columns:
+            token_type = TOKEN_TYPES[code]
+            text = fixed_lexemes.get(token_type)
+            if text is None:
+                text = source[start:end]
+            yield Token(token_type, text, line)
+
+    def __repr__(self):
+        return f"TokenBuffer({len(self)} tokens)"
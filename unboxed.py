@@ -0,0 +1,199 @@
+"""
+Unboxed runtime values.
+
+Interpreter represents every value as a (TYPE_*, value) tuple, so each
+arithmetic operation unpacks two tuples, compares type tag strings and allocates
+a new tuple. UnboxedInterpreter uses the Python value on its own instead: a
+float for numbers, a str for strings and a bool for booleans. A Pinky type is
+then just the Python type, checked with `type(x) is float` where an operator
+needs it, and the tags only come back in error messages and at the boundaries
+(box() and unbox()).
+"""
+
+from interpreter import *
+
+# Python type of an unboxed value -> Pinky type tag
+TYPE_OF = {float: TYPE_NUMBER, str: TYPE_STRING, bool: TYPE_BOOL}
+
+
+def type_name(value):
+    return TYPE_OF.get(type(value))
+
+
+def box(value):
+    """
+    Unboxed value -> (TYPE_*, value), for code that expects the tuple form
+    """
+    if value is None:
+        return None
+    return (TYPE_OF[type(value)], value)
+
+
+def unbox(value):
+    if value is None:
+        return None
+    return value[1]
+
+
+class UnboxedInterpreter(Interpreter):
+    """
+    Interpreter with unboxed values. Statements, scopes and calls are inherited;
+    the expression handlers below mirror Interpreter's, including the error
+    messages.
+    """
+
+    def interpret_ast(self, node, env=None):
+        # Callers deal in boxed values, as with Interpreter: the globals they
+        # bring in and the value of a top-level ret
+        if env is not None:
+            boxed, env = env, Environment()
+            env.vars = {name: unbox(value) for name, value in boxed.vars.items()}
+        return box(super().interpret_ast(node, env))
+
+    def evaluate(self, node, env):
+        """
+        Evaluate an expression and box the result, like Interpreter.interpret
+        """
+        return box(self.interpret(node, env))
+
+    def interpret_Integer(self, node, env):
+        return float(node.value)
+
+    def interpret_Float(self, node, env):
+        return float(node.value)
+
+    def interpret_String(self, node, env):
+        return str(node.value)
+
+    def interpret_Bool(self, node, env):
+        return node.value
+
+    def interpret_Identifier(self, node, env):
+        value = env.get_var(node.name)
+        if value is None:
+            runtime_error(f"Undeclared identifier {node.name!r}", node.line)
+        return value
+
+    def interpret_Assignment(self, node, env):
+        env.set_var(node.left.name, self.interpret(node.right, env))
+
+    def interpret_LocalAssignment(self, node, env):
+        env.set_local_var(node.left.name, self.interpret(node.right, env))
+
+    def interpret_LogicalOp(self, node, env):
+        left = self.interpret(node.left, env)
+        if node.op.token_type == TokenType.OR:
+            if left:
+                return left
+        elif node.op.token_type == TokenType.AND:
+            if not left:
+                return left
+        return self.interpret(node.right, env)
+
+    def interpret_PrintStmt(self, node, env):
+        self.output.write(stringify(self.interpret(node.value, env)) + node.end)
+
+    def interpret_IfStmt(self, node, env):
+        test = self.interpret(node.test, env)
+        if type(test) is not bool:
+            runtime_error("Condition test is not a boolean expression.", node.line)
+        if test:
+            return self.interpret(node.then_stmts, env.new_env())
+        else:
+            return self.interpret(node.else_stmts, env.new_env())
+
+    def interpret_WhileStmt(self, node, env):
+        new_env = env.new_env()
+        while True:
+            test = self.interpret(node.test, env)
+            if type(test) is not bool:
+                runtime_error(f"While test is not a boolean expression.", node.line)
+            if not test:
+                break
+            signal = self.interpret(node.body_stmts, new_env)
+            if signal is not None:
+                return signal
+
+    def interpret_ForStmt(self, node, env):
+        varname = node.ident.name
+        i = self.interpret(node.start, env)
+        end = self.interpret(node.end, env)
+        block_new_env = env.new_env()
+        if i < end:
+            step = 1 if node.step is None else self.interpret(node.step, env)
+            while i <= end:
+                env.set_var(varname, i)
+                signal = self.interpret(node.body_stmts, block_new_env)
+                if signal is not None:
+                    return signal
+                i = i + step
+        else:
+            step = -1 if node.step is None else self.interpret(node.step, env)
+            while i >= end:
+                env.set_var(varname, i)
+                signal = self.interpret(node.body_stmts, block_new_env)
+                if signal is not None:
+                    return signal
+                i = i + step
+
+    def binop(self, node, left, right):
+        token_type = node.op.token_type
+        lefttype = type(left)
+        righttype = type(right)
+        if token_type == TokenType.PLUS:
+            if lefttype is float and righttype is float:
+                return left + right
+            elif lefttype is str or righttype is str:
+                return stringify(left) + stringify(right)
+        elif token_type == TokenType.MINUS:
+            if lefttype is float and righttype is float:
+                return left - right
+        elif token_type == TokenType.STAR:
+            if lefttype is float and righttype is float:
+                return left * right
+        elif token_type == TokenType.SLASH:
+            if right == 0:
+                runtime_error(f"Division by zero.", node.line)
+            if lefttype is float and righttype is float:
+                return left / right
+        elif token_type == TokenType.MOD:
+            if lefttype is float and righttype is float:
+                return left % right
+        elif token_type == TokenType.CARET:
+            if lefttype is float and righttype is float:
+                return left**right
+        elif token_type in (TokenType.GT, TokenType.GE, TokenType.LT, TokenType.LE):
+            if lefttype is righttype and (lefttype is float or lefttype is str):
+                if token_type == TokenType.GT:
+                    return left > right
+                elif token_type == TokenType.GE:
+                    return left >= right
+                elif token_type == TokenType.LT:
+                    return left < right
+                return left <= right
+        elif token_type == TokenType.EQEQ or token_type == TokenType.NE:
+            if lefttype is righttype and lefttype in TYPE_OF:
+                if token_type == TokenType.EQEQ:
+                    return left == right
+                return left != right
+        else:
+            return None
+        runtime_error(
+            f"Unsupported operator {node.op.lexeme!r} between {type_name(left)} and {type_name(right)}.",
+            node.op.line,
+        )
+
+    def unop(self, node, operand):
+        token_type = node.op.token_type
+        if token_type == TokenType.MINUS or token_type == TokenType.PLUS:
+            if type(operand) is float:
+                return -operand if token_type == TokenType.MINUS else operand
+        elif token_type == TokenType.NOT:
+            if type(operand) is bool:
+                return not operand
+        else:
+            return None
+        runtime_error(
+            f"Unsupported operator {node.op.lexeme!r} with {type_name(operand)}.",
+            node.op.line,
+        )
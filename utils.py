@@ -1,3 +1,6 @@
+import codecs
+import re
+from output import flush_all
 from model import (
     Assignment,
     BinOp,
@@ -275,14 +278,48 @@ def lexing_error(message, line_num):
     sys.exit(1)
 
 
+# The first error runtime_error() reported since it was last reset to None, for
+# code that reports runs as data rather than text (see batch.py). The errors
+# after it tend to be about the None values the first one left behind.
+last_runtime_error = None
+
+
 def runtime_error(message, line_num):
+    global last_runtime_error
+    if last_runtime_error is None:
+        last_runtime_error = f"[Line {line_num}]: {message}"
+    flush_all()  # the program's output so far comes first
     print(f"{Colors.RED}[Line {line_num}]: {message}{Colors.WHITE}")
 
 
 def vm_error(message, pc):
+    flush_all()
     print(f"{Colors.RED}[PC {pc}]: {message}{Colors.WHITE}")
 
 
+# A backslash and what it may escape; decode_escapes() keeps the ones that turn
+# out not to be escape sequences (a trailing \, \x4, ...) as they are
+ESCAPE = re.compile(r"\\(?:x[0-9a-fA-F]{2}|[0-7]{1,3}|.)?", re.DOTALL)
+
+
+def decode_escapes(text):
+    """
+    Turn the escape sequences in a string literal (\\n, \\t, ...) into the
+    characters they stand for
+    """
+    try:
+        return codecs.escape_decode(bytes(text, "utf-8"))[0].decode("utf-8")
+    except ValueError:
+        return ESCAPE.sub(decode_escape, text)
+
+
+def decode_escape(match):
+    try:
+        return codecs.escape_decode(bytes(match[0], "utf-8"))[0].decode("utf-8")
+    except ValueError:
+        return match[0]
+
+
 def stringify(val):
     if isinstance(val, bool):
         return "true" if val == True else False
@@ -1,23 +1,28 @@
-import codecs
 from interpreter import TYPE_NUMBER
+from output import Output
+from unboxed import type_name
 from utils import stringify, vm_error
 
 
 class VM:
-    def __init__(self):
+    def __init__(self, output=None):
         self.stack = []
         self.pc = 0  # program counter
         self.sp = 0  # stack pointer
+        self.output = Output() if output is None else output
 
     def run(self, instructions):
         self.pc = 0
         self.sp - 0
         self.is_running = True
 
-        while self.is_running:
-            opcode, *args = instructions[self.pc]
-            self.pc = self.pc + 1
-            getattr(self, opcode)(*args)
+        try:
+            while self.is_running:
+                opcode, *args = instructions[self.pc]
+                self.pc = self.pc + 1
+                getattr(self, opcode)(*args)
+        finally:
+            self.output.flush()
 
     def HALT(self):
         self.is_running = False
@@ -68,17 +73,66 @@ class VM:
 
     def PRINTLN(self):
         _, val = self.POP()
-        print(
-            codecs.escape_decode(bytes(stringify(val), "utf-8"))[0].decode("utf-8"),
-            end="\n",
-        )
+        self.output.write(stringify(val) + "\n")
 
     def PRINT(self):
         _, val = self.POP()
-        print(
-            codecs.escape_decode(bytes(stringify(val), "utf-8"))[0].decode("utf-8"),
-            end="",
-        )
+        self.output.write(stringify(val))
 
     def LABEL(self, name):
         pass
+
+
+class UnboxedVM(VM):
+    """
+    Runs code from Compiler(unboxed=True), where the stack holds plain floats,
+    strings and bools instead of (TYPE_*, value) tuples
+    """
+
+    def ADD(self):
+        right_val = self.POP()
+        left_val = self.POP()
+        self.sp -= 2
+        if type(left_val) is float and type(right_val) is float:
+            self.stack.append(right_val + left_val)
+        else:
+            self.type_error("ADD", left_val, right_val)
+
+    def SUB(self):
+        right_val = self.POP()
+        left_val = self.POP()
+        self.sp -= 2
+        if type(left_val) is float and type(right_val) is float:
+            self.stack.append(left_val - right_val)
+        else:
+            self.type_error("SUB", left_val, right_val)
+
+    def MUL(self):
+        right_val = self.POP()
+        left_val = self.POP()
+        self.sp -= 2
+        if type(left_val) is float and type(right_val) is float:
+            self.stack.append(left_val * right_val)
+        else:
+            self.type_error("MUL", left_val, right_val)
+
+    def DIV(self):
+        right_val = self.POP()
+        left_val = self.POP()
+        self.sp -= 2
+        if type(left_val) is float and type(right_val) is float:
+            self.stack.append(right_val / left_val)
+        else:
+            self.type_error("DIV", left_val, right_val)
+
+    def PRINTLN(self):
+        self.output.write(stringify(self.POP()) + "\n")
+
+    def PRINT(self):
+        self.output.write(stringify(self.POP()))
+
+    def type_error(self, opcode, left_val, right_val):
+        vm_error(
+            f"Error on {opcode} between {type_name(left_val)} and {type_name(right_val)}",
+            self.pc,
+        )